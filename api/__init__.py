@@ -1,10 +1,11 @@
 """Инициализирующий файл для подключения всех роутеров"""
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
 
 from api.routers import user_router
 from api.routers import transaction_router
+from api.routers.settings import verify_api_key
 
-app = APIRouter(prefix="/api/v1")
+app = APIRouter(prefix="/api/v1", dependencies=[Depends(verify_api_key)])
 app.include_router(user_router)
 app.include_router(transaction_router)
@@ -0,0 +1,82 @@
+"""Разбор NDJSON/CSV с записями для массовой загрузки.
+
+Записи читаются построчно по мере поступления и сразу проверяются
+схемой, поэтому вход не держится в памяти целиком. Одна строка - одна
+запись; у CSV первая строка - заголовок с именами полей.
+"""
+
+import csv
+from typing import AsyncIterable, AsyncIterator
+
+from pydantic import BaseModel, ValidationError
+
+from api.schemas import FileFormat
+
+
+class RecordError(ValueError):
+    """Некорректная запись; line - номер строки входных данных"""
+
+    def __init__(self, line: int, errors: list[dict]):
+        super().__init__(f"Line {line}: {errors}")
+        self.line = line
+        self.errors = errors
+
+
+async def split_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+    """Строки из потока кусков произвольной длины"""
+    tail = b""
+    async for chunk in chunks:
+        lines = (tail + chunk).split(b"\n")
+        tail = lines.pop()
+        for line in lines:
+            yield line
+    if tail:
+        yield tail
+
+
+async def read_batches(
+    schema: type[BaseModel],
+    lines: AsyncIterable[bytes],
+    file_format: FileFormat,
+    batch_size: int,
+    limit: int,
+) -> AsyncIterator[list[dict]]:
+    """Пачки по batch_size проверенных схемой записей в виде словарей"""
+    header, batch, count, number = None, [], 0, 0
+    async for line in lines:
+        number += 1
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            if file_format is FileFormat.CSV:
+                row = next(csv.reader([line.decode()]))
+                if header is None:
+                    header = row
+                    continue
+                if len(row) != len(header):
+                    raise RecordError(
+                        number, [_error(f"Expected {len(header)} columns")]
+                    )
+                record = schema.model_validate(dict(zip(header, row)))
+            else:
+                record = schema.model_validate_json(line)
+        except ValidationError as error:
+            raise RecordError(
+                number, error.errors(include_url=False, include_context=False)
+            )
+        except UnicodeDecodeError:
+            raise RecordError(number, [_error("Invalid UTF-8")])
+        count += 1
+        if count > limit:
+            raise RecordError(number, [_error(f"More than {limit} records")])
+        batch.append(record.model_dump())
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _error(message: str) -> dict:
+    return {"type": "value_error", "loc": (), "msg": message}
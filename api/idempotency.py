@@ -0,0 +1,75 @@
+"""Поддержка заголовка Idempotency-Key для изменяющих эндпоинтов"""
+
+import asyncio
+import hashlib
+import json
+from typing import Awaitable, Callable
+
+import orjson
+from fastapi import HTTPException, Response
+from fastapi.encoders import jsonable_encoder
+
+from api.responses import ORJSONResponse
+from api.routers.settings import CustomExceptions
+from database.idempotency import IDEMPOTENCY, IDEMPOTENCY_REQUESTS
+
+
+def _is_final(status_code: int) -> bool:
+    """409 и 5xx - временные отказы: повтор с тем же ключом выполняется заново"""
+    return status_code < 500 and status_code != 409
+
+
+async def idempotent(
+    key: str | None,
+    operation: str,
+    request: object,
+    call: Callable[[], Awaitable[object]],
+):
+    """Выполняет call не более одного раза на ключ, повтор получает тот же ответ"""
+    if key is None:
+        return await call()
+    fingerprint = hashlib.sha256(
+        json.dumps([operation, jsonable_encoder(request)], sort_keys=True).encode()
+    ).hexdigest()
+    record, claimed_at = await IDEMPOTENCY.claim(key, operation, fingerprint)
+    if record is not None:
+        if (record["operation"], record["fingerprint"]) != (operation, fingerprint):
+            IDEMPOTENCY_REQUESTS.inc(operation=operation, result="mismatch")
+            raise CustomExceptions.IDEMPOTENCY_MISMATCH.value
+        if record.get("status_code") is None:
+            IDEMPOTENCY_REQUESTS.inc(operation=operation, result="in_progress")
+            raise CustomExceptions.IDEMPOTENCY_IN_PROGRESS.value
+        IDEMPOTENCY_REQUESTS.inc(operation=operation, result="replayed")
+        return ORJSONResponse(
+            status_code=record["status_code"],
+            content=record["response"],
+            headers={"Idempotent-Replayed": "true"},
+        )
+    IDEMPOTENCY_REQUESTS.inc(operation=operation, result="executed")
+    try:
+        result = await call()
+    except HTTPException as exc:
+        if _is_final(exc.status_code):
+            await IDEMPOTENCY.complete(
+                key,
+                claimed_at,
+                operation,
+                fingerprint,
+                exc.status_code,
+                {"detail": exc.detail},
+            )
+        else:
+            await IDEMPOTENCY.release(key, claimed_at)
+        raise
+    except BaseException:
+        # в том числе отмена запроса клиентом: захват не должен остаться висеть
+        await asyncio.shield(IDEMPOTENCY.release(key, claimed_at))
+        raise
+    if isinstance(result, Response):
+        status_code, content = result.status_code, orjson.loads(result.body)
+    else:
+        status_code, content = 200, jsonable_encoder(result)
+    await IDEMPOTENCY.complete(
+        key, claimed_at, operation, fingerprint, status_code, content
+    )
+    return result
@@ -0,0 +1,48 @@
+"""ASGI middleware с метриками HTTP запросов"""
+
+import time
+
+from src.metrics import Counter, Histogram
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total",
+    "HTTP requests by route and status",
+    ("method", "route", "status"),
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route",
+    ("method", "route"),
+)
+
+
+class MetricsMiddleware:
+    """Замеряет длительность и статус запросов в разрезе шаблона маршрута"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # маршрут появляется в scope после сопоставления роутером
+            route = scope.get("route")
+            route = getattr(route, "path", "unmatched")
+            method = scope["method"]
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - started, method=method, route=route
+            )
+            HTTP_REQUESTS.inc(method=method, route=route, status=status)
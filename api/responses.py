@@ -0,0 +1,76 @@
+"""Ответы API: одна проверка по схеме и сериализация через orjson.
+
+Маршрут возвращает готовый Response, поэтому FastAPI не проверяет
+результат по response_model повторно; response_model остается для
+документации OpenAPI.
+"""
+
+import csv
+import io
+from functools import cache
+from typing import Any, AsyncIterable, AsyncIterator, Sequence
+
+import orjson
+from fastapi.responses import ORJSONResponse as _ORJSONResponse
+from pydantic import TypeAdapter
+
+
+class ORJSONResponse(_ORJSONResponse):
+    """ORJSONResponse, понимающий UUID драйвера asyncpg.
+
+    asyncpg возвращает собственный подкласс uuid.UUID, который orjson сам
+    не сериализует; такие значения (и прочие незнакомые) приводятся к str.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=str, option=orjson.OPT_NON_STR_KEYS)
+
+
+@cache
+def _adapter(schema) -> TypeAdapter:
+    return TypeAdapter(schema)
+
+
+def respond(schema, content, status_code: int = 200) -> ORJSONResponse:
+    """Проверяет content по схеме и отдает JSON.
+
+    content может содержать ORM-объекты: поля читаются по атрибутам.
+    Экземпляры схемы повторно не проверяются.
+    """
+    adapter = _adapter(schema)
+    value = adapter.validate_python(content, from_attributes=True)
+    return ORJSONResponse(adapter.dump_python(value), status_code=status_code)
+
+
+async def ndjson_lines(schema, chunks: AsyncIterable[Sequence]) -> AsyncIterator[bytes]:
+    """Строки NDJSON, по одному куску тела ответа на пачку объектов"""
+    adapter = _adapter(list[schema])
+    async for chunk in chunks:
+        values = adapter.dump_python(
+            adapter.validate_python(chunk, from_attributes=True)
+        )
+        yield b"".join(
+            orjson.dumps(value, default=str, option=orjson.OPT_APPEND_NEWLINE)
+            for value in values
+        )
+
+
+async def csv_lines(schema, chunks: AsyncIterable[Sequence]) -> AsyncIterator[bytes]:
+    """CSV с заголовком из полей схемы, по одному куску на пачку объектов"""
+    adapter = _adapter(list[schema])
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=list(schema.model_fields))
+    writer.writeheader()
+    async for chunk in chunks:
+        values = adapter.validate_python(chunk, from_attributes=True)
+        writer.writerows(adapter.dump_python(values, mode="json"))
+        yield _drain(buffer)
+    if buffer.tell():
+        yield _drain(buffer)
+
+
+def _drain(buffer: io.StringIO) -> bytes:
+    data = buffer.getvalue().encode()
+    buffer.seek(0)
+    buffer.truncate()
+    return data
@@ -1,8 +1,11 @@
 import enum
+import uuid
+from typing import AsyncGenerator
 
 from fastapi import Header, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.config import LOGER
+from database.shards import SHARD_MAP
 from src.settings import X_API_KEY
 
 
@@ -16,10 +19,62 @@ class CustomExceptions(enum.Enum):
         status_code=401,
         detail="Invalid API Key",
     )
+    IDEMPOTENCY_IN_PROGRESS = HTTPException(
+        status_code=409,
+        detail="Request with this Idempotency-Key is in progress",
+        headers={"Retry-After": "1"},
+    )
+    IDEMPOTENCY_MISMATCH = HTTPException(
+        status_code=422,
+        detail="Idempotency-Key was used with a different request",
+    )
+    SERVICE_UNAVAILABLE = HTTPException(
+        status_code=503,
+        detail="Service Unavailable",
+        headers={"Retry-After": "1"},
+    )
 
 
-@LOGER.catch
-async def verify_api_key(x_api_key: str = Header(...)) -> str | CustomExceptions:
+async def verify_api_key(x_api_key: str = Header(...)) -> None:
+    """Проверка ключа на уровне роутера: до сессий и остальных зависимостей"""
     if x_api_key != X_API_KEY:
-        return CustomExceptions.CREDENTIALS_EXCEPTION
-    return x_api_key
+        raise CustomExceptions.CREDENTIALS_EXCEPTION.value
+
+
+async def get_user_db(user_id: uuid.UUID) -> AsyncGenerator[AsyncSession, None]:
+    """Сессия шарда пользователя"""
+    async with SHARD_MAP.shard_for(user_id).session_factory() as session:
+        yield session
+
+
+async def get_transaction_db(
+    transaction_id: uuid.UUID,
+) -> AsyncGenerator[AsyncSession, None]:
+    """Сессия шарда транзакции"""
+    shard = await SHARD_MAP.locate_transaction(transaction_id)
+    async with shard.session_factory() as session:
+        yield session
+
+
+async def get_read_db(
+    user_id: uuid.UUID,
+    read_your_writes: bool = Header(default=False, alias="X-Read-Your-Writes"),
+) -> AsyncGenerator[AsyncSession, None]:
+    """Сессия для чтения данных пользователя: реплика или шард.
+
+    X-Read-Your-Writes: true гарантирует, что ответ учтет все записи,
+    подтвержденные клиенту до запроса.
+    """
+    shard = SHARD_MAP.shard_for(user_id, write=False)
+    async with SHARD_MAP.read_session_factory(shard, read_your_writes)() as session:
+        yield session
+
+
+async def get_transaction_read_db(
+    transaction_id: uuid.UUID,
+    read_your_writes: bool = Header(default=False, alias="X-Read-Your-Writes"),
+) -> AsyncGenerator[AsyncSession, None]:
+    """Сессия для чтения транзакции, как get_read_db"""
+    shard = await SHARD_MAP.locate_transaction(transaction_id, write=False)
+    async with SHARD_MAP.read_session_factory(shard, read_your_writes)() as session:
+        yield session
@@ -1,48 +1,158 @@
 """transaction endponts"""
 
+import asyncio
 import uuid
+from typing import Awaitable, Callable
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Header
 from sqlalchemy.ext.asyncio import AsyncSession
 
 import database as db
 from api import schemas
-from api.routers.settings import verify_api_key, CustomExceptions
+from api.responses import ORJSONResponse, respond
+from api.idempotency import idempotent
+from api.routers.settings import (
+    get_transaction_db,
+    get_transaction_read_db,
+    CustomExceptions,
+)
+from database.db import Shard
+from database.retry import RetryBudgetExceeded
+from database.shards import SHARD_MAP, ShardUnavailable
 from src.config import LOGER
+from src.settings import TRANSACTION_BATCH_LIMIT
 
 app = APIRouter(prefix="/transaction", tags=["TRANSACTIONS"])
 
+IdempotencyKeyHeader = Header(default=None, alias="Idempotency-Key", max_length=255)
+
 
 @LOGER.catch
 @app.post("/", response_model=schemas.Transaction)
 async def create(
     body: schemas.CreateTransaction,
-    session: AsyncSession = Depends(db.get_db),
-    api_key: str = Depends(verify_api_key),
+    idempotency_key: str | None = IdempotencyKeyHeader,
 ):
-    if isinstance(api_key, CustomExceptions):
-        raise api_key.value
-    new_transaction = await db.UoW(session).create_transaction(**body.model_dump())
-    LOGER.warning(new_transaction)
+    return await idempotent(
+        idempotency_key, "create_transaction", body, lambda: _create(body)
+    )
+
+
+async def _create(body: schemas.CreateTransaction) -> ORJSONResponse:
+    try:
+        async with SHARD_MAP.shard_for(body.user_id).session_factory() as session:
+            new_transaction = await db.ADMISSION.create_transaction(
+                session, body.model_dump()
+            )
+    except db.AdmissionRejected:
+        raise CustomExceptions.SERVICE_UNAVAILABLE.value
     if new_transaction:
-        transaction_dto = schemas.Transaction.model_validate(new_transaction)
-        return transaction_dto
+        LOGER.debug("Transaction created: {}", new_transaction)
+        return respond(schemas.Transaction, new_transaction)
     raise CustomExceptions.BAD_REQUEST.value
 
 
+@LOGER.catch
+@app.post("/batch", response_model=list[schemas.BatchTransactionResult])
+async def create_batch(
+    body: list[schemas.CreateTransaction],
+    idempotency_key: str | None = IdempotencyKeyHeader,
+):
+    """Создание пачки транзакций за одну блокировку на пользователя"""
+    return await idempotent(
+        idempotency_key,
+        "create_transactions_batch",
+        body,
+        lambda: _create_batch(body),
+    )
+
+
+async def _create_batch(body: list[schemas.CreateTransaction]) -> ORJSONResponse:
+    if not body or len(body) > TRANSACTION_BATCH_LIMIT:
+        raise CustomExceptions.BAD_REQUEST.value
+    items = [item.model_dump() for item in body]
+    result = await _by_shard(
+        [_writable_shard(item["user_id"]) for item in items],
+        lambda session, indices: db.UoW(session).create_transactions_batch(
+            [items[index] for index in indices]
+        ),
+    )
+    if result is None:
+        raise CustomExceptions.BAD_REQUEST.value
+    return respond(
+        list[schemas.BatchTransactionResult],
+        [
+            {"index": index, "outcome": outcome, "transaction": transaction}
+            for index, (outcome, transaction) in enumerate(result)
+        ],
+    )
+
+
+@LOGER.catch
+@app.patch("/confirm", response_model=list[schemas.BatchTransactionResult])
+async def confirm_batch(
+    body: list[uuid.UUID],
+    idempotency_key: str | None = IdempotencyKeyHeader,
+):
+    """Подтверждение пачки транзакций"""
+    return await idempotent(
+        idempotency_key,
+        "confirm_batch",
+        body,
+        lambda: _settle_batch(body, confirm=True),
+    )
+
+
+@LOGER.catch
+@app.patch("/cancel", response_model=list[schemas.BatchTransactionResult])
+async def cancel_batch(
+    body: list[uuid.UUID],
+    idempotency_key: str | None = IdempotencyKeyHeader,
+):
+    """Отмена пачки транзакций"""
+    return await idempotent(
+        idempotency_key,
+        "cancel_batch",
+        body,
+        lambda: _settle_batch(body, confirm=False),
+    )
+
+
+async def _settle_batch(
+    transaction_ids: list[uuid.UUID], confirm: bool
+) -> ORJSONResponse:
+    if not transaction_ids or len(transaction_ids) > TRANSACTION_BATCH_LIMIT:
+        raise CustomExceptions.BAD_REQUEST.value
+    users = await SHARD_MAP.transaction_users(transaction_ids)
+    result = await _by_shard(
+        [
+            _writable_shard(users.get(transaction_id, transaction_id))
+            for transaction_id in transaction_ids
+        ],
+        lambda session, indices: db.UoW(session).settle_transactions_batch(
+            [transaction_ids[index] for index in indices], confirm=confirm
+        ),
+    )
+    if result is None:
+        raise CustomExceptions.BAD_REQUEST.value
+    return respond(
+        list[schemas.BatchTransactionResult],
+        [
+            {"index": index, "outcome": outcome, "transaction": transaction}
+            for index, (outcome, transaction) in enumerate(result)
+        ],
+    )
+
+
 @LOGER.catch
 @app.get("/{transaction_id}", response_model=schemas.Transaction)
 async def get(
     transaction_id: uuid.UUID,
-    session: AsyncSession = Depends(db.get_db),
-    api_key: str = Depends(verify_api_key),
+    session: AsyncSession = Depends(get_transaction_read_db),
 ):
-    if isinstance(api_key, CustomExceptions):
-        raise api_key.value
     transaction = await db.Transaction.read_by_id(session, transaction_id)
     if transaction:
-        transaction_dto = schemas.Transaction.model_validate(transaction)
-        return transaction_dto
+        return respond(schemas.Transaction, transaction)
     raise CustomExceptions.NOT_FOUND.value
 
 
@@ -50,17 +160,27 @@ async def get(
 @app.patch("/{transaction_id}/done", response_model=schemas.Transaction)
 async def done_transaction(
     transaction_id: uuid.UUID,
-    session: AsyncSession = Depends(db.get_db),
-    api_key: str = Depends(verify_api_key),
+    session: AsyncSession = Depends(get_transaction_db),
+    idempotency_key: str | None = IdempotencyKeyHeader,
 ):
-    if isinstance(api_key, CustomExceptions):
-        raise api_key.value
-    result = await db.UoW(session).confirm_transaction(transaction_id)
+    return await idempotent(
+        idempotency_key,
+        "confirm_transaction",
+        transaction_id,
+        lambda: _done_transaction(session, transaction_id),
+    )
+
+
+async def _done_transaction(
+    session: AsyncSession, transaction_id: uuid.UUID
+) -> ORJSONResponse:
+    try:
+        result = await db.ADMISSION.confirm_transaction(session, transaction_id)
+    except db.AdmissionRejected:
+        raise CustomExceptions.SERVICE_UNAVAILABLE.value
     if result:
-        LOGER.warning(result)
-        result_dto = schemas.Transaction.model_validate(result)
-        LOGER.info(result_dto)
-        return result_dto
+        LOGER.debug("Transaction confirmed: {}", result)
+        return respond(schemas.Transaction, result)
     raise CustomExceptions.BAD_REQUEST.value
 
 
@@ -68,15 +188,66 @@ async def done_transaction(
 @app.patch("/{transaction_id}/cancel", response_model=schemas.Transaction)
 async def cancel_transaction(
     transaction_id: uuid.UUID,
-    session: AsyncSession = Depends(db.get_db),
-    api_key: str = Depends(verify_api_key),
+    session: AsyncSession = Depends(get_transaction_db),
+    idempotency_key: str | None = IdempotencyKeyHeader,
 ):
-    if isinstance(api_key, CustomExceptions):
-        raise api_key.value
-    transaction = await db.Transaction.update(
-        session, transaction_id, **{"status": db.TransactionStatus.CANCELED}
+    return await idempotent(
+        idempotency_key,
+        "cancel_transaction",
+        transaction_id,
+        lambda: _cancel_transaction(session, transaction_id),
     )
+
+
+async def _cancel_transaction(
+    session: AsyncSession, transaction_id: uuid.UUID
+) -> ORJSONResponse:
+    transaction = await db.UoW(session).cancel_transaction(transaction_id)
     if transaction:
-        transaction_dto = schemas.Transaction.model_validate(transaction)
-        return transaction_dto
+        return respond(schemas.Transaction, transaction)
     raise CustomExceptions.NOT_FOUND.value
+
+
+def _writable_shard(obj_id: uuid.UUID) -> Shard | None:
+    try:
+        return SHARD_MAP.shard_for(obj_id)
+    except ShardUnavailable:
+        return None
+
+
+async def _by_shard(
+    shards: list[Shard | None],
+    run: Callable[[AsyncSession, list[int]], Awaitable[list | None]],
+) -> list | None:
+    """Выполняет пачку частями на шардах ее элементов.
+
+    shards - шард каждого элемента, None - запись в его бакет сейчас
+    невозможна. Пачка одного шарда выполняется одной транзакцией, как без
+    шардирования. Части на разных шардах - отдельные транзакции:
+    элементы невыполненной части получают UNAVAILABLE, а выполненные
+    части остаются в силе.
+    """
+    parts: dict[Shard | None, list[int]] = {}
+    for index, shard in enumerate(shards):
+        parts.setdefault(shard, []).append(index)
+    if len(parts) == 1:
+        [(shard, indices)] = parts.items()
+        if shard is None:
+            raise ShardUnavailable("Buckets of the batch are moving")
+        async with shard.session_factory() as session:
+            return await run(session, indices)
+    results = [(db.OperationOutcome.UNAVAILABLE, None)] * len(shards)
+
+    async def run_part(shard: Shard, indices: list[int]) -> None:
+        try:
+            async with shard.session_factory() as session:
+                part = await run(session, indices)
+        except (RetryBudgetExceeded, ShardUnavailable):
+            return
+        for index, result in zip(indices, part or ()):
+            results[index] = result
+
+    await asyncio.gather(
+        *(run_part(shard, indices) for shard, indices in parts.items() if shard)
+    )
+    return results
@@ -1,15 +1,26 @@
 """user endpoints"""
 
+import datetime
 import uuid
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Header, Query, Request
+from fastapi.exceptions import RequestValidationError
 from fastapi.params import Depends
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
 import database as db
 from api import schemas
-from api.routers.settings import verify_api_key, CustomExceptions
+from api.bulk import RecordError, read_batches, split_lines
+from api.responses import csv_lines, ndjson_lines, respond
+from api.routers.settings import (
+    get_read_db,
+    get_user_db,
+    CustomExceptions,
+)
+from database.shards import SHARD_MAP
 from src.config import LOGER
+from src.settings import EVENTS_ENABLED, USER_BULK_BATCH_SIZE, USER_BULK_LIMIT
 
 app = APIRouter(prefix="/users", tags=["USERS"])
 
@@ -18,31 +29,64 @@ app = APIRouter(prefix="/users", tags=["USERS"])
 @app.post("/")
 async def create(
     body: schemas.CreateUser,
-    session: AsyncSession = Depends(db.get_db),
-    api_key: str = Depends(verify_api_key),
 ):
     """Метод для создания пользователя"""
-    if isinstance(api_key, CustomExceptions):
-        raise api_key.value
-    user = await db.User.create(session, **body.model_dump())
-    user_dto = schemas.User.model_validate(user)
-    return user_dto
+    # шард определяется по id, поэтому id выдается до вставки
+    user_id = SHARD_MAP.new_user_id()
+    async with SHARD_MAP.shard_for(user_id).session_factory() as session:
+        user = await db.User.create(session, id=user_id, **body.model_dump())
+    return respond(schemas.User, user)
+
+
+@LOGER.catch
+@app.post("/bulk", response_model=list[uuid.UUID])
+async def create_bulk(
+    request: Request,
+    file_format: schemas.FileFormat = Query(
+        default=schemas.FileFormat.NDJSON, alias="format"
+    ),
+):
+    """Массовое создание пользователей из NDJSON или CSV записей CreateUser.
+
+    Тело читается потоком и загружается через COPY пачками в одной
+    транзакции; ответ - id созданных пользователей в порядке записей.
+    При ошибке в любой записи не создается ни один пользователь. Все
+    пользователи загрузки попадают на один шард.
+    """
+    batches = read_batches(
+        schemas.CreateUser,
+        split_lines(request.stream()),
+        file_format,
+        USER_BULK_BATCH_SIZE,
+        USER_BULK_LIMIT,
+    )
+    shard, new_id = SHARD_MAP.bulk_target()
+    try:
+        async with shard.session_factory() as session:
+            ids = await db.UoW(session).create_users_copy(batches, new_id)
+    except RecordError as error:
+        raise RequestValidationError(
+            [
+                {**item, "loc": ("body", error.line, *item["loc"])}
+                for item in error.errors
+            ]
+        )
+    if not ids:
+        raise CustomExceptions.BAD_REQUEST.value
+    LOGER.info(f"Users created via COPY: {len(ids)}")
+    return respond(list[uuid.UUID], ids)
 
 
 @LOGER.catch
 @app.get("/{user_id}", response_model=schemas.User)
 async def get(
     user_id: uuid.UUID,
-    session: AsyncSession = Depends(db.get_db),
-    api_key: str = Depends(verify_api_key),
+    session: AsyncSession = Depends(get_read_db),
 ):
     """Метод для получения конкретного пользователя"""
-    if isinstance(api_key, CustomExceptions):
-        raise api_key.value
     user = await db.User.read_by_id(session, user_id)
     if user:
-        user_dto = schemas.User.model_validate(user)
-        return user_dto
+        return respond(schemas.User, user)
     raise CustomExceptions.NOT_FOUND.value
 
 
@@ -50,12 +94,9 @@ async def get(
 @app.delete("/{user_id}")
 async def delete(
     user_id: uuid.UUID,
-    session: AsyncSession = Depends(db.get_db),
-    api_key: str = Depends(verify_api_key),
+    session: AsyncSession = Depends(get_user_db),
 ):
     """Метод для удаления пользователя"""
-    if isinstance(api_key, CustomExceptions):
-        raise api_key.value
     user = await db.User.delete(session, user_id)
     if user is True:
         return {"status": "OK"}
@@ -67,23 +108,19 @@ async def delete(
 async def update_current_balance(
     user_id: uuid.UUID,
     current_balance: int,
-    session: AsyncSession = Depends(db.get_db),
-    api_key: str = Depends(verify_api_key),
+    session: AsyncSession = Depends(get_user_db),
 ):
     """Метод для обновления данных пользователя"""
-    if isinstance(api_key, CustomExceptions):
-        raise api_key.value
-    user = await db.User.read_by_id(session, user_id)
-    user_dto = schemas.User.model_validate(user)
+    # лимиты проверяются по заблокированной строке, а не по кэшу
+    user = await session.get(db.User, user_id, with_for_update=True)
     if user is None:
         raise CustomExceptions.NOT_FOUND.value
-    if current_balance > user_dto.max_balance:
+    if current_balance > user.max_balance:
         raise CustomExceptions.BAD_REQUEST.value
     user = await db.User.update(
         session, user_id, **{"current_balance": current_balance}
     )
-    user_dto = schemas.User.model_validate(user)
-    return user_dto
+    return respond(schemas.User, user)
 
 
 @LOGER.catch
@@ -91,40 +128,180 @@ async def update_current_balance(
 async def update_max_balance(
     user_id: uuid.UUID,
     max_balance: int,
-    session: AsyncSession = Depends(db.get_db),
-    api_key: str = Depends(verify_api_key),
+    session: AsyncSession = Depends(get_user_db),
 ):
     """Метод для обновления данных пользователя"""
-    if isinstance(api_key, CustomExceptions):
-        raise api_key.value
-    user = await db.User.read_by_id(session, user_id)
-    user_dto = schemas.User.model_validate(user)
+    # лимиты проверяются по заблокированной строке, а не по кэшу
+    user = await session.get(db.User, user_id, with_for_update=True)
     if user is None:
         raise CustomExceptions.NOT_FOUND.value
-    if max_balance < user_dto.current_balance:
+    if max_balance < user.current_balance:
         raise CustomExceptions.BAD_REQUEST.value
     user = await db.User.update(session, user_id, **{"max_balance": max_balance})
-    user_dto = schemas.User.model_validate(user)
-    return user_dto
+    return respond(schemas.User, user)
 
 
 @LOGER.catch
-@app.get("/{user_id}/transactions")
+@app.get("/{user_id}/transactions", response_model=schemas.TransactionPage)
 async def transactions(
     user_id: uuid.UUID,
     limit: int,
-    offset: int,
-    session: AsyncSession = Depends(db.get_db),
-    api_key: str = Depends(verify_api_key),
+    offset: int | None = None,
+    cursor: str | None = None,
+    with_total: bool | None = None,
+    session: AsyncSession = Depends(get_read_db),
+):
+    """Метод для получения всех транзакций пользователя.
+
+    Без offset работает keyset-пагинация: следующая страница
+    запрашивается по next_cursor, total считается только по with_total.
+    """
+    if limit <= 0:
+        raise CustomExceptions.BAD_REQUEST.value
+    uow = db.UoW(session)
+    if offset is not None and cursor is None:
+        result = await uow.get_all_transactions_with_page(limit, offset, user_id)
+        if result is None:
+            raise CustomExceptions.BAD_REQUEST.value
+        rows, total = list(result[0]), result[1]
+        has_more = len(rows) == limit
+        if with_total is False:
+            total = None
+    else:
+        after = None
+        if cursor is not None:
+            try:
+                after = schemas.Cursor.decode(cursor)
+            except ValueError:
+                raise CustomExceptions.BAD_REQUEST.value
+            after = (after.created_at, after.id)
+        rows = await uow.get_transactions_after(limit + 1, user_id, after)
+        if rows is None:
+            raise CustomExceptions.BAD_REQUEST.value
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        total = await uow.count_transactions(user_id) if with_total else None
+    next_cursor = None
+    if has_more and rows:
+        next_cursor = schemas.Cursor(
+            created_at=rows[-1].created_at, id=rows[-1].id
+        ).encode()
+    data = {"transactions": rows, "total": total, "next_cursor": next_cursor}
+    return respond(schemas.TransactionPage, data)
+
+
+EXPORT_FORMATS = {
+    schemas.FileFormat.NDJSON: (ndjson_lines, "application/x-ndjson"),
+    schemas.FileFormat.CSV: (csv_lines, "text/csv"),
+}
+
+
+async def _export_chunks(session_factory, user_id: uuid.UUID, **filters):
+    """Пачки транзакций из серверного курсора на отдельной сессии"""
+    async with session_factory() as session:
+        async for rows in db.UoW(session).stream_transactions(user_id, **filters):
+            yield rows
+
+
+@LOGER.catch
+@app.get("/{user_id}/transactions/export")
+async def export_transactions(
+    user_id: uuid.UUID,
+    export_format: schemas.FileFormat = Query(
+        default=schemas.FileFormat.NDJSON, alias="format"
+    ),
+    since: datetime.datetime | None = Query(default=None, alias="from"),
+    until: datetime.datetime | None = Query(default=None, alias="to"),
+    status: schemas.TransactionStatus | None = None,
+    read_your_writes: bool = Header(default=False, alias="X-Read-Your-Writes"),
+):
+    """Выгрузка всех транзакций пользователя за период [from, to).
+
+    Строки отдаются потоком по мере чтения из БД в хронологическом
+    порядке, без подсчета total и OFFSET.
+    """
+    session_factory = SHARD_MAP.read_session_factory(
+        SHARD_MAP.shard_for(user_id, write=False), read_your_writes
+    )
+    async with session_factory() as session:
+        user = await db.User.read_by_id(session, user_id)
+    if user is None:
+        raise CustomExceptions.NOT_FOUND.value
+    encode, media_type = EXPORT_FORMATS[export_format]
+    chunks = _export_chunks(
+        session_factory, user_id, since=since, until=until, status=status
+    )
+    return StreamingResponse(
+        encode(schemas.Transaction, chunks),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": (
+                f'attachment; filename="transactions-{user_id}.{export_format.value}"'
+            )
+        },
+    )
+
+
+@LOGER.catch
+@app.get("/{user_id}/balance", response_model=schemas.BalanceEntry)
+async def balance_at(
+    user_id: uuid.UUID,
+    at: datetime.datetime | None = None,
+    session: AsyncSession = Depends(get_read_db),
+):
+    """Баланс пользователя на момент at по журналу изменений"""
+    entry = await db.UoW(session).get_balance_at(user_id, at)
+    if entry is None:
+        raise CustomExceptions.NOT_FOUND.value
+    return respond(schemas.BalanceEntry, entry)
+
+
+@LOGER.catch
+@app.get("/{user_id}/balance/history", response_model=list[schemas.BalanceEntry])
+async def balance_history(
+    user_id: uuid.UUID,
+    limit: int,
+    since: datetime.datetime | None = None,
+    until: datetime.datetime | None = None,
+    after: int | None = None,
+    session: AsyncSession = Depends(get_read_db),
 ):
-    """Метод для получения всех транзакций пользователя"""
-    if isinstance(api_key, CustomExceptions):
-        raise api_key.value
-    result = await db.UoW(session).get_all_transactions_with_page(
-        limit, offset, user_id
+    """Изменения баланса за период [since, until).
+
+    Следующая страница запрашивается с after = id последней записи.
+    """
+    if limit <= 0:
+        raise CustomExceptions.BAD_REQUEST.value
+    entries = await db.UoW(session).get_balance_history(
+        limit, user_id, since, until, after
+    )
+    if entries is None:
+        raise CustomExceptions.BAD_REQUEST.value
+    return respond(list[schemas.BalanceEntry], entries)
+
+
+@LOGER.catch
+@app.get("/{user_id}/events")
+async def events(
+    user_id: uuid.UUID,
+    last_event_id: int | None = Header(default=None, alias="Last-Event-ID"),
+):
+    """Поток SSE: изменения баланса и статусов транзакций пользователя.
+
+    После переподключения с Last-Event-ID досылает пропущенные события;
+    если их уже нет в буфере, отправляет событие reset - состояние нужно
+    перечитать через GET.
+    """
+    if not EVENTS_ENABLED:
+        raise CustomExceptions.SERVICE_UNAVAILABLE.value
+    # соединение нужно только на проверку: поток не держит его открытым
+    shard = SHARD_MAP.shard_for(user_id, write=False)
+    async with shard.session_factory() as session:
+        user = await db.User.read_by_id(session, user_id)
+    if user is None:
+        raise CustomExceptions.NOT_FOUND.value
+    return StreamingResponse(
+        db.EVENTS.subscribe(user_id, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
-    data = {
-        "transactions": [schemas.Transaction.model_validate(i) for i in result[0]],
-        "total": result[1],
-    }
-    return data
@@ -2,4 +2,12 @@ from api.schemas.user import (
     User,
     CreateUser,
 )
-from api.schemas.transaction import Transaction, TransactionStatus, CreateTransaction
+from api.schemas.transaction import (
+    Transaction,
+    TransactionStatus,
+    CreateTransaction,
+    BatchTransactionResult,
+)
+from api.schemas.pagination import Cursor, TransactionPage
+from api.schemas.ledger import BalanceEntry
+from api.schemas.settings import FileFormat
@@ -0,0 +1,14 @@
+"""Схемы журнала баланса"""
+
+import datetime
+
+from api.schemas.settings import MyOrmModel
+
+
+class BalanceEntry(MyOrmModel):
+    """Изменение баланса и баланс после него"""
+
+    id: int
+    delta: int
+    balance_after: int
+    created_at: datetime.datetime
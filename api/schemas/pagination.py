@@ -0,0 +1,32 @@
+"""Схемы постраничной выдачи"""
+
+import base64
+import datetime
+import uuid
+
+from pydantic import BaseModel
+
+from api.schemas.transaction import Transaction
+
+
+class Cursor(BaseModel):
+    """Позиция keyset-пагинации по (created_at, id)"""
+
+    created_at: datetime.datetime
+    id: uuid.UUID
+
+    def encode(self) -> str:
+        """Непрозрачное представление курсора для клиента"""
+        return base64.urlsafe_b64encode(self.model_dump_json().encode()).decode()
+
+    @classmethod
+    def decode(cls, value: str) -> "Cursor":
+        return cls.model_validate_json(base64.urlsafe_b64decode(value.encode()))
+
+
+class TransactionPage(BaseModel):
+    """Страница транзакций пользователя"""
+
+    transactions: list[Transaction]
+    total: int | None = None
+    next_cursor: str | None = None
@@ -1,5 +1,7 @@
 """Файл настрокий родительского обьекта конфигурации схем"""
 
+import enum
+
 from pydantic import BaseModel, ConfigDict
 
 
@@ -7,3 +9,10 @@ class MyOrmModel(BaseModel):
     """Конфиг валидации ОРМ моделей"""
 
     model_config = ConfigDict(from_attributes=True, arbitrary_types_allowed=True)
+
+
+class FileFormat(enum.Enum):
+    """Формат выгрузки и загрузки записей"""
+
+    NDJSON = "ndjson"
+    CSV = "csv"
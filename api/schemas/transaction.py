@@ -5,7 +5,7 @@ from typing import Self
 from pydantic import model_validator
 
 from api.schemas.settings import MyOrmModel
-from database import TransactionStatus
+from database import TransactionStatus, OperationOutcome
 
 
 class CreateTransaction(MyOrmModel):
@@ -13,7 +13,8 @@ class CreateTransaction(MyOrmModel):
 
     user_id: uuid.UUID
     amount: int
-    status: TransactionStatus
+    # транзакция создается только в статусе PENDING
+    status: TransactionStatus = TransactionStatus.PENDING
     timeout_seconds: int
 
     @model_validator(mode="after")
@@ -30,3 +31,12 @@ class Transaction(CreateTransaction):
     status: TransactionStatus
     created_at: datetime.datetime
     updated_at: datetime.datetime
+    expires_at: datetime.datetime | None = None
+
+
+class BatchTransactionResult(MyOrmModel):
+    """Результат обработки одного элемента пачки"""
+
+    index: int
+    outcome: OperationOutcome
+    transaction: Transaction | None = None
@@ -1,3 +1,11 @@
-from database.models import User, Transaction, TransactionStatus
+from database.models import (
+    User,
+    Transaction,
+    TransactionStatus,
+    OperationOutcome,
+    BalanceLedger,
+)
 from database.db import get_db
 from database.uow import UoW
+from database.admission import ADMISSION, AdmissionRejected
+from database.events import EVENTS
@@ -0,0 +1,211 @@
+"""Очереди операций по пользователю перед UoW.
+
+Запросы одного пользователя ждут своей очереди в процессе, не занимая
+соединение: сессия маршрута берет его из пула только при первом запросе
+к БД. Очередь пользователя разбирает одна задача с собственной сессией,
+поэтому горячий пользователь занимает одно соединение, а не по одному на
+каждый ожидающий блокировку строки запрос.
+
+Очереди включаются ADMISSION_ENABLED=True; по умолчанию операции идут в
+UoW напрямую, как раньше.
+"""
+
+import asyncio
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import OperationOutcome
+from database.retry import RetryBudgetExceeded
+from database.shards import SHARD_MAP, ShardUnavailable
+from database.uow import UoW
+from src.config import LOGER
+from src.metrics import Counter, Gauge, Histogram
+from src.settings import (
+    ADMISSION_ENABLED,
+    ADMISSION_QUEUE_DEPTH,
+    ADMISSION_TIMEOUT,
+    ADMISSION_COALESCE,
+    ADMISSION_BATCH_SIZE,
+)
+from api import schemas
+
+ADMISSION_WAIT_SECONDS = Histogram(
+    "admission_queue_wait_seconds",
+    "Time an operation waits in its user's queue before it runs",
+    ("operation",),
+)
+ADMISSION_REJECTED = Counter(
+    "admission_rejected_total",
+    "Operations rejected by the admission layer",
+    ("operation", "reason"),
+)
+ADMISSION_BATCH_OPERATIONS = Histogram(
+    "admission_batch_size",
+    "Operations applied in one DB transaction",
+    ("operation",),
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256),
+)
+
+
+class AdmissionRejected(Exception):
+    """Очередь пользователя переполнена или операция не дождалась запуска"""
+
+
+@dataclass
+class _Operation:
+    kind: str
+    payload: object
+    enqueued_at: float = field(default_factory=time.perf_counter)
+    started: asyncio.Future = field(
+        default_factory=lambda: asyncio.get_running_loop().create_future()
+    )
+    result: asyncio.Future = field(
+        default_factory=lambda: asyncio.get_running_loop().create_future()
+    )
+
+
+class Admission:
+    """Очереди create/confirm по user_id"""
+
+    def __init__(
+        self,
+        enabled: bool,
+        depth: int,
+        timeout: float,
+        coalesce: bool,
+        batch_size: int,
+    ):
+        self._enabled = enabled
+        self._depth = depth
+        self._timeout = timeout
+        self._coalesce = coalesce
+        self._batch_size = batch_size
+        self._queues: dict[uuid.UUID, deque[_Operation]] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    def depth(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    async def create_transaction(
+        self, session: AsyncSession, payload: dict
+    ) -> schemas.Transaction | None:
+        if not self._enabled:
+            return await UoW(session).create_transaction(**payload)
+        return await self._submit(payload["user_id"], "create_transaction", payload)
+
+    async def confirm_transaction(
+        self, session: AsyncSession, transaction_id: uuid.UUID
+    ) -> schemas.Transaction | None:
+        if not self._enabled:
+            return await UoW(session).confirm_transaction(transaction_id)
+        # user_id транзакции не меняется, поэтому подходит и запись из кэша;
+        # короткая сессия возвращает соединение до постановки в очередь
+        transaction = await SHARD_MAP.find_transaction(transaction_id)
+        if transaction is None:
+            return None
+        return await self._submit(
+            transaction.user_id, "confirm_transaction", transaction_id
+        )
+
+    async def _submit(self, user_id: uuid.UUID, kind: str, payload):
+        queue = self._queues.get(user_id)
+        if queue is not None and len(queue) >= self._depth:
+            ADMISSION_REJECTED.inc(operation=kind, reason="queue_full")
+            raise AdmissionRejected(f"Queue for user {user_id} is full")
+        operation = _Operation(kind, payload)
+        if queue is None:
+            queue = self._queues[user_id] = deque()
+            task = asyncio.create_task(self._drain(user_id, queue))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        queue.append(operation)
+        try:
+            await asyncio.wait_for(asyncio.shield(operation.started), self._timeout)
+        except asyncio.TimeoutError:
+            if not operation.started.done():
+                queue.remove(operation)
+                ADMISSION_REJECTED.inc(operation=kind, reason="timeout")
+                raise AdmissionRejected(f"Queue wait for user {user_id} timed out")
+        return await operation.result
+
+    async def _drain(self, user_id: uuid.UUID, queue: deque[_Operation]) -> None:
+        """Выполняет операции пользователя по порядку, пока очередь не опустеет"""
+        try:
+            while queue:
+                operations = [queue.popleft()]
+                while (
+                    self._coalesce
+                    and queue
+                    and queue[0].kind == operations[0].kind
+                    and len(operations) < self._batch_size
+                ):
+                    operations.append(queue.popleft())
+                kind, now = operations[0].kind, time.perf_counter()
+                for operation in operations:
+                    operation.started.set_result(None)
+                    ADMISSION_WAIT_SECONDS.observe(
+                        now - operation.enqueued_at, operation=kind
+                    )
+                ADMISSION_BATCH_OPERATIONS.observe(len(operations), operation=kind)
+                try:
+                    results = await self._execute(
+                        user_id, kind, [operation.payload for operation in operations]
+                    )
+                except Exception as exc:
+                    if not isinstance(exc, (RetryBudgetExceeded, ShardUnavailable)):
+                        LOGER.exception(f"Admission {kind} for user {user_id} failed")
+                    for operation in operations:
+                        operation.result.set_exception(exc)
+                else:
+                    for operation, result in zip(operations, results):
+                        operation.result.set_result(result)
+        finally:
+            del self._queues[user_id]
+
+    @staticmethod
+    async def _execute(user_id: uuid.UUID, kind: str, payloads: list) -> list:
+        """Одна транзакция БД на операцию или на всю порцию.
+
+        Шард выбирается в момент выполнения: пока операция ждала в очереди,
+        бакет пользователя мог начать переноситься.
+        """
+        async with SHARD_MAP.shard_for(user_id).session_factory() as session:
+            uow = UoW(session)
+            if len(payloads) == 1:
+                if kind == "create_transaction":
+                    return [await uow.create_transaction(**payloads[0])]
+                return [await uow.confirm_transaction(payloads[0])]
+            if kind == "create_transaction":
+                result = await uow.create_transactions_batch(payloads)
+                applied = OperationOutcome.CREATED
+            else:
+                result = await uow.settle_transactions_batch(payloads, confirm=True)
+                applied = OperationOutcome.CONFIRMED
+        if result is None:
+            return [None] * len(payloads)
+        return [
+            (
+                schemas.Transaction.model_validate(transaction)
+                if outcome == applied
+                else None
+            )
+            for outcome, transaction in result
+        ]
+
+
+ADMISSION = Admission(
+    ADMISSION_ENABLED,
+    ADMISSION_QUEUE_DEPTH,
+    ADMISSION_TIMEOUT,
+    ADMISSION_COALESCE,
+    ADMISSION_BATCH_SIZE,
+)
+ADMISSION_QUEUED = Gauge(
+    "admission_queue_depth",
+    "Operations waiting in per-user queues",
+    callback=ADMISSION.depth,
+)
@@ -0,0 +1,159 @@
+"""Кэш чтения объектов по id с инвалидацией при записи"""
+
+import time
+from collections import OrderedDict
+
+import orjson
+
+from src.config import LOGER
+from src.metrics import Counter
+from src.settings import CACHE_BACKEND, CACHE_MAX_SIZE, REDIS_URL
+
+CACHE_REQUESTS = Counter(
+    "cache_requests_total", "Read-through cache lookups", ("backend", "result")
+)
+CACHE_EVICTIONS = Counter(
+    "cache_evictions_total", "Entries evicted from the cache", ("backend", "reason")
+)
+
+
+class CacheBackend:
+    """Интерфейс бэкенда кэша. ttl=None означает хранение без срока"""
+
+    name = "none"
+
+    async def get(self, key: str) -> dict | None:
+        CACHE_REQUESTS.inc(backend=self.name, result="miss")
+        return None
+
+    async def set(self, key: str, value: dict, ttl: float | None) -> None:
+        return None
+
+    async def delete(self, *keys: str) -> None:
+        return None
+
+
+class MemoryCache(CacheBackend):
+    """LRU + TTL кэш в памяти процесса"""
+
+    name = "memory"
+
+    def __init__(self, max_size: int):
+        self._max_size = max_size
+        self._data: OrderedDict[str, tuple[float | None, dict]] = OrderedDict()
+
+    async def get(self, key: str) -> dict | None:
+        item = self._data.get(key)
+        if item is None:
+            CACHE_REQUESTS.inc(backend=self.name, result="miss")
+            return None
+        expires_at, value = item
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            CACHE_EVICTIONS.inc(backend=self.name, reason="ttl")
+            CACHE_REQUESTS.inc(backend=self.name, result="miss")
+            return None
+        self._data.move_to_end(key)
+        CACHE_REQUESTS.inc(backend=self.name, result="hit")
+        return value
+
+    async def set(self, key: str, value: dict, ttl: float | None) -> None:
+        expires_at = None if ttl is None else time.monotonic() + ttl
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self._max_size:
+            self._data.popitem(last=False)
+            CACHE_EVICTIONS.inc(backend=self.name, reason="size")
+
+    async def delete(self, *keys: str) -> None:
+        for key in keys:
+            self._data.pop(key, None)
+
+
+class RedisCache(CacheBackend):
+    """Общий для воркеров кэш поверх redis-совместимого клиента"""
+
+    name = "redis"
+
+    def __init__(self, client):
+        self._client = client
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisCache":
+        try:
+            from redis import asyncio as redis
+        except ImportError as exc:
+            raise RuntimeError(
+                "CACHE_BACKEND=redis requires the redis package"
+            ) from exc
+        return cls(redis.from_url(url))
+
+    async def get(self, key: str) -> dict | None:
+        try:
+            raw = await self._client.get(key)
+        except Exception:
+            LOGER.exception("Cache get failed")
+            raw = None
+        if raw is None:
+            CACHE_REQUESTS.inc(backend=self.name, result="miss")
+            return None
+        CACHE_REQUESTS.inc(backend=self.name, result="hit")
+        # JSON вместо pickle: запись в общий Redis не должна исполнять код
+        return orjson.loads(raw)
+
+    async def set(self, key: str, value: dict, ttl: float | None) -> None:
+        try:
+            await self._client.set(
+                key,
+                orjson.dumps(value, default=str),
+                px=None if ttl is None else int(ttl * 1000),
+            )
+        except Exception:
+            LOGER.exception("Cache set failed")
+
+    async def delete(self, *keys: str) -> None:
+        if not keys:
+            return
+        try:
+            await self._client.delete(*keys)
+        except Exception:
+            LOGER.exception("Cache delete failed")
+
+
+class LocalRedis:
+    """Минимальная замена redis-клиента в памяти для тестов и локального запуска"""
+
+    def __init__(self):
+        self._data: dict[str, tuple[float | None, bytes]] = {}
+
+    async def get(self, key: str) -> bytes | None:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    async def set(self, key: str, value: bytes, px: int | None = None) -> bool:
+        expires_at = None if px is None else time.monotonic() + px / 1000
+        self._data[key] = (expires_at, value)
+        return True
+
+    async def delete(self, *keys: str) -> int:
+        return sum(self._data.pop(key, None) is not None for key in keys)
+
+
+def build_cache(backend: str) -> CacheBackend:
+    """Создает бэкенд кэша по настройке CACHE_BACKEND"""
+    if backend == "memory":
+        return MemoryCache(CACHE_MAX_SIZE)
+    if backend == "redis":
+        return RedisCache.from_url(REDIS_URL)
+    if backend == "local-redis":
+        return RedisCache(LocalRedis())
+    return CacheBackend()
+
+
+CACHE = build_cache(CACHE_BACKEND)
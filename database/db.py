@@ -1,15 +1,102 @@
+import asyncio
+import datetime
+import itertools
+import time
 import uuid
+from contextlib import asynccontextmanager
 from typing import AsyncGenerator
 
-from sqlalchemy import select, update, delete, create_engine
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+import asyncpg
+from sqlalchemy import select, update, delete, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import (
+    create_async_engine,
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+)
 from sqlalchemy.orm import DeclarativeBase
 
-from src.settings import REAL_DATABASE_URL, DB_ECHO
+from database.cache import CACHE
+from database.pool import InstrumentedPool, instrument_pool
+from src.config import LOGER
+from src.metrics import Counter, Gauge
+from src.settings import (
+    REAL_DATABASE_URL,
+    DB_ECHO,
+    CACHE_TTL,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE,
+    DB_POOL_PRE_PING,
+    DB_STATEMENT_CACHE_SIZE,
+    DB_LOCK_TIMEOUT_MS,
+    DB_STATEMENT_TIMEOUT_MS,
+    EVENTS_ENABLED,
+    REPLICA_DATABASE_URLS,
+    REPLICA_MAX_LAG_SECONDS,
+    REPLICA_LAG_CHECK_SECONDS,
+    SHARD_DATABASE_URLS,
+)
+
+
+def _create_engine(url: str) -> AsyncEngine:
+    """Движок с общими для основной БД и реплик настройками пула"""
+    engine = create_async_engine(
+        url,
+        echo=DB_ECHO,
+        poolclass=InstrumentedPool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        connect_args={
+            # кэш asyncpg и кэш подготовленных выражений диалекта SQLAlchemy
+            "statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+            "prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+            # значения по умолчанию; UoW переопределяет их для отдельных операций
+            "server_settings": {
+                "lock_timeout": str(DB_LOCK_TIMEOUT_MS),
+                "statement_timeout": str(DB_STATEMENT_TIMEOUT_MS),
+                # триггеры balance_events, см. database/events.py
+                "app.balance_events": "on" if EVENTS_ENABLED else "off",
+            },
+        },
+    )
+    instrument_pool(engine)
+    return engine
+
+
+async_engine = _create_engine(REAL_DATABASE_URL)
+
 
-async_engine = create_async_engine(REAL_DATABASE_URL, echo=DB_ECHO)
+def driver_dsn(url: str = REAL_DATABASE_URL) -> str:
+    """DSN для соединений asyncpg в обход пула (LISTEN, advisory-блокировки)"""
+    return (
+        make_url(url).set(drivername="postgresql").render_as_string(hide_password=False)
+    )
+
+
+async def close_connection(connection: asyncpg.Connection) -> None:
+    """Закрывает выделенное соединение asyncpg, не поднимая исключений.
+
+    Если сервер не отвечает на закрытие, соединение обрывается: циклы
+    переподключения не должны завершаться из-за ошибки при уборке.
+    """
+    try:
+        await connection.close(timeout=1)
+    except (
+        OSError,
+        asyncio.TimeoutError,
+        asyncpg.PostgresError,
+        asyncpg.InterfaceError,
+    ):
+        LOGER.warning("Connection close failed, terminating it")
+        connection.terminate()
 
-sync_engine = create_engine(REAL_DATABASE_URL.replace("asyncpg", "psycopg2"), echo=DB_ECHO)
 
 async_session_factory = async_sessionmaker(
     async_engine,
@@ -17,6 +104,155 @@ async_session_factory = async_sessionmaker(
     class_=AsyncSession,
 )
 
+# отставание реплики: 0, если все полученные WAL применены, иначе время
+# с последней примененной транзакции
+REPLICA_LAG = text(
+    """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery()
+            OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp())
+    END
+    """
+)
+
+
+class Replica:
+    """Реплика для чтения и ее последнее измеренное отставание"""
+
+    def __init__(self, url: str):
+        parsed = make_url(url)
+        self.name = f"{parsed.host}:{parsed.port or 5432}"
+        self.engine = _create_engine(url)
+        # info["replica"]: сессия читает с реплики, см. Base.read_by_id
+        self.session_factory = async_sessionmaker(
+            self.engine,
+            expire_on_commit=False,
+            class_=AsyncSession,
+            info={"replica": True},
+        )
+        self.lag: float | None = None
+        self.checked_at = 0.0
+
+    def available(self) -> bool:
+        """Отставание известно, свежее и в пределах REPLICA_MAX_LAG_SECONDS"""
+        return (
+            self.lag is not None
+            and self.lag <= REPLICA_MAX_LAG_SECONDS
+            and time.monotonic() - self.checked_at < 3 * REPLICA_LAG_CHECK_SECONDS
+        )
+
+    async def check_lag(self) -> None:
+        try:
+            async with self.engine.connect() as connection:
+                self.lag = float(await connection.scalar(REPLICA_LAG))
+        except (OSError, DBAPIError):
+            LOGER.warning(f"Replica {self.name} lag check failed")
+            self.lag = None
+        self.checked_at = time.monotonic()
+
+
+REPLICAS = [Replica(url) for url in REPLICA_DATABASE_URLS]
+_next_replica = itertools.count()
+
+READ_SESSIONS = Counter(
+    "db_read_sessions_total", "Read sessions by target database", ("target",)
+)
+REPLICA_LAG_SECONDS = Gauge(
+    "db_replica_lag_seconds",
+    "Last measured replication lag, -1 if unknown",
+    ("replica",),
+    callback=lambda: {
+        (replica.name,): -1 if replica.lag is None else replica.lag
+        for replica in REPLICAS
+    },
+)
+
+
+def read_session_factory(read_your_writes: bool = False) -> async_sessionmaker:
+    """Фабрика сессий только для чтения.
+
+    Реплики перебираются по кругу, отстающие и недоступные пропускаются;
+    если подходящей нет или нужно прочитать собственную запись, чтение
+    идет с основной БД.
+    """
+    if not read_your_writes:
+        for _ in range(len(REPLICAS)):
+            replica = REPLICAS[next(_next_replica) % len(REPLICAS)]
+            if replica.available():
+                READ_SESSIONS.inc(target=replica.name)
+                return replica.session_factory
+    READ_SESSIONS.inc(target="primary")
+    return async_session_factory
+
+
+async def monitor_replicas() -> None:
+    """Обновляет отставание реплик каждые REPLICA_LAG_CHECK_SECONDS до отмены"""
+    while True:
+        await asyncio.gather(*(replica.check_lag() for replica in REPLICAS))
+        await asyncio.sleep(REPLICA_LAG_CHECK_SECONDS)
+
+
+class Shard:
+    """БД шарда данных пользователей, см. database/shards.py"""
+
+    def __init__(
+        self,
+        number: int,
+        url: str,
+        engine: AsyncEngine,
+        session_factory: async_sessionmaker,
+    ):
+        parsed = make_url(url)
+        self.number = number
+        self.name = f"{parsed.host}:{parsed.port or 5432}/{parsed.database}"
+        self.url = url
+        self.engine = engine
+        self.session_factory = session_factory
+
+    def dsn(self) -> str:
+        return driver_dsn(self.url)
+
+    @classmethod
+    def from_url(cls, number: int, url: str) -> "Shard":
+        engine = _create_engine(url)
+        return cls(
+            number,
+            url,
+            engine,
+            async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession),
+        )
+
+
+# первый шард - основная БД: на нем же данные без user_id
+SHARDS = [
+    Shard(0, REAL_DATABASE_URL, async_engine, async_session_factory),
+    *(Shard.from_url(number, url) for number, url in enumerate(SHARD_DATABASE_URLS, 1)),
+]
+
+
+async def dispose_engines() -> None:
+    """Закрывает соединения шардов и реплик"""
+    await asyncio.gather(
+        *(shard.engine.dispose() for shard in SHARDS),
+        *(replica.engine.dispose() for replica in REPLICAS),
+    )
+
+
+@asynccontextmanager
+async def short_transaction(session: AsyncSession):
+    """Запросы вне транзакции UoW в отдельной короткой транзакции.
+
+    Соединение берется из пула при первом запросе и возвращается сразу
+    после блока, а не при закрытии сессии после сериализации ответа.
+    Внутри уже начатой транзакции блок в нее и входит.
+    """
+    if session.in_transaction():
+        yield
+        return
+    async with session.begin():
+        yield
+
 
 class Base(DeclarativeBase):
     """Базовый класс декларативного подхода"""
@@ -42,27 +278,70 @@ class Base(DeclarativeBase):
         await session.commit()
         return obj
 
+    @classmethod
+    def cache_key(cls, obj_id: uuid.UUID) -> str:
+        return f"{cls.__tablename__}:{obj_id}"
+
+    def cache_ttl(self) -> float | None:
+        """Время жизни записи в кэше; None - без срока"""
+        return CACHE_TTL
+
+    @classmethod
+    def id_clause(cls, obj_id: uuid.UUID):
+        """Условие выборки строки по id"""
+        return cls.id == obj_id
+
+    @classmethod
+    def from_cached(cls, values: dict):
+        """Объект из записи кэша; значения из JSON приводятся к типам столбцов"""
+        columns = cls.__table__.columns
+        restored = {}
+        for key, value in values.items():
+            python_type = columns[key].type.python_type
+            if value is None or isinstance(value, python_type):
+                restored[key] = value
+            elif python_type is datetime.datetime:
+                restored[key] = datetime.datetime.fromisoformat(value)
+            else:
+                restored[key] = python_type(value)
+        return cls(**restored)
+
     @classmethod
     async def read_by_id(cls, session: AsyncSession, obj_id: uuid.UUID):
-        result = await session.execute(select(cls).where(cls.id == obj_id))
-        return result.unique().scalar_one_or_none()
+        """Объект по id через кэш; для проверок перед записью - session.get"""
+        cached = await CACHE.get(cls.cache_key(obj_id))
+        if cached is not None:
+            return cls.from_cached(cached)
+        async with short_transaction(session):
+            result = await session.execute(select(cls).where(cls.id_clause(obj_id)))
+        obj = result.unique().scalar_one_or_none()
+        # данные реплики могут отставать: в кэш попадает только основная БД
+        if obj is not None and not session.info.get("replica"):
+            values = {col: getattr(obj, col) for col in cls.__table__.columns.keys()}
+            await CACHE.set(cls.cache_key(obj_id), values, obj.cache_ttl())
+        return obj
 
     @classmethod
     async def update(cls, session: AsyncSession, id: uuid.UUID, **kwargs):
-        stmt = update(cls).where(cls.id == id).values(**kwargs).returning(cls)
+        version = cls.__mapper__.version_id_col
+        if version is not None:
+            kwargs[version.key] = version + 1
+        stmt = update(cls).where(cls.id_clause(id)).values(**kwargs).returning(cls)
         obj = await session.execute(stmt)
         res = obj.scalar()
         if res:
             await session.commit()
+            await CACHE.delete(cls.cache_key(id))
             return res
         await session.rollback()
         return None
 
     @classmethod
     async def delete(cls, session: AsyncSession, obj_id: uuid.UUID):
-        stmt = delete(cls).where(cls.id == obj_id).returning(cls)
+        stmt = delete(cls).where(cls.id_clause(obj_id)).returning(cls)
         res = await session.execute(stmt)
         await session.commit()
+        await CACHE.delete(cls.cache_key(obj_id))
         if res.scalar():
             return True
         return False
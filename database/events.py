@@ -0,0 +1,179 @@
+"""Поток изменений баланса и статусов транзакций.
+
+Триггеры на users и transactions публикуют события через pg_notify в
+канал balance_events; каждый воркер слушает канал на отдельном
+соединении и раздает события подписчикам своего процесса. Номера событий
+берутся из общей последовательности, поэтому Last-Event-ID, полученный
+от одного воркера, понятен и остальным; при шардировании воркер слушает
+каждый шард, а номер события - номер в последовательности шарда, умноженный
+на число шардов, плюс номер шарда. Последние события держатся в кольцевом
+буфере для переподключения клиентов.
+"""
+
+import asyncio
+import json
+import uuid
+from collections import deque
+from typing import AsyncIterator
+
+import asyncpg
+
+from database.db import SHARDS, Shard, close_connection
+from src.config import LOGER
+from src.metrics import Counter, Gauge
+from src.settings import (
+    EVENTS_BUFFER_SIZE,
+    EVENTS_QUEUE_SIZE,
+    EVENTS_HEARTBEAT_SECONDS,
+    EVENTS_RECONNECT_DELAY,
+)
+
+EVENTS_CHANNEL = "balance_events"
+# клиент должен перечитать состояние через GET: часть событий потеряна
+RESET_FRAME = "event: reset\ndata: {}\n\n"
+HEARTBEAT_FRAME = ": ping\n\n"
+
+EVENTS_RECEIVED = Counter(
+    "balance_events_received_total", "Events received from LISTEN", ("event",)
+)
+EVENTS_DROPPED = Counter(
+    "balance_events_subscribers_dropped_total",
+    "Subscribers reset because they fell behind",
+)
+
+
+class _Subscription:
+    """Очередь кадров одного клиента; None - сигнал сброса"""
+
+    def __init__(self, size: int):
+        self.queue: asyncio.Queue[str | None] = asyncio.Queue(size)
+
+    def push(self, frame: str | None) -> None:
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            EVENTS_DROPPED.inc()
+            self.reset()
+
+    def reset(self) -> None:
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+
+class EventBroker:
+    """Раздача событий подписчикам процесса и их повтор по Last-Event-ID"""
+
+    def __init__(self, buffer_size: int, queue_size: int):
+        self._buffer: deque[tuple[int, uuid.UUID, str]] = deque(maxlen=buffer_size)
+        self._queue_size = queue_size
+        self._subscribers: dict[uuid.UUID, set[_Subscription]] = {}
+
+    def subscribers(self) -> int:
+        return sum(len(subs) for subs in self._subscribers.values())
+
+    def publish(self, payload: str, shard: int = 0) -> None:
+        """Принимает уведомление из канала и рассылает его подписчикам"""
+        event = json.loads(payload)
+        event_id = event["id"] * len(SHARDS) + shard
+        user_id = uuid.UUID(event["user_id"])
+        frame = (
+            f"id: {event_id}\nevent: {event['event']}\n"
+            f"data: {json.dumps(event['data'])}\n\n"
+        )
+        EVENTS_RECEIVED.inc(event=event["event"])
+        self._buffer.append((event_id, user_id, frame))
+        for subscription in self._subscribers.get(user_id, ()):
+            subscription.push(frame)
+
+    def reset_all(self) -> None:
+        """События за время потери соединения неизвестны - сбрасываем всех"""
+        self._buffer.clear()
+        for subs in self._subscribers.values():
+            for subscription in subs:
+                subscription.reset()
+
+    def _replay(self, user_id: uuid.UUID, last_event_id: int) -> list[str] | None:
+        """Кадры пользователя после last_event_id в порядке получения.
+
+        Номера выдаются до COMMIT, поэтому приходят не строго по возрастанию:
+        ищем позицию события в буфере, а не сравниваем номера.
+        """
+        frames, found = [], False
+        for event_id, event_user_id, frame in self._buffer:
+            if found and event_user_id == user_id:
+                frames.append(frame)
+            elif event_id == last_event_id:
+                found = True
+        return frames if found else None
+
+    async def subscribe(
+        self, user_id: uuid.UUID, last_event_id: int | None = None
+    ) -> AsyncIterator[str]:
+        """Кадры SSE для пользователя до отключения клиента или сброса"""
+        subscription = _Subscription(self._queue_size)
+        # регистрация и снимок буфера без await между ними: событие не
+        # потеряется и не придет дважды
+        self._subscribers.setdefault(user_id, set()).add(subscription)
+        try:
+            if last_event_id is not None:
+                frames = self._replay(user_id, last_event_id)
+                if frames is None:
+                    yield RESET_FRAME
+                    return
+                for frame in frames:
+                    yield frame
+            while True:
+                try:
+                    frame = await asyncio.wait_for(
+                        subscription.queue.get(), EVENTS_HEARTBEAT_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    yield HEARTBEAT_FRAME
+                    continue
+                if frame is None:
+                    yield RESET_FRAME
+                    return
+                yield frame
+        finally:
+            subs = self._subscribers[user_id]
+            subs.discard(subscription)
+            if not subs:
+                del self._subscribers[user_id]
+
+    async def listen(self, shard: Shard = SHARDS[0]) -> None:
+        """LISTEN на выделенном соединении с переподключением до отмены"""
+        while True:
+            try:
+                connection = await asyncpg.connect(shard.dsn())
+            except (OSError, asyncpg.PostgresError):
+                LOGER.exception("Events listener connection failed")
+                await asyncio.sleep(EVENTS_RECONNECT_DELAY)
+                continue
+            lost = asyncio.Event()
+            connection.add_termination_listener(lambda _: lost.set())
+            try:
+                await connection.add_listener(
+                    EVENTS_CHANNEL, lambda *args: self.publish(args[-1], shard.number)
+                )
+                await lost.wait()
+                LOGER.warning("Events listener connection lost")
+            except (
+                OSError,
+                asyncio.TimeoutError,
+                asyncpg.PostgresError,
+                asyncpg.InterfaceError,
+            ):
+                LOGER.exception("Events listener failed")
+            finally:
+                await close_connection(connection)
+            self.reset_all()
+            await asyncio.sleep(EVENTS_RECONNECT_DELAY)
+
+
+EVENTS = EventBroker(EVENTS_BUFFER_SIZE, EVENTS_QUEUE_SIZE)
+EVENTS_SUBSCRIBERS = Gauge(
+    "balance_events_subscribers",
+    "Open event stream connections",
+    callback=EVENTS.subscribers,
+)
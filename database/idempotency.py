@@ -0,0 +1,155 @@
+"""Хранилище ключей идемпотентности.
+
+Ключ сначала захватывается вставкой строки с пустым ответом, после
+выполнения запроса в нее записывается ответ. Завершенные ответы
+дополнительно держатся в LRU процесса, так что повтор обычно не идет в БД.
+
+Захват без ответа живет IDEMPOTENCY_LEASE_SECONDS: если процесс упал между
+захватом и ответом, повтор того же запроса перехватывает ключ, а не
+получает 409 до очистки. Ответ и снятие захвата проверяют время захвата,
+поэтому запрос, у которого ключ перехватили, не трогает чужую строку.
+"""
+
+import datetime
+
+from sqlalchemy import and_, delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert
+
+from database.cache import MemoryCache
+from database.db import async_session_factory
+from database.models import IdempotencyKey
+from src.metrics import Counter
+from src.config import LOGER
+from src.settings import (
+    IDEMPOTENCY_TTL_SECONDS,
+    IDEMPOTENCY_CACHE_SIZE,
+    IDEMPOTENCY_LEASE_SECONDS,
+)
+
+IDEMPOTENCY_REQUESTS = Counter(
+    "idempotency_requests_total",
+    "Requests carrying an Idempotency-Key",
+    ("operation", "result"),
+)
+
+
+class _KeyCache(MemoryCache):
+    name = "idempotency"
+
+
+class IdempotencyStore:
+    """Захват, сохранение и освобождение ключей идемпотентности"""
+
+    def __init__(self, cache_size: int, ttl: float, lease: float):
+        self._cache = _KeyCache(cache_size)
+        self._ttl = ttl
+        self._lease = lease
+
+    async def claim(
+        self, key: str, operation: str, fingerprint: str
+    ) -> tuple[dict | None, datetime.datetime | None]:
+        """Захватывает ключ.
+
+        Возвращает (None, время захвата), если ключ захвачен этим вызовом,
+        и (запись ключа, None), если он уже занят. Брошенный захват того же
+        запроса перехватывается.
+        """
+        cached = await self._cache.get(IdempotencyKey.cache_key(key))
+        if cached is not None:
+            return cached, None
+        stmt = insert(IdempotencyKey).values(
+            key=key, operation=operation, fingerprint=fingerprint
+        )
+        lease_expired = func.localtimestamp() - datetime.timedelta(seconds=self._lease)
+        async with async_session_factory() as session, session.begin():
+            claimed = await session.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=[IdempotencyKey.key],
+                    set_={"claimed_at": func.now()},
+                    where=and_(
+                        IdempotencyKey.status_code.is_(None),
+                        IdempotencyKey.operation == stmt.excluded.operation,
+                        IdempotencyKey.fingerprint == stmt.excluded.fingerprint,
+                        IdempotencyKey.claimed_at < lease_expired,
+                    ),
+                ).returning(IdempotencyKey.claimed_at)
+            )
+            claimed_at = claimed.scalar()
+            if claimed_at is not None:
+                return None, claimed_at
+            record = await session.execute(
+                select(
+                    IdempotencyKey.operation,
+                    IdempotencyKey.fingerprint,
+                    IdempotencyKey.status_code,
+                    IdempotencyKey.response,
+                ).where(IdempotencyKey.key == key)
+            )
+            record = record.mappings().one_or_none()
+        if record is None:
+            # захват освободили между INSERT и SELECT; считаем ключ занятым
+            return {"operation": operation, "fingerprint": fingerprint}, None
+        record = dict(record)
+        if record["status_code"] is not None:
+            await self._cache.set(IdempotencyKey.cache_key(key), record, self._ttl)
+        return record, None
+
+    async def complete(
+        self,
+        key: str,
+        claimed_at: datetime.datetime,
+        operation: str,
+        fingerprint: str,
+        status_code: int,
+        response: dict | list,
+    ) -> None:
+        """Сохраняет ответ на запрос, если ключ все еще захвачен им"""
+        async with async_session_factory() as session, session.begin():
+            result = await session.execute(
+                update(IdempotencyKey)
+                .where(self._owned(key, claimed_at))
+                .values(status_code=status_code, response=response)
+            )
+        if not result.rowcount:
+            LOGER.warning(f"Idempotency key {key} was taken over, response not stored")
+            return
+        await self._cache.set(
+            IdempotencyKey.cache_key(key),
+            {
+                "operation": operation,
+                "fingerprint": fingerprint,
+                "status_code": status_code,
+                "response": response,
+            },
+            self._ttl,
+        )
+
+    async def release(self, key: str, claimed_at: datetime.datetime) -> None:
+        """Снимает захват, если запрос завершился без сохраняемого ответа"""
+        async with async_session_factory() as session, session.begin():
+            await session.execute(
+                delete(IdempotencyKey).where(self._owned(key, claimed_at))
+            )
+
+    @staticmethod
+    def _owned(key: str, claimed_at: datetime.datetime):
+        """Ключ без ответа, захваченный в claimed_at"""
+        return and_(
+            IdempotencyKey.key == key,
+            IdempotencyKey.status_code.is_(None),
+            IdempotencyKey.claimed_at == claimed_at,
+        )
+
+    async def purge(self) -> int:
+        """Удаляет ключи старше IDEMPOTENCY_TTL_SECONDS"""
+        expired_before = func.localtimestamp() - datetime.timedelta(seconds=self._ttl)
+        async with async_session_factory() as session, session.begin():
+            result = await session.execute(
+                delete(IdempotencyKey).where(IdempotencyKey.created_at < expired_before)
+            )
+        return result.rowcount
+
+
+IDEMPOTENCY = IdempotencyStore(
+    IDEMPOTENCY_CACHE_SIZE, IDEMPOTENCY_TTL_SECONDS, IDEMPOTENCY_LEASE_SECONDS
+)
@@ -0,0 +1,70 @@
+"""Выбор ведущего процесса для фоновых задач.
+
+Задачи, которым достаточно одной копии на развертывание, запускает
+только процесс, удерживающий session-level advisory-блокировку на
+выделенном соединении. Остальные воркеры периодически пытаются ее взять.
+Если соединение ведущего обрывается, сервер снимает блокировку сам, а
+ведущий останавливает задачи, как только заметит обрыв: по закрытию
+соединения или по неответу на проверочный запрос.
+"""
+
+import asyncio
+from typing import Callable
+
+import asyncpg
+
+from database.db import close_connection, driver_dsn
+from src.config import LOGER
+from src.metrics import Gauge
+from src.settings import JOBS_LEADER_RETRY_SECONDS
+
+JOBS_LOCK_KEY = 0x7472_6E73_6C64_72  # "trnsldr"
+
+JOBS_LEADER = Gauge(
+    "background_jobs_leader", "1 if this process runs the background jobs"
+)
+
+
+async def run_as_leader(start: Callable[[], list[asyncio.Task]]) -> None:
+    """Запускает задачи start(), пока процесс ведущий; работает до отмены"""
+    while True:
+        try:
+            connection = await asyncpg.connect(driver_dsn())
+        except (OSError, asyncpg.PostgresError):
+            LOGER.exception("Leader election connection failed")
+            await asyncio.sleep(JOBS_LEADER_RETRY_SECONDS)
+            continue
+        lost = asyncio.Event()
+        connection.add_termination_listener(lambda _: lost.set())
+        tasks = []
+        try:
+            while not await connection.fetchval(
+                "SELECT pg_try_advisory_lock($1)", JOBS_LOCK_KEY
+            ):
+                await asyncio.sleep(JOBS_LEADER_RETRY_SECONDS)
+            LOGER.info("Elected as background jobs leader")
+            JOBS_LEADER.set(1)
+            tasks = start()
+            while not lost.is_set():
+                try:
+                    await asyncio.wait_for(lost.wait(), JOBS_LEADER_RETRY_SECONDS)
+                except asyncio.TimeoutError:
+                    await connection.fetchval(
+                        "SELECT 1", timeout=JOBS_LEADER_RETRY_SECONDS
+                    )
+            LOGER.warning("Background jobs leader connection lost")
+        except (
+            OSError,
+            asyncio.TimeoutError,
+            asyncpg.PostgresError,
+            asyncpg.InterfaceError,
+        ):
+            LOGER.exception("Background jobs leadership lost")
+        finally:
+            JOBS_LEADER.set(0)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            # закрытие соединения снимает блокировку для следующего ведущего
+            await close_connection(connection)
+        await asyncio.sleep(JOBS_LEADER_RETRY_SECONDS)
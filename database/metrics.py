@@ -0,0 +1,70 @@
+"""Метрики операций UoW"""
+
+import functools
+import time
+
+from src.metrics import Counter, Histogram
+
+UOW_OPERATIONS = Counter(
+    "uow_operations_total", "UoW operations by outcome", ("operation", "outcome")
+)
+UOW_OPERATION_SECONDS = Histogram(
+    "uow_operation_duration_seconds",
+    "Duration of UoW operations including DB round trips",
+    ("operation", "outcome"),
+)
+UOW_LOCK_WAIT_SECONDS = Histogram(
+    "uow_lock_wait_seconds",
+    "Time spent acquiring row locks (SELECT ... FOR UPDATE)",
+    ("operation",),
+)
+UOW_CAS_CONFLICTS = Counter(
+    "uow_cas_conflicts_total",
+    "Optimistic updates rejected because the user version changed",
+    ("operation",),
+)
+UOW_CAS_FALLBACKS = Counter(
+    "uow_cas_fallbacks_total",
+    "Operations that exhausted CAS_MAX_RETRIES and took the row lock",
+    ("operation",),
+)
+UOW_RETRIES = Counter(
+    "uow_retries_total",
+    "UoW operations retried after a retryable DB error",
+    ("operation", "reason"),
+)
+UOW_RETRIES_EXHAUSTED = Counter(
+    "uow_retries_exhausted_total",
+    "UoW operations that ran out of retry budget",
+    ("operation", "reason"),
+)
+
+
+def observe_operation(operation: str):
+    """Декоратор метода UoW: длительность и результат операции.
+
+    Результат берется из self._outcome, который выставляет метод;
+    иначе ok/none по возвращаемому значению или error при исключении.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            self._operation, self._outcome = operation, None
+            started = time.perf_counter()
+            outcome = "error"
+            try:
+                result = await func(self, *args, **kwargs)
+                outcome = "ok" if result is not None else "none"
+                return result
+            finally:
+                if self._outcome is not None:
+                    outcome = self._outcome.value
+                UOW_OPERATIONS.inc(operation=operation, outcome=outcome)
+                UOW_OPERATION_SECONDS.observe(
+                    time.perf_counter() - started, operation=operation, outcome=outcome
+                )
+
+        return wrapper
+
+    return decorator
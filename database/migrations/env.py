@@ -7,7 +7,14 @@ from alembic import context
 
 from src.settings import REAL_DATABASE_URL
 from database.db import Base
-from database.models import User, Transaction
+from database.models import (
+    User,
+    Transaction,
+    IdempotencyKey,
+    BalanceLedger,
+    ShardBucket,
+)
+from database.partitions import PARTITION_NAME
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -27,6 +34,13 @@ if config.config_file_name is not None:
 # target_metadata = mymodel.Base.metadata
 target_metadata = Base.metadata
 
+
+def include_object(object, name, type_, reflected, compare_to):
+    """Секции transactions и их индексы создает jobs.maintain_partitions"""
+    table = object if type_ == "table" else getattr(object, "table", None)
+    return table is None or not PARTITION_NAME.match(table.name)
+
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -51,6 +65,7 @@ def run_migrations_offline() -> None:
         target_metadata=target_metadata,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
+        include_object=include_object,
     )
 
     with context.begin_transaction():
@@ -71,7 +86,11 @@ def run_migrations_online() -> None:
     )
 
     with connectable.connect() as connection:
-        context.configure(connection=connection, target_metadata=target_metadata)
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            include_object=include_object,
+        )
 
         with context.begin_transaction():
             context.run_migrations()
@@ -0,0 +1,124 @@
+"""balance ledger
+
+Revision ID: 28d40483a974
+Revises: b6f2c81d4e05
+Create Date: 2026-10-18 19:02:13.409861
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "28d40483a974"
+down_revision: Union[str, Sequence[str], None] = "b6f2c81d4e05"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "balance_ledger",
+        sa.Column("id", sa.BigInteger(), sa.Identity(always=False), nullable=False),
+        sa.Column("user_id", sa.UUID(), nullable=False),
+        sa.Column("delta", sa.Integer(), nullable=False),
+        sa.Column("balance_after", sa.Integer(), nullable=False),
+        sa.Column(
+            "created_at",
+            sa.DateTime(),
+            server_default=sa.text("clock_timestamp()::timestamp"),
+            nullable=False,
+        ),
+        # журнал не удаляется вместе с пользователем
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="RESTRICT"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_balance_ledger_user_created",
+        "balance_ledger",
+        ["user_id", sa.literal_column("created_at DESC"), sa.literal_column("id DESC")],
+        unique=False,
+    )
+    op.execute(
+        """
+        CREATE FUNCTION record_balance_ledger() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO balance_ledger (user_id, delta, balance_after, created_at)
+            VALUES (
+                NEW.id,
+                NEW.current_balance - CASE
+                    WHEN TG_OP = 'INSERT' THEN 0 ELSE OLD.current_balance
+                END,
+                NEW.current_balance,
+                clock_timestamp()::timestamp
+            );
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER users_balance_ledger_insert
+        AFTER INSERT ON users
+        FOR EACH ROW
+        EXECUTE FUNCTION record_balance_ledger()
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER users_balance_ledger_update
+        AFTER UPDATE OF current_balance ON users
+        FOR EACH ROW
+        WHEN (OLD.current_balance IS DISTINCT FROM NEW.current_balance)
+        EXECUTE FUNCTION record_balance_ledger()
+        """
+    )
+    op.execute(
+        """
+        CREATE FUNCTION forbid_ledger_update() RETURNS trigger AS $$
+        BEGIN
+            RAISE EXCEPTION 'balance_ledger is append-only';
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER balance_ledger_append_only
+        BEFORE UPDATE OR DELETE ON balance_ledger
+        FOR EACH ROW
+        EXECUTE FUNCTION forbid_ledger_update()
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER balance_ledger_no_truncate
+        BEFORE TRUNCATE ON balance_ledger
+        FOR EACH STATEMENT
+        EXECUTE FUNCTION forbid_ledger_update()
+        """
+    )
+    # история до миграции неизвестна: открывающая запись с текущим балансом
+    op.execute(
+        """
+        INSERT INTO balance_ledger (user_id, delta, balance_after)
+        SELECT id, current_balance, current_balance FROM users
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER users_balance_ledger_update ON users")
+    op.execute("DROP TRIGGER users_balance_ledger_insert ON users")
+    op.execute("DROP FUNCTION record_balance_ledger()")
+    op.execute("DROP TRIGGER balance_ledger_no_truncate ON balance_ledger")
+    op.execute("DROP TRIGGER balance_ledger_append_only ON balance_ledger")
+    op.execute("DROP FUNCTION forbid_ledger_update()")
+    op.drop_index("ix_balance_ledger_user_created", table_name="balance_ledger")
+    op.drop_table("balance_ledger")
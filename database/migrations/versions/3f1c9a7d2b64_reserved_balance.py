@@ -0,0 +1,53 @@
+"""reserved balance counters
+
+Revision ID: 3f1c9a7d2b64
+Revises: 56794b2950ec
+Create Date: 2026-10-18 10:12:41.118203
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "3f1c9a7d2b64"
+down_revision: Union[str, Sequence[str], None] = "56794b2950ec"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "users",
+        sa.Column("reserved_debit", sa.Integer(), server_default="0", nullable=False),
+    )
+    op.add_column(
+        "users",
+        sa.Column("reserved_credit", sa.Integer(), server_default="0", nullable=False),
+    )
+    op.execute(
+        """
+        UPDATE users
+        SET reserved_debit = pending.debit,
+            reserved_credit = pending.credit
+        FROM (
+            SELECT user_id,
+                SUM(CASE WHEN amount < 0 THEN -amount ELSE 0 END) AS debit,
+                SUM(CASE WHEN amount > 0 THEN amount ELSE 0 END) AS credit
+            FROM transactions
+            WHERE status = 'PENDING'
+            GROUP BY user_id
+        ) AS pending
+        WHERE users.id = pending.user_id
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("users", "reserved_credit")
+    op.drop_column("users", "reserved_debit")
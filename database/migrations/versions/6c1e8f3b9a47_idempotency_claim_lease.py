@@ -0,0 +1,37 @@
+"""idempotency claim lease
+
+Revision ID: 6c1e8f3b9a47
+Revises: d2c8f4a17e60
+Create Date: 2026-10-19 10:14:52.318406
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "6c1e8f3b9a47"
+down_revision: Union[str, Sequence[str], None] = "d2c8f4a17e60"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "idempotency_keys",
+        sa.Column(
+            "claimed_at",
+            sa.DateTime(),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("idempotency_keys", "claimed_at")
@@ -0,0 +1,47 @@
+"""transaction indexes
+
+Revision ID: 8b2e4d61c0f7
+Revises: 3f1c9a7d2b64
+Create Date: 2026-10-18 11:03:17.502961
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "8b2e4d61c0f7"
+down_revision: Union[str, Sequence[str], None] = "3f1c9a7d2b64"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        "ix_transactions_user_created",
+        "transactions",
+        ["user_id", sa.text("created_at DESC"), sa.text("id DESC")],
+    )
+    op.create_index(
+        "ix_transactions_pending_user",
+        "transactions",
+        ["user_id", "amount"],
+        postgresql_where=sa.text("status = 'PENDING'"),
+    )
+    op.create_index(
+        "ix_transactions_pending_deadline",
+        "transactions",
+        [sa.text("(created_at + INTERVAL '1 second' * timeout_seconds)")],
+        postgresql_where=sa.text("status = 'PENDING'"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_transactions_pending_deadline", table_name="transactions")
+    op.drop_index("ix_transactions_pending_user", table_name="transactions")
+    op.drop_index("ix_transactions_user_created", table_name="transactions")
@@ -0,0 +1,86 @@
+"""ledger statement insert trigger
+
+Revision ID: a81c5e2f9d36
+Revises: f3a7d09c5b21
+Create Date: 2026-10-18 21:05:37.184520
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "a81c5e2f9d36"
+down_revision: Union[str, Sequence[str], None] = "f3a7d09c5b21"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # открывающие записи журнала одной командой на INSERT/COPY, а не
+    # вызовом функции на каждую строку
+    op.execute("DROP TRIGGER users_balance_ledger_insert ON users")
+    op.execute(
+        """
+        CREATE FUNCTION record_balance_ledger_insert() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO balance_ledger (user_id, delta, balance_after, created_at)
+            SELECT id, current_balance, current_balance, clock_timestamp()::timestamp
+            FROM inserted;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER users_balance_ledger_insert
+        AFTER INSERT ON users
+        REFERENCING NEW TABLE AS inserted
+        FOR EACH STATEMENT
+        EXECUTE FUNCTION record_balance_ledger_insert()
+        """
+    )
+    # журнал только дополняется: для БД, где 28d40483a974 применена до
+    # запрета DELETE и с каскадным удалением журнала вместе с пользователем
+    op.execute(
+        """
+        CREATE OR REPLACE TRIGGER balance_ledger_append_only
+        BEFORE UPDATE OR DELETE ON balance_ledger
+        FOR EACH ROW
+        EXECUTE FUNCTION forbid_ledger_update()
+        """
+    )
+    op.execute(
+        """
+        CREATE OR REPLACE TRIGGER balance_ledger_no_truncate
+        BEFORE TRUNCATE ON balance_ledger
+        FOR EACH STATEMENT
+        EXECUTE FUNCTION forbid_ledger_update()
+        """
+    )
+    op.execute(
+        """
+        ALTER TABLE balance_ledger
+        DROP CONSTRAINT balance_ledger_user_id_fkey,
+        ADD CONSTRAINT balance_ledger_user_id_fkey
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE RESTRICT
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER users_balance_ledger_insert ON users")
+    op.execute("DROP FUNCTION record_balance_ledger_insert()")
+    op.execute(
+        """
+        CREATE TRIGGER users_balance_ledger_insert
+        AFTER INSERT ON users
+        FOR EACH ROW
+        EXECUTE FUNCTION record_balance_ledger()
+        """
+    )
@@ -0,0 +1,112 @@
+"""balance events
+
+Revision ID: b6f2c81d4e05
+Revises: 9d41f6b8a2e7
+Create Date: 2026-10-18 18:20:44.731052
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "b6f2c81d4e05"
+down_revision: Union[str, Sequence[str], None] = "9d41f6b8a2e7"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE SEQUENCE balance_events_id_seq")
+    # уведомление уходит слушателям только после COMMIT; отключается
+    # для соединения через app.balance_events = off
+    op.execute(
+        """
+        CREATE FUNCTION notify_balance_event() RETURNS trigger AS $$
+        DECLARE
+            data jsonb;
+        BEGIN
+            IF current_setting('app.balance_events', true) = 'off' THEN
+                RETURN NULL;
+            END IF;
+            IF TG_TABLE_NAME = 'users' THEN
+                data := jsonb_build_object(
+                    'id', NEW.id,
+                    'current_balance', NEW.current_balance,
+                    'max_balance', NEW.max_balance,
+                    'reserved_debit', NEW.reserved_debit,
+                    'reserved_credit', NEW.reserved_credit
+                );
+                PERFORM pg_notify('balance_events', jsonb_build_object(
+                    'id', nextval('balance_events_id_seq'),
+                    'event', 'balance',
+                    'user_id', NEW.id,
+                    'data', data
+                )::text);
+            ELSE
+                data := jsonb_build_object(
+                    'id', NEW.id,
+                    'user_id', NEW.user_id,
+                    'amount', NEW.amount,
+                    'status', lower(NEW.status::text),
+                    'timeout_seconds', NEW.timeout_seconds,
+                    'created_at', NEW.created_at,
+                    'updated_at', NEW.updated_at,
+                    'expires_at', NEW.expires_at
+                );
+                PERFORM pg_notify('balance_events', jsonb_build_object(
+                    'id', nextval('balance_events_id_seq'),
+                    'event', 'transaction',
+                    'user_id', NEW.user_id,
+                    'data', data
+                )::text);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER users_balance_event
+        AFTER UPDATE ON users
+        FOR EACH ROW
+        WHEN (
+            (OLD.current_balance, OLD.max_balance,
+             OLD.reserved_debit, OLD.reserved_credit)
+            IS DISTINCT FROM
+            (NEW.current_balance, NEW.max_balance,
+             NEW.reserved_debit, NEW.reserved_credit)
+        )
+        EXECUTE FUNCTION notify_balance_event()
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER transactions_created_event
+        AFTER INSERT ON transactions
+        FOR EACH ROW
+        EXECUTE FUNCTION notify_balance_event()
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER transactions_status_event
+        AFTER UPDATE OF status ON transactions
+        FOR EACH ROW
+        WHEN (OLD.status IS DISTINCT FROM NEW.status)
+        EXECUTE FUNCTION notify_balance_event()
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER transactions_status_event ON transactions")
+    op.execute("DROP TRIGGER transactions_created_event ON transactions")
+    op.execute("DROP TRIGGER users_balance_event ON users")
+    op.execute("DROP FUNCTION notify_balance_event()")
+    op.execute("DROP SEQUENCE balance_events_id_seq")
@@ -0,0 +1,69 @@
+"""transaction expires_at
+
+Revision ID: c47a0e9d15b3
+Revises: 8b2e4d61c0f7
+Create Date: 2026-10-18 13:41:52.774310
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c47a0e9d15b3"
+down_revision: Union[str, Sequence[str], None] = "8b2e4d61c0f7"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # STORED generated column: существующие строки заполняются при добавлении
+    op.add_column(
+        "transactions",
+        sa.Column(
+            "expires_at",
+            sa.DateTime(),
+            sa.Computed(
+                "created_at + INTERVAL '1 second' * timeout_seconds", persisted=True
+            ),
+            nullable=True,
+        ),
+    )
+    op.drop_index("ix_transactions_pending_deadline", table_name="transactions")
+    op.drop_index("ix_transactions_pending_user", table_name="transactions")
+    op.create_index(
+        "ix_transactions_pending_user",
+        "transactions",
+        ["user_id", "expires_at"],
+        postgresql_include=["amount"],
+        postgresql_where=sa.text("status = 'PENDING'"),
+    )
+    op.create_index(
+        "ix_transactions_pending_expires",
+        "transactions",
+        ["expires_at"],
+        postgresql_where=sa.text("status = 'PENDING'"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_transactions_pending_expires", table_name="transactions")
+    op.drop_index("ix_transactions_pending_user", table_name="transactions")
+    op.create_index(
+        "ix_transactions_pending_user",
+        "transactions",
+        ["user_id", "amount"],
+        postgresql_where=sa.text("status = 'PENDING'"),
+    )
+    op.create_index(
+        "ix_transactions_pending_deadline",
+        "transactions",
+        [sa.text("(created_at + INTERVAL '1 second' * timeout_seconds)")],
+        postgresql_where=sa.text("status = 'PENDING'"),
+    )
+    op.drop_column("transactions", "expires_at")
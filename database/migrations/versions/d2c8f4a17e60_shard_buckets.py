@@ -0,0 +1,37 @@
+"""shard buckets
+
+Revision ID: d2c8f4a17e60
+Revises: a81c5e2f9d36
+Create Date: 2026-10-18 22:41:09.613275
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "d2c8f4a17e60"
+down_revision: Union[str, Sequence[str], None] = "a81c5e2f9d36"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "shard_buckets",
+        sa.Column("bucket", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("shard", sa.Integer(), nullable=False),
+        sa.Column(
+            "moving", sa.Boolean(), server_default=sa.text("false"), nullable=False
+        ),
+        sa.PrimaryKeyConstraint("bucket"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("shard_buckets")
@@ -0,0 +1,32 @@
+"""user version
+
+Revision ID: e5a93c7f2d18
+Revises: c47a0e9d15b3
+Create Date: 2026-10-18 16:05:27.118904
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "e5a93c7f2d18"
+down_revision: Union[str, Sequence[str], None] = "c47a0e9d15b3"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "users",
+        sa.Column("version", sa.Integer(), server_default="1", nullable=False),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("users", "version")
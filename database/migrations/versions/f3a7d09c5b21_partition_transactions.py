@@ -0,0 +1,167 @@
+"""partition transactions
+
+Revision ID: f3a7d09c5b21
+Revises: 28d40483a974
+Create Date: 2026-10-18 20:14:51.620378
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "f3a7d09c5b21"
+down_revision: Union[str, Sequence[str], None] = "28d40483a974"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = "id, user_id, amount, status, created_at, updated_at, timeout_seconds"
+TABLE = """
+    CREATE TABLE transactions (
+        id UUID NOT NULL,
+        user_id UUID NOT NULL
+            CONSTRAINT transactions_user_id_fkey
+            REFERENCES users (id) ON DELETE CASCADE,
+        amount INTEGER NOT NULL,
+        status transactionstatus NOT NULL,
+        created_at TIMESTAMP WITHOUT TIME ZONE {created_at},
+        updated_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now(),
+        timeout_seconds INTEGER NOT NULL,
+        expires_at TIMESTAMP WITHOUT TIME ZONE GENERATED ALWAYS AS
+            (created_at + INTERVAL '1 second' * timeout_seconds) STORED,
+        PRIMARY KEY ({primary_key})
+    ) {partitioning}
+"""
+INDEXES = (
+    "CREATE INDEX ix_transactions_user_created"
+    " ON transactions (user_id, created_at DESC, id DESC)",
+    "CREATE INDEX ix_transactions_pending_user"
+    " ON transactions (user_id, expires_at) INCLUDE (amount)"
+    " WHERE status = 'PENDING'",
+    "CREATE INDEX ix_transactions_pending_expires"
+    " ON transactions (expires_at) WHERE status = 'PENDING'",
+)
+TRIGGERS = (
+    """
+    CREATE TRIGGER transactions_created_event
+    AFTER INSERT ON transactions
+    FOR EACH ROW
+    EXECUTE FUNCTION notify_balance_event()
+    """,
+    """
+    CREATE TRIGGER transactions_status_event
+    AFTER UPDATE OF status ON transactions
+    FOR EACH ROW
+    WHEN (OLD.status IS DISTINCT FROM NEW.status)
+    EXECUTE FUNCTION notify_balance_event()
+    """,
+)
+
+
+def _replace_table(created_at: str, primary_key: str, partitioning: str) -> None:
+    """Пересоздает transactions и переносит в нее строки старой таблицы"""
+    op.execute("ALTER TABLE transactions RENAME TO transactions_old")
+    for name in (
+        "transactions_pkey",
+        "ix_transactions_user_created",
+        "ix_transactions_pending_user",
+        "ix_transactions_pending_expires",
+    ):
+        op.execute(f"ALTER INDEX {name} RENAME TO {name}_old")
+    op.execute(
+        "ALTER TABLE transactions_old RENAME CONSTRAINT"
+        " transactions_user_id_fkey TO transactions_user_id_fkey_old"
+    )
+    op.execute(
+        TABLE.format(
+            created_at=created_at, primary_key=primary_key, partitioning=partitioning
+        )
+    )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("LOCK TABLE transactions IN EXCLUSIVE MODE")
+    _replace_table(
+        "NOT NULL DEFAULT now()", "id, created_at", "PARTITION BY RANGE (created_at)"
+    )
+    # месячные секции от самой старой строки до трех месяцев вперед;
+    # дальше их создает jobs.maintain_partitions
+    op.execute(
+        """
+        DO $$
+        DECLARE
+            month TIMESTAMP := date_trunc(
+                'month', COALESCE(
+                    (SELECT min(COALESCE(created_at, updated_at)) FROM transactions_old),
+                    LOCALTIMESTAMP
+                )
+            );
+        BEGIN
+            WHILE month <= date_trunc('month', LOCALTIMESTAMP) + INTERVAL '3 months'
+            LOOP
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF transactions'
+                    ' FOR VALUES FROM (%L) TO (%L)',
+                    'transactions_p' || to_char(month, 'YYYYMM'),
+                    month, month + INTERVAL '1 month'
+                );
+                month := month + INTERVAL '1 month';
+            END LOOP;
+        END $$
+        """
+    )
+    for statement in INDEXES:
+        op.execute(statement)
+    op.execute(
+        f"""
+        INSERT INTO transactions ({COLUMNS})
+        SELECT id, user_id, amount, status, COALESCE(created_at, updated_at),
+            updated_at, timeout_seconds
+        FROM transactions_old
+        """
+    )
+    op.execute("DROP TABLE transactions_old")
+    for statement in TRIGGERS:
+        op.execute(statement)
+    op.execute("CREATE SCHEMA transactions_archive")
+    op.execute("ANALYZE transactions")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("LOCK TABLE transactions IN EXCLUSIVE MODE")
+    _replace_table("DEFAULT now()", "id", "")
+    for statement in INDEXES:
+        op.execute(statement)
+    op.execute(
+        f"INSERT INTO transactions ({COLUMNS}) SELECT {COLUMNS} FROM transactions_old"
+    )
+    # архивные секции (jobs.maintain_partitions) возвращаются в таблицу,
+    # иначе их строки пропали бы вместе со схемой
+    op.execute(
+        f"""
+        DO $$
+        DECLARE
+            archived TEXT;
+        BEGIN
+            FOR archived IN
+                SELECT tablename FROM pg_tables
+                WHERE schemaname = 'transactions_archive'
+            LOOP
+                EXECUTE format(
+                    'INSERT INTO transactions ({COLUMNS})'
+                    ' SELECT {COLUMNS} FROM transactions_archive.%I',
+                    archived
+                );
+                EXECUTE format('DROP TABLE transactions_archive.%I', archived);
+            END LOOP;
+        END $$
+        """
+    )
+    op.execute("DROP TABLE transactions_old")
+    for statement in TRIGGERS:
+        op.execute(statement)
+    op.execute("DROP SCHEMA transactions_archive")
@@ -1,3 +1,6 @@
 from database.models.user import User
 from database.models.transaction import Transaction
-from database.models.settings import TransactionStatus
+from database.models.idempotency import IdempotencyKey
+from database.models.ledger import BalanceLedger
+from database.models.shard import ShardBucket
+from database.models.settings import TransactionStatus, OperationOutcome
@@ -0,0 +1,29 @@
+import datetime
+
+from sqlalchemy import String, Integer, Index, func
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Mapped, mapped_column
+
+from database.db import Base
+from database.models.settings import CreatedAT
+
+
+class IdempotencyKey(Base):
+    """Ключ идемпотентности и сохраненный ответ на запрос"""
+
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (Index("ix_idempotency_keys_created", "created_at"),)
+
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    operation: Mapped[str] = mapped_column(String(64), nullable=False)
+    fingerprint: Mapped[str] = mapped_column(String(64), nullable=False)
+    # пустые, пока запрос с этим ключом выполняется
+    status_code: Mapped[int | None] = mapped_column(Integer)
+    response: Mapped[dict | list | None] = mapped_column(JSONB)
+    created_at: Mapped[CreatedAT]
+    # захват без ответа старше IDEMPOTENCY_LEASE_SECONDS считается брошенным
+    claimed_at: Mapped[datetime.datetime] = mapped_column(server_default=func.now())
+
+    @classmethod
+    def cache_key(cls, key: str) -> str:
+        return f"{cls.__tablename__}:{key}"
@@ -0,0 +1,40 @@
+import datetime
+import uuid
+
+from sqlalchemy import BigInteger, ForeignKey, Identity, Integer, Index, text
+from sqlalchemy.orm import Mapped, mapped_column
+
+from database.db import Base
+
+
+class BalanceLedger(Base):
+    """Запись журнала изменений current_balance.
+
+    Строки добавляет триггер на users в той же транзакции, что и изменение
+    баланса; balance_after позволяет получить баланс на момент времени
+    одной записью без агрегации всей истории. Журнал только дополняется:
+    UPDATE, DELETE и TRUNCATE запрещены триггерами, а пользователя с
+    записями в журнале удалить нельзя.
+    """
+
+    __tablename__ = "balance_ledger"
+    __table_args__ = (
+        Index(
+            "ix_balance_ledger_user_created",
+            "user_id",
+            text("created_at DESC"),
+            text("id DESC"),
+        ),
+    )
+
+    id: Mapped[int] = mapped_column(BigInteger, Identity(), primary_key=True)
+    user_id: Mapped[uuid.UUID] = mapped_column(
+        ForeignKey("users.id", ondelete="RESTRICT"), nullable=False
+    )
+    delta: Mapped[int] = mapped_column(Integer, nullable=False)
+    balance_after: Mapped[int] = mapped_column(Integer, nullable=False)
+    # clock_timestamp() в триггере: время после взятия блокировки строки,
+    # а не начала транзакции, поэтому порядок совпадает с порядком записей
+    created_at: Mapped[datetime.datetime] = mapped_column(
+        server_default=text("clock_timestamp()::timestamp"), nullable=False
+    )
@@ -1,5 +1,8 @@
 import datetime
 import enum
+import os
+import time
+import uuid
 from typing import Annotated
 
 from sqlalchemy import func
@@ -20,3 +23,40 @@ class TransactionStatus(enum.Enum):
     CONFIRMED = "confirmed"
     CANCELED = "canceled"
     EXPIRED = "expired"
+
+
+class OperationOutcome(enum.Enum):
+    """Результат операции над транзакцией"""
+
+    CREATED = "created"
+    CONFIRMED = "confirmed"
+    CANCELED = "canceled"
+    NOT_FOUND = "not_found"
+    INVALID_STATUS = "invalid_status"
+    INSUFFICIENT_FUNDS = "insufficient_funds"
+    MAX_BALANCE_EXCEEDED = "max_balance_exceeded"
+    EXPIRED = "expired"
+    # часть пачки на другом шарде не выполнена; ее можно повторить
+    UNAVAILABLE = "unavailable"
+
+
+def uuid7(key: uuid.UUID | None = None) -> uuid.UUID:
+    """UUID версии 7: старшие 48 бит - время создания в миллисекундах.
+
+    С key младшие 32 бита берутся из него: id транзакции попадает в тот
+    же бакет шардирования, что и ее пользователь (database/shards.py).
+    """
+    value = (time.time_ns() // 1_000_000) << 80
+    value |= int.from_bytes(os.urandom(10), "big") & ((1 << 80) - 1)
+    if key is not None:
+        value = value & ~0xFFFF_FFFF | key.int & 0xFFFF_FFFF
+    value &= ~(0xF << 76) & ~(0x3 << 62)
+    value |= (0x7 << 76) | (0x2 << 62)
+    return uuid.UUID(int=value)
+
+
+def uuid7_seconds(value: uuid.UUID) -> float | None:
+    """Время создания UUIDv7 в секундах Unix; None для других версий"""
+    if value.version != 7:
+        return None
+    return (value.int >> 80) / 1000
@@ -0,0 +1,21 @@
+from sqlalchemy import Boolean, Integer
+from sqlalchemy.orm import Mapped, mapped_column
+
+from database.db import Base
+
+
+class ShardBucket(Base):
+    """Закрепление бакета шардирования за шардом, см. database/shards.py.
+
+    Таблица читается только на первом шарде; бакет без строки живет на
+    первом шарде.
+    """
+
+    __tablename__ = "shard_buckets"
+
+    bucket: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    shard: Mapped[int] = mapped_column(Integer, nullable=False)
+    # записи в бакет запрещены, пока его данные копируются на другой шард
+    moving: Mapped[bool] = mapped_column(
+        Boolean, default=False, server_default="false", nullable=False
+    )
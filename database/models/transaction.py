@@ -1,27 +1,129 @@
+import datetime
 import uuid
 
-from sqlalchemy import ForeignKey, UUID, Integer
+from sqlalchemy import (
+    ForeignKey,
+    UUID,
+    Integer,
+    Index,
+    Computed,
+    DateTime,
+    and_,
+    func,
+    literal_column,
+    text,
+)
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from database.db import Base
 from database.models.user import User
-from database.models.settings import TransactionStatus, CreatedAT, UpdatedAT
+from database.models.settings import (
+    TransactionStatus,
+    UpdatedAT,
+    uuid7,
+    uuid7_seconds,
+)
+from src.settings import TRANSACTION_ID_CLOCK_SKEW_SECONDS
+
+# условие частичных индексов; в запросах используется литералом,
+# чтобы планировщик мог сопоставить его с предикатом индекса
+PENDING_CONDITION = "status = 'PENDING'"
+DEADLINE_EXPRESSION = "created_at + INTERVAL '1 second' * timeout_seconds"
+TERMINAL_STATUSES = (
+    TransactionStatus.CONFIRMED,
+    TransactionStatus.CANCELED,
+    TransactionStatus.EXPIRED,
+)
+
+
+def _from_unix(seconds: float):
+    """Время Unix как timestamp без зоны в часовом поясе сессии, как now()"""
+    return func.to_timestamp(seconds).cast(DateTime)
 
 
 class Transaction(Base):
     """Object transaction DB"""
 
     __tablename__ = "transactions"
+    __table_args__ = (
+        Index(
+            "ix_transactions_user_created",
+            "user_id",
+            text("created_at DESC"),
+            text("id DESC"),
+        ),
+        Index(
+            "ix_transactions_pending_user",
+            "user_id",
+            "expires_at",
+            postgresql_include=["amount"],
+            postgresql_where=text(PENDING_CONDITION),
+        ),
+        Index(
+            "ix_transactions_pending_expires",
+            "expires_at",
+            postgresql_where=text(PENDING_CONDITION),
+        ),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+    # expires_at вычисляется в БД; забираем его через RETURNING и на UPDATE
+    __mapper_args__ = {"eager_defaults": True}
+
     id: Mapped[uuid.UUID] = mapped_column(
-        UUID(as_uuid=True), primary_key=True, default=uuid.uuid4
+        UUID(as_uuid=True), primary_key=True, default=uuid7
     )
     user_id: Mapped[uuid.UUID] = mapped_column(
         ForeignKey("users.id", ondelete="CASCADE"), nullable=False
     )
     amount: Mapped[int] = mapped_column(Integer, nullable=False)
     status: Mapped[TransactionStatus]
-    created_at: Mapped[CreatedAT]
+    # ключ секционирования по месяцам, поэтому входит в первичный ключ
+    created_at: Mapped[datetime.datetime] = mapped_column(
+        primary_key=True, server_default=func.now()
+    )
     updated_at: Mapped[UpdatedAT]
     timeout_seconds: Mapped[int] = mapped_column(Integer, default=300, nullable=False)
+    expires_at: Mapped[datetime.datetime | None] = mapped_column(
+        Computed(DEADLINE_EXPRESSION, persisted=True)
+    )
 
     user: Mapped[User] = relationship(back_populates="transactions")
+
+    def cache_ttl(self) -> float | None:
+        """Транзакции в конечном статусе неизменяемы и кэшируются без срока"""
+        if self.status in TERMINAL_STATUSES:
+            return None
+        return super().cache_ttl()
+
+    @classmethod
+    def id_clause(cls, obj_id: uuid.UUID):
+        return cls.ids_clause([obj_id])
+
+    @classmethod
+    def ids_clause(cls, ids: list[uuid.UUID]):
+        """Условие по id с границами created_at для отсечения секций.
+
+        Время создания берется из UUIDv7 с запасом на расхождение часов
+        приложения и БД; для id других версий границ нет, и проверяются
+        все секции.
+        """
+        clause = cls.id == ids[0] if len(ids) == 1 else cls.id.in_(ids)
+        seconds = [uuid7_seconds(obj_id) for obj_id in ids]
+        if not seconds or None in seconds:
+            return clause
+        return and_(
+            clause,
+            cls.created_at
+            >= _from_unix(min(seconds) - TRANSACTION_ID_CLOCK_SKEW_SECONDS),
+            cls.created_at
+            < _from_unix(max(seconds) + TRANSACTION_ID_CLOCK_SKEW_SECONDS),
+        )
+
+    @classmethod
+    def is_pending(cls, entity=None):
+        """Условие PENDING, совпадающее с предикатом частичных индексов.
+
+        entity - псевдоним таблицы (aliased), если запрос идет не по ней самой.
+        """
+        entity = cls if entity is None else entity
+        return entity.status == literal_column(f"'{TransactionStatus.PENDING.name}'")
@@ -15,7 +15,17 @@ class User(Base):
     )
     current_balance: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
     max_balance: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    reserved_debit: Mapped[int] = mapped_column(
+        Integer, default=0, server_default="0", nullable=False
+    )
+    reserved_credit: Mapped[int] = mapped_column(
+        Integer, default=0, server_default="0", nullable=False
+    )
+    # увеличивается при каждом изменении строки, см. CONCURRENCY_MODE
+    version: Mapped[int] = mapped_column(Integer, server_default="1", nullable=False)
 
     transactions: Mapped[list["Transaction"]] = relationship(
         back_populates="user", uselist=True
     )
+
+    __mapper_args__ = {"version_id_col": version}
@@ -0,0 +1,182 @@
+"""Обслуживание месячных секций таблицы transactions.
+
+Секции называются transactions_pYYYYMM. Будущие секции создаются заранее,
+чтобы вставка никогда не упиралась в отсутствующий диапазон; секции
+старше срока хранения отсоединяются (DETACH ... CONCURRENTLY) и
+переносятся в схему transactions_archive, откуда их можно выгрузить или
+удалить. Секция, в которой еще есть PENDING транзакции, не трогается.
+
+DDL выполняется в режиме autocommit с коротким lock_timeout: если
+блокировку таблицы взять не удалось, попытка повторится при следующем
+запуске, а не встанет в очередь перед запросами приложения.
+"""
+
+import asyncio
+import datetime
+import re
+
+from sqlalchemy import func, select, text
+from sqlalchemy.exc import DBAPIError
+
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from database.db import async_engine
+from src.config import LOGER
+from src.metrics import Counter
+from src.settings import (
+    DB_LOCK_TIMEOUTS,
+    TRANSACTION_PARTITIONS_AHEAD,
+    TRANSACTION_RETENTION_MONTHS,
+)
+
+PARTITION_LOCK_KEY = 0x7472_6E73_7061_72  # "trnspar"
+ARCHIVE_SCHEMA = "transactions_archive"
+PARTITION_NAME = re.compile(r"^transactions_p(\d{4})(\d{2})$")
+LIST_PARTITIONS = text(
+    """
+    SELECT c.relname, i.inhdetachpending
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = 'transactions'::regclass
+    """
+)
+
+PARTITION_CHANGES = Counter(
+    "transaction_partitions_changed_total",
+    "Partitions created or archived by maintenance",
+    ("action",),
+)
+
+
+def add_months(month: datetime.date, months: int) -> datetime.date:
+    index = month.year * 12 + month.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: datetime.date) -> str:
+    return f"transactions_p{month:%Y%m}"
+
+
+async def maintain_partitions(
+    ahead: int = TRANSACTION_PARTITIONS_AHEAD,
+    retention_months: int = TRANSACTION_RETENTION_MONTHS,
+    engine: AsyncEngine = async_engine,
+) -> dict[str, list[str]]:
+    """Создает секции на ahead месяцев вперед и архивирует устаревшие.
+
+    retention_months = 0 отключает архивацию. Между воркерами работа
+    разделяется advisory-блокировкой: выполняет ее только один из них.
+    """
+    changes = {"created": [], "archived": []}
+    async with engine.connect() as connection:
+        connection = await connection.execution_options(isolation_level="AUTOCOMMIT")
+        locked = await connection.scalar(
+            select(func.pg_try_advisory_lock(PARTITION_LOCK_KEY))
+        )
+        if not locked:
+            return changes
+        try:
+            await connection.execute(
+                select(
+                    func.set_config(
+                        "lock_timeout",
+                        str(DB_LOCK_TIMEOUTS.get("maintain_partitions", 1000)),
+                        False,
+                    )
+                )
+            )
+            today = await connection.scalar(select(func.current_date()))
+            current = today.replace(day=1)
+            attached = await _attached(connection)
+            for offset in range(ahead + 1):
+                month = add_months(current, offset)
+                if month in attached:
+                    continue
+                if await _create(connection, month):
+                    changes["created"].append(partition_name(month))
+            if retention_months > 0:
+                horizon = add_months(current, -retention_months)
+                for month, detach_pending in sorted(attached.items()):
+                    if add_months(month, 1) > horizon:
+                        continue
+                    if await _archive(connection, month, detach_pending):
+                        changes["archived"].append(partition_name(month))
+        finally:
+            # соединение вернется в пул: lock_timeout снова по умолчанию
+            await connection.execute(text("RESET lock_timeout"))
+            await connection.execute(
+                select(func.pg_advisory_unlock(PARTITION_LOCK_KEY))
+            )
+    for action, names in changes.items():
+        PARTITION_CHANGES.inc(len(names), action=action)
+    return changes
+
+
+async def create_partitions(
+    engine: AsyncEngine, months: list[datetime.date]
+) -> list[str]:
+    """Создает недостающие секции за месяцы months.
+
+    Нужна при переносе бакетов: строки с другого шарда могут быть старше
+    секций, которые создает maintain_partitions.
+    """
+    created = []
+    async with engine.connect() as connection:
+        connection = await connection.execution_options(isolation_level="AUTOCOMMIT")
+        attached = await _attached(connection)
+        for month in sorted(set(months) - set(attached)):
+            if await _create(connection, month):
+                created.append(partition_name(month))
+    PARTITION_CHANGES.inc(len(created), action="created")
+    return created
+
+
+async def _attached(connection) -> dict[datetime.date, bool]:
+    """Месяцы присоединенных секций и признак незавершенного DETACH"""
+    attached = {}
+    for name, detach_pending in (await connection.execute(LIST_PARTITIONS)).all():
+        match = PARTITION_NAME.match(name)
+        if match:
+            attached[datetime.date(int(match[1]), int(match[2]), 1)] = detach_pending
+    return attached
+
+
+async def _create(connection, month: datetime.date) -> bool:
+    return await _run_ddl(
+        connection,
+        f"CREATE TABLE {partition_name(month)}"
+        f" PARTITION OF transactions FOR VALUES"
+        f" FROM ('{month}') TO ('{add_months(month, 1)}')",
+    )
+
+
+async def _archive(connection, month: datetime.date, detach_pending: bool) -> bool:
+    """Отсоединяет секцию и переносит ее в схему архива"""
+    name = partition_name(month)
+    pending = await connection.scalar(
+        text(f"SELECT EXISTS (SELECT 1 FROM {name} WHERE status = 'PENDING')")
+    )
+    if pending:
+        LOGER.warning(f"Partition {name} still has pending transactions")
+        return False
+    # прерванный DETACH CONCURRENTLY оставляет секцию в состоянии ожидания
+    mode = "FINALIZE" if detach_pending else "CONCURRENTLY"
+    if not await _run_ddl(
+        connection, f"ALTER TABLE transactions DETACH PARTITION {name} {mode}"
+    ):
+        return False
+    return await _run_ddl(connection, f"ALTER TABLE {name} SET SCHEMA {ARCHIVE_SCHEMA}")
+
+
+async def _run_ddl(connection, statement: str) -> bool:
+    try:
+        await connection.execute(text(statement))
+    except DBAPIError:
+        LOGER.exception(f"Partition maintenance failed: {statement}")
+        return False
+    LOGER.info(f"Partition maintenance: {statement}")
+    return True
+
+
+if __name__ == "__main__":
+    print(asyncio.run(maintain_partitions()))
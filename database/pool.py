@@ -0,0 +1,80 @@
+"""Инструментирование пула соединений"""
+
+import time
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from src.metrics import Gauge, Histogram
+
+POOL_WAIT_SECONDS = Histogram(
+    "db_pool_wait_seconds", "Time spent waiting for a pooled connection"
+)
+POOL_HOLD_SECONDS = Histogram(
+    "db_pool_checkout_duration_seconds", "Time a connection stays checked out"
+)
+POOL_CONNECTION_LIFETIME_SECONDS = Histogram(
+    "db_pool_connection_lifetime_seconds",
+    "Lifetime of closed DB connections",
+    buckets=(1, 10, 60, 300, 900, 1800, 3600, 7200, 21600, 86400),
+)
+POOLS: list[AsyncAdaptedQueuePool] = []
+
+
+def _pool_stats(attribute: str):
+    def collect() -> dict[tuple, float]:
+        return {(): sum(getattr(pool, attribute)() for pool in POOLS)}
+
+    return collect
+
+
+POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out", "Connections in use", callback=_pool_stats("checkedout")
+)
+POOL_CHECKED_IN = Gauge(
+    "db_pool_checked_in",
+    "Idle connections in the pool",
+    callback=_pool_stats("checkedin"),
+)
+POOL_OVERFLOW = Gauge(
+    "db_pool_overflow", "Connections above pool_size", callback=_pool_stats("overflow")
+)
+POOL_SIZE = Gauge("db_pool_size", "Configured pool size", callback=_pool_stats("size"))
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Очередь соединений с замером ожидания свободного соединения"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_WAIT_SECONDS.observe(time.perf_counter() - started)
+
+
+def instrument_pool(engine: AsyncEngine) -> None:
+    """Подписывает метрики на события пула движка"""
+    pool = engine.sync_engine.pool
+    POOLS.append(pool)
+
+    @event.listens_for(pool, "connect")
+    def on_connect(dbapi_connection, record):
+        record.info["connected_at"] = time.monotonic()
+
+    @event.listens_for(pool, "checkout")
+    def on_checkout(dbapi_connection, record, proxy):
+        record.info["checked_out_at"] = time.monotonic()
+
+    @event.listens_for(pool, "checkin")
+    def on_checkin(dbapi_connection, record):
+        checked_out_at = record.info.pop("checked_out_at", None)
+        if checked_out_at is not None:
+            POOL_HOLD_SECONDS.observe(time.monotonic() - checked_out_at)
+
+    @event.listens_for(pool, "close")
+    def on_close(dbapi_connection, record):
+        connected_at = record.info.pop("connected_at", None)
+        if connected_at is not None:
+            POOL_CONNECTION_LIFETIME_SECONDS.observe(time.monotonic() - connected_at)
@@ -0,0 +1,256 @@
+"""Перенос бакетов шардирования между шардами, см. database/shards.py.
+
+Перенос набора бакетов на шард target:
+
+1. бакеты помечаются moving, и воркеры перестают в них писать; перед
+   копированием выжидается SHARD_MOVE_GRACE_SECONDS - больше двух
+   интервалов обновления карты и времени запроса в очереди;
+2. на исходном шарде блокируются транзакции, затем пользователи бакетов
+   (в том же порядке, что и у sweep), и строки копируются на целевой шард
+   двоичным COPY без промежуточного файла. Триггеры на целевом шарде
+   отключены (session_replication_role = replica): журнал баланса
+   копируется вместе с пользователями, а события уже были отправлены;
+3. бакеты переключаются на target, и блокировки снимаются;
+4. спустя еще SHARD_MOVE_GRACE_SECONDS, когда по старой карте никто не
+   читает, строки бакетов удаляются со всех шардов, кроме владельца.
+   Журнал баланса защищен от DELETE триггером и RESTRICT, поэтому копии
+   удаляются тоже с отключенными триггерами.
+
+Прерванный перенос повторяется той же командой: целевой шард перед
+копированием очищается от остатков, лишние копии удаляет шаг 4. id
+записей журнала на целевом шарде выдаются заново (порядок сохраняется),
+поэтому курсор after истории баланса перенесенного пользователя нужно
+получить заново. Для session_replication_role нужен суперпользователь
+или GRANT SET ON PARAMETER session_replication_role.
+"""
+
+import asyncio
+
+import asyncpg
+from sqlalchemy.dialects.postgresql import insert
+
+from database.db import SHARDS, Shard
+from database.models import BalanceLedger, ShardBucket, Transaction, User
+from database.partitions import create_partitions
+from database.shards import SHARD_MAP, bucket_sql
+from src.config import LOGER
+from src.settings import SHARD_MOVE_GRACE_SECONDS
+
+BUCKET_USERS = f"SELECT id FROM users WHERE {bucket_sql('id')} = ANY($1::int[])"
+# таблица -> условие на строки бакетов $1 и столбцы для копирования
+COPIED = {
+    User.__tablename__: (
+        f"{bucket_sql('id')} = ANY($1::int[])",
+        [column.name for column in User.__table__.columns],
+    ),
+    Transaction.__tablename__: (
+        f"user_id IN ({BUCKET_USERS})",
+        # expires_at вычисляется БД
+        [
+            column.name
+            for column in Transaction.__table__.columns
+            if column.computed is None
+        ],
+    ),
+    BalanceLedger.__tablename__: (
+        f"user_id IN ({BUCKET_USERS})",
+        # id выдает identity целевого шарда
+        [
+            column.name
+            for column in BalanceLedger.__table__.columns
+            if column.name != "id"
+        ],
+    ),
+}
+ORDER_BY = {BalanceLedger.__tablename__: " ORDER BY created_at, id"}
+
+
+def plan_rebalance(owners: list[int], shards: int) -> dict[int, list[int]]:
+    """Минимальный набор переносов, после которого у шардов поровну бакетов.
+
+    Возвращает target -> бакеты; лишние бакеты забираются с конца списка
+    бакетов перегруженных шардов.
+    """
+    owned = {number: [] for number in range(shards)}
+    for bucket, owner in enumerate(owners):
+        owned[owner].append(bucket)
+    quota, extra = divmod(len(owners), shards)
+    # остаток достается шардам, у которых бакетов уже больше
+    order = sorted(owned, key=lambda number: -len(owned[number]))
+    limits = {number: quota + (index < extra) for index, number in enumerate(order)}
+    surplus = [bucket for number in owned for bucket in owned[number][limits[number] :]]
+    plan = {}
+    for number in owned:
+        needed = limits[number] - len(owned[number])
+        if needed > 0:
+            plan[number], surplus = surplus[:needed], surplus[needed:]
+    return plan
+
+
+async def rebalance(grace: float = SHARD_MOVE_GRACE_SECONDS) -> dict[str, int]:
+    """Выравнивает число бакетов на шардах"""
+    await SHARD_MAP.refresh()
+    plan = plan_rebalance(SHARD_MAP.owners(), len(SHARDS))
+    copied = {}
+    for target, buckets in plan.items():
+        for table, rows in (await move_buckets(buckets, target, grace)).items():
+            copied[table] = copied.get(table, 0) + rows
+    return copied
+
+
+async def move_buckets(
+    buckets: list[int], target: int, grace: float = SHARD_MOVE_GRACE_SECONDS
+) -> dict[str, int]:
+    """Переносит бакеты на шард target; возвращает число строк по таблицам"""
+    if not 0 <= target < len(SHARDS):
+        raise ValueError(f"Shard {target} is not configured")
+    await SHARD_MAP.refresh()
+    owners = SHARD_MAP.owners()
+    sources: dict[int, list[int]] = {}
+    for bucket in sorted(set(buckets)):
+        if owners[bucket] != target:
+            sources.setdefault(owners[bucket], []).append(bucket)
+    copied = dict.fromkeys(COPIED, 0)
+    if sources:
+        for source, part in sources.items():
+            await _assign(part, source, moving=True)
+        counts = {source: len(part) for source, part in sources.items()}
+        LOGER.info(
+            f"Moving buckets to shard {target} from shards {counts}, waiting {grace}s"
+        )
+        await asyncio.sleep(grace)
+        for source, part in sources.items():
+            rows = await _copy(SHARDS[source], SHARDS[target], part)
+            LOGER.info(f"{len(part)} buckets copied from shard {source}: {rows}")
+            for table, count in rows.items():
+                copied[table] += count
+        await asyncio.sleep(grace)
+    await purge(buckets)
+    return copied
+
+
+async def purge(buckets: list[int]) -> int:
+    """Удаляет пользователей бакетов со всех шардов, кроме владельца.
+
+    Бакеты, которые еще переносятся, не трогаются. Возвращает число
+    удаленных пользователей; их транзакции и журнал удаляются вместе с ними.
+    """
+    await SHARD_MAP.refresh()
+    owners, moving = SHARD_MAP.owners(), SHARD_MAP.moving()
+    deleted = 0
+    for shard in SHARDS:
+        stale = [
+            bucket
+            for bucket in sorted(set(buckets))
+            if bucket not in moving and owners[bucket] != shard.number
+        ]
+        if not stale:
+            continue
+        connection = await asyncpg.connect(shard.dsn())
+        try:
+            async with connection.transaction():
+                await connection.execute("SET LOCAL session_replication_role = replica")
+                count = await _delete(connection, stale)
+        finally:
+            await connection.close()
+        if count:
+            LOGER.info(
+                f"Purged {count} users of moved buckets from shard {shard.number}"
+            )
+        deleted += count
+    return deleted
+
+
+async def _assign(buckets: list[int], shard: int, moving: bool) -> None:
+    """Записывает владельца бакетов в карту на первом шарде"""
+    stmt = insert(ShardBucket).values(
+        [{"bucket": bucket, "shard": shard, "moving": moving} for bucket in buckets]
+    )
+    async with SHARDS[0].session_factory() as session, session.begin():
+        await session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[ShardBucket.bucket],
+                set_={"shard": stmt.excluded.shard, "moving": stmt.excluded.moving},
+            )
+        )
+
+
+async def _copy(source: Shard, target: Shard, buckets: list[int]) -> dict[str, int]:
+    """Копирует строки бакетов и переключает их на target под блокировками"""
+    reader = await asyncpg.connect(source.dsn())
+    writer = await asyncpg.connect(target.dsn())
+    try:
+        async with reader.transaction():
+            await reader.execute(
+                f"SELECT 1 FROM transactions WHERE user_id IN ({BUCKET_USERS})"
+                f" FOR UPDATE",
+                buckets,
+            )
+            await reader.execute(f"{BUCKET_USERS} ORDER BY id FOR UPDATE", buckets)
+            months = await reader.fetch(
+                f"SELECT DISTINCT date_trunc('month', created_at)::date"
+                f" FROM transactions WHERE user_id IN ({BUCKET_USERS})",
+                buckets,
+            )
+            await create_partitions(target.engine, [row[0] for row in months])
+            copied = {}
+            async with writer.transaction():
+                await writer.execute("SET LOCAL session_replication_role = replica")
+                # остатки прерванного переноса
+                await _delete(writer, buckets)
+                for table, (condition, columns) in COPIED.items():
+                    copied[table] = await _pipe(
+                        reader,
+                        writer,
+                        f"SELECT {', '.join(columns)} FROM {table}"
+                        f" WHERE {condition}{ORDER_BY.get(table, '')}",
+                        buckets,
+                        table,
+                        columns,
+                    )
+            await _assign(buckets, target.number, moving=False)
+    finally:
+        await asyncio.gather(reader.close(), writer.close())
+    return copied
+
+
+async def _delete(connection: asyncpg.Connection, buckets: list[int]) -> int:
+    """Удаляет строки бакетов из всех таблиц; возвращает число пользователей.
+
+    Соединение должно быть в session_replication_role = replica: каскад
+    без триггеров не работает, а журнал иначе не удалить.
+    """
+    for table, (condition, _) in reversed(COPIED.items()):
+        status = await connection.execute(
+            f"DELETE FROM {table} WHERE {condition}", buckets
+        )
+    return int(status.split()[-1])
+
+
+async def _pipe(
+    reader: asyncpg.Connection,
+    writer: asyncpg.Connection,
+    query: str,
+    buckets: list[int],
+    table: str,
+    columns: list[str],
+) -> int:
+    """COPY результата query в table другого шарда; в памяти - несколько кусков"""
+    chunks: asyncio.Queue[bytes | None] = asyncio.Queue(16)
+
+    async def read() -> None:
+        await reader.copy_from_query(query, buckets, output=chunks.put, format="binary")
+        await chunks.put(None)
+
+    async def source():
+        while (chunk := await chunks.get()) is not None:
+            yield chunk
+
+    async with asyncio.TaskGroup() as group:
+        group.create_task(read())
+        written = group.create_task(
+            writer.copy_to_table(
+                table, source=source(), columns=columns, format="binary"
+            )
+        )
+    return int(written.result().split()[-1])
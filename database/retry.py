@@ -0,0 +1,89 @@
+"""Классификация ошибок конкурентного доступа и повтор операций UoW"""
+
+import asyncio
+import functools
+import math
+import random
+import time
+
+from sqlalchemy.exc import DBAPIError
+
+from database.metrics import UOW_RETRIES, UOW_RETRIES_EXHAUSTED
+from src.config import LOGER
+from src.settings import (
+    RETRY_MAX_ATTEMPTS,
+    RETRY_BUDGET_SECONDS,
+    RETRY_BASE_DELAY,
+    RETRY_MAX_DELAY,
+)
+
+RETRYABLE_SQLSTATES = {
+    "40001": "serialization_failure",
+    "40P01": "deadlock",
+    "55P03": "lock_timeout",
+    "57014": "statement_timeout",
+}
+# конфликт с другой транзакцией - 409, перегрузка - 503
+CONFLICT_REASONS = ("serialization_failure", "deadlock")
+
+
+class RetryBudgetExceeded(Exception):
+    """Операция не выполнилась за отведенное число попыток и время"""
+
+    def __init__(self, operation: str, reason: str, attempts: int, retry_after: int):
+        super().__init__(f"{operation} failed after {attempts} attempts: {reason}")
+        self.operation = operation
+        self.reason = reason
+        self.attempts = attempts
+        self.retry_after = retry_after
+
+    @property
+    def status_code(self) -> int:
+        return 409 if self.reason in CONFLICT_REASONS else 503
+
+
+def classify(exc: BaseException) -> str | None:
+    """Причина ошибки, после которой операцию можно повторить"""
+    if not isinstance(exc, DBAPIError):
+        return None
+    return RETRYABLE_SQLSTATES.get(getattr(exc.orig, "sqlstate", None))
+
+
+def retry_on_conflict(func):
+    """Декоратор метода UoW: повтор с экспоненциальной задержкой и jitter.
+
+    Бюджет ограничен числом попыток RETRY_MAX_ATTEMPTS и временем
+    RETRY_BUDGET_SECONDS; по его исчерпании поднимается RetryBudgetExceeded.
+    """
+
+    @functools.wraps(func)
+    async def wrapper(self, *args, **kwargs):
+        deadline = time.monotonic() + RETRY_BUDGET_SECONDS
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return await func(self, *args, **kwargs)
+            except DBAPIError as exc:
+                reason = classify(exc)
+                if reason is None:
+                    raise
+                delay = random.uniform(
+                    0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2**attempt)
+                )
+                if attempt >= RETRY_MAX_ATTEMPTS or time.monotonic() + delay > deadline:
+                    UOW_RETRIES_EXHAUSTED.inc(operation=self._operation, reason=reason)
+                    raise RetryBudgetExceeded(
+                        self._operation,
+                        reason,
+                        attempt,
+                        retry_after=max(1, math.ceil(RETRY_MAX_DELAY)),
+                    ) from exc
+                UOW_RETRIES.inc(operation=self._operation, reason=reason)
+                LOGER.warning(
+                    f"{self._operation}: {reason}, retry {attempt} in {delay:.3f}s"
+                )
+                await self._session.rollback()
+                await asyncio.sleep(delay)
+
+    return wrapper
@@ -0,0 +1,223 @@
+"""Шардирование данных пользователей по user_id.
+
+Пользователь, его транзакции и журнал баланса лежат в одной БД, поэтому
+каждая операция UoW остается транзакцией одного шарда. Шард выбирается
+по бакету: младшие 32 бита id по модулю SHARD_BUCKETS. id транзакции
+наследует младшие биты id пользователя (uuid7(key)), так что ее бакет
+известен без запроса.
+
+Первый шард - REAL_DATABASE_URL, остальные - SHARD_DATABASE_URLS.
+Бакеты закрепляются за шардами таблицей shard_buckets первого шарда;
+бакет без строки принадлежит первому шарду, поэтому подключение нового
+шарда само по себе ничего не переносит - данные переносит
+database/rebalance.py. Пока бакет переносится (moving), записи в него
+отклоняются с 503, а чтение идет со старого шарда. Воркеры перечитывают
+карту каждые SHARD_MAP_REFRESH_SECONDS и не пишут по карте, которая не
+обновлялась дольше двух интервалов.
+
+На первом шарде остаются данные без user_id: ключи идемпотентности,
+блокировка ведущего процесса и сама карта; реплики REPLICA_DATABASE_URLS
+тоже относятся к нему. Миграции применяются к каждому шарду отдельно:
+REAL_DATABASE_URL=<шард> alembic upgrade head.
+"""
+
+import asyncio
+import itertools
+import random
+import time
+import uuid
+from typing import Callable
+
+from sqlalchemy import select
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from database.db import SHARDS, Shard, read_session_factory
+from database.models import ShardBucket, Transaction
+from src.config import LOGER
+from src.metrics import Gauge
+from src.settings import SHARD_BUCKETS, SHARD_MAP_REFRESH_SECONDS
+
+KEY_MASK = 0xFFFF_FFFF
+
+
+def bucket_of(obj_id: uuid.UUID) -> int:
+    """Бакет пользователя или его транзакции"""
+    return (obj_id.int & KEY_MASK) % SHARD_BUCKETS
+
+
+def bucket_sql(column: str) -> str:
+    """bucket_of() для uuid-столбца в SQL"""
+    return f"('x' || right({column}::text, 8))::bit(32)::bigint % {SHARD_BUCKETS}"
+
+
+class ShardUnavailable(Exception):
+    """Запись в бакет сейчас невозможна: он переносится или карта устарела"""
+
+
+class ShardMap:
+    """Владельцы бакетов и выбор шарда по id"""
+
+    def __init__(self, shards: list[Shard], buckets: int):
+        self.shards = shards
+        self._owners = [0] * buckets
+        self._moving: set[int] = set()
+        # до первого refresh() запись на шардированной конфигурации запрещена
+        self._refreshed_at = float("-inf")
+        self._next_bulk = itertools.count()
+
+    @property
+    def sharded(self) -> bool:
+        return len(self.shards) > 1
+
+    def owners(self) -> list[int]:
+        """Номер шарда-владельца для каждого бакета"""
+        return list(self._owners)
+
+    def moving(self) -> set[int]:
+        return set(self._moving)
+
+    def buckets(self) -> dict[tuple, float]:
+        """Число бакетов у каждого шарда, для метрики"""
+        counts = dict.fromkeys(range(len(self.shards)), 0)
+        for owner in self._owners:
+            counts[owner] += 1
+        return {(self.shards[number].name,): count for number, count in counts.items()}
+
+    async def refresh(self) -> None:
+        """Перечитывает shard_buckets с первого шарда"""
+        async with self.shards[0].session_factory() as session:
+            rows = await session.execute(
+                select(ShardBucket.bucket, ShardBucket.shard, ShardBucket.moving)
+            )
+            rows = rows.all()
+        owners, moving = [0] * len(self._owners), set()
+        for bucket, shard, is_moving in rows:
+            if bucket >= len(owners) or shard >= len(self.shards):
+                raise ValueError(
+                    f"Bucket {bucket} on shard {shard} does not match"
+                    f" SHARD_BUCKETS/SHARD_DATABASE_URLS"
+                )
+            owners[bucket] = shard
+            if is_moving:
+                moving.add(bucket)
+        self._owners, self._moving = owners, moving
+        self._refreshed_at = time.monotonic()
+
+    async def monitor(self) -> None:
+        """Обновляет карту каждые SHARD_MAP_REFRESH_SECONDS до отмены"""
+        while True:
+            await asyncio.sleep(SHARD_MAP_REFRESH_SECONDS)
+            try:
+                await self.refresh()
+            except (OSError, DBAPIError, ValueError):
+                LOGER.exception("Shard map refresh failed")
+
+    def _check_fresh(self) -> None:
+        if time.monotonic() - self._refreshed_at > 2 * SHARD_MAP_REFRESH_SECONDS:
+            raise ShardUnavailable("Shard map is stale")
+
+    def shard_for(self, obj_id: uuid.UUID, write: bool = True) -> Shard:
+        """Шард пользователя или транзакции по id"""
+        if not self.sharded:
+            return self.shards[0]
+        bucket = bucket_of(obj_id)
+        if write:
+            if bucket in self._moving:
+                raise ShardUnavailable(f"Bucket {bucket} is moving")
+            self._check_fresh()
+        return self.shards[self._owners[bucket]]
+
+    @staticmethod
+    def read_session_factory(
+        shard: Shard, read_your_writes: bool = False
+    ) -> async_sessionmaker:
+        """Фабрика сессий для чтения с шарда; реплики есть только у первого"""
+        if shard.number == 0:
+            return read_session_factory(read_your_writes)
+        return shard.session_factory
+
+    async def find_transaction(self, transaction_id: uuid.UUID) -> Transaction | None:
+        """Транзакция по id с того шарда, где она лежит.
+
+        Сначала проверяется шард по младшим битам id; транзакции, созданные
+        до шардирования, их не наследуют и ищутся на остальных шардах.
+        """
+        first = self.shard_for(transaction_id, write=False)
+        for shard in [first, *(shard for shard in self.shards if shard is not first)]:
+            async with shard.session_factory() as session:
+                transaction = await Transaction.read_by_id(session, transaction_id)
+            if transaction is not None:
+                return transaction
+        return None
+
+    async def locate_transaction(
+        self, transaction_id: uuid.UUID, write: bool = True
+    ) -> Shard:
+        """Шард транзакции: шард ее пользователя, если она найдена"""
+        if not self.sharded:
+            return self.shards[0]
+        transaction = await self.find_transaction(transaction_id)
+        if transaction is None:
+            return self.shard_for(transaction_id, write)
+        return self.shard_for(transaction.user_id, write)
+
+    async def transaction_users(
+        self, transaction_ids: list[uuid.UUID]
+    ) -> dict[uuid.UUID, uuid.UUID]:
+        """user_id найденных транзакций, одним запросом к каждому шарду"""
+        if not self.sharded:
+            return {}
+        users = {}
+        for shard in self.shards:
+            async with shard.session_factory() as session:
+                rows = await session.execute(
+                    select(Transaction.id, Transaction.user_id).where(
+                        Transaction.ids_clause(sorted(set(transaction_ids)))
+                    )
+                )
+                users.update(tuple(row) for row in rows)
+        return users
+
+    def new_user_id(self) -> uuid.UUID:
+        """id нового пользователя в бакете, открытом для записи"""
+        while True:
+            user_id = uuid.uuid4()
+            if bucket_of(user_id) not in self._moving:
+                return user_id
+
+    def bulk_target(self) -> tuple[Shard, Callable[[], uuid.UUID]]:
+        """Шард для массовой загрузки и генератор id в его бакетах.
+
+        Загрузка целиком идет на один шард и остается одной транзакцией;
+        шарды чередуются между загрузками.
+        """
+        if not self.sharded:
+            return self.shards[0], uuid.uuid4
+        self._check_fresh()
+        owned: dict[int, list[int]] = {}
+        for bucket, owner in enumerate(self._owners):
+            if bucket not in self._moving:
+                owned.setdefault(owner, []).append(bucket)
+        if not owned:
+            raise ShardUnavailable("No buckets open for writes")
+        number = sorted(owned)[next(self._next_bulk) % len(owned)]
+        buckets, size = owned[number], len(self._owners)
+
+        def new_id() -> uuid.UUID:
+            value = uuid.uuid4().int
+            key = (value & KEY_MASK) // size * size + random.choice(buckets)
+            if key > KEY_MASK:
+                key -= size
+            return uuid.UUID(int=value & ~KEY_MASK | key)
+
+        return self.shards[number], new_id
+
+
+SHARD_MAP = ShardMap(SHARDS, SHARD_BUCKETS)
+SHARD_BUCKETS_OWNED = Gauge(
+    "shard_buckets",
+    "Sharding buckets owned by each shard",
+    ("shard",),
+    callback=SHARD_MAP.buckets,
+)
@@ -1,20 +1,192 @@
 import datetime
+import inspect
+import time
 import uuid
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+from typing import AsyncIterable, AsyncIterator, Callable
 
-from sqlalchemy import select, func, text
+from sqlalchemy import (
+    UUID,
+    Integer,
+    and_,
+    case,
+    column,
+    func,
+    insert,
+    literal,
+    select,
+    text,
+    true,
+    tuple_,
+    update,
+    values,
+)
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import aliased
 
-from database.db import sync_engine
-from database.models import User, Transaction, TransactionStatus
+from database.cache import CACHE
+from database.db import short_transaction
+from database.metrics import (
+    UOW_CAS_CONFLICTS,
+    UOW_CAS_FALLBACKS,
+    UOW_LOCK_WAIT_SECONDS,
+    observe_operation,
+)
+from database.models import (
+    User,
+    Transaction,
+    TransactionStatus,
+    OperationOutcome,
+    BalanceLedger,
+)
+from database.models.settings import uuid7
+from database.retry import RetryBudgetExceeded, retry_on_conflict
 from src.config import LOGER
+from src.settings import (
+    CONCURRENCY_MODE,
+    CAS_MAX_RETRIES,
+    DB_LOCK_TIMEOUTS,
+    DB_STATEMENT_TIMEOUTS,
+    EXPORT_CHUNK_SIZE,
+)
 from api import schemas
 
+SETTLED_OUTCOMES = (
+    OperationOutcome.CONFIRMED,
+    OperationOutcome.CANCELED,
+    OperationOutcome.EXPIRED,
+)
+
+EXPIRE_LOCK_KEY = 0x7472_6E73_6578_70  # "trnsexp"
+USER_COPY_COLUMNS = ("id", "current_balance", "max_balance")
+EXPIRE_CHUNK_SQL = text(
+    """
+    WITH due AS (
+        SELECT id, created_at FROM transactions
+        WHERE status = 'PENDING'
+        AND expires_at < LOCALTIMESTAMP
+        ORDER BY expires_at
+        LIMIT :chunk_size
+        FOR UPDATE SKIP LOCKED
+    ), expired AS (
+        UPDATE transactions
+        SET status = 'EXPIRED', updated_at = NOW()
+        FROM due
+        WHERE transactions.id = due.id
+        AND transactions.created_at = due.created_at
+        RETURNING transactions.id, transactions.user_id, transactions.amount
+    ), released AS (
+        SELECT user_id,
+            SUM(CASE WHEN amount < 0 THEN -amount ELSE 0 END) AS debit,
+            SUM(CASE WHEN amount > 0 THEN amount ELSE 0 END) AS credit
+        FROM expired
+        GROUP BY user_id
+    ), locked AS (
+        SELECT id FROM users
+        WHERE id IN (SELECT user_id FROM released)
+        ORDER BY id
+        FOR UPDATE
+    ), unreserved AS (
+        UPDATE users
+        SET reserved_debit = users.reserved_debit - released.debit,
+            reserved_credit = users.reserved_credit - released.credit,
+            version = users.version + 1
+        FROM released
+        JOIN locked ON locked.id = released.user_id
+        WHERE users.id = released.user_id
+    )
+    SELECT id, user_id FROM expired
+    """
+)
+
+
+_overdue = aliased(Transaction, name="overdue")
+
+
+def _overdue_sum(expression):
+    """Сумма резервов истекших PENDING транзакций пользователя"""
+    return (
+        select(func.coalesce(func.sum(expression), 0))
+        .where(
+            _overdue.user_id == User.id,
+            Transaction.is_pending(_overdue),
+            _overdue.expires_at <= func.localtimestamp(),
+        )
+        .scalar_subquery()
+    )
+
+
+# снимок пользователя для CAS-режима; выражение строится один раз
+USER_SNAPSHOT = (
+    User.id,
+    User.current_balance,
+    User.max_balance,
+    User.reserved_debit,
+    User.reserved_credit,
+    User.version,
+    _overdue_sum(case((_overdue.amount < 0, -_overdue.amount), else_=0)).label(
+        "overdue_debit"
+    ),
+    _overdue_sum(case((_overdue.amount > 0, _overdue.amount), else_=0)).label(
+        "overdue_credit"
+    ),
+)
+
+
+class VersionConflict(Exception):
+    """Версия пользователя изменилась между чтением и записью"""
+
 
 class UoW:
     def __init__(self, session: AsyncSession = None):
         self._session: AsyncSession = session
-        self._sync_engine = sync_engine
+        self._stale: set[str] = set()
+        self._operation: str | None = None
+        self._outcome: OperationOutcome | None = None
+
+    @asynccontextmanager
+    async def _transaction(self):
+        """Транзакция UoW; затронутые объекты удаляются из кэша после нее"""
+        try:
+            async with self._session.begin():
+                await self._set_timeouts()
+                yield
+        finally:
+            if self._stale:
+                await CACHE.delete(*self._stale)
+                self._stale.clear()
+
+    async def _set_timeouts(self) -> None:
+        """SET LOCAL таймаутов, заданных для текущей операции"""
+        timeouts = [
+            func.set_config(name, f"{overrides[self._operation]}ms", True)
+            for name, overrides in (
+                ("lock_timeout", DB_LOCK_TIMEOUTS),
+                ("statement_timeout", DB_STATEMENT_TIMEOUTS),
+            )
+            if self._operation in overrides
+        ]
+        if timeouts:
+            await self._session.execute(select(*timeouts))
+
+    async def _lock(self, statement):
+        """Выполняет SELECT ... FOR UPDATE, замеряя ожидание блокировки"""
+        started = time.perf_counter()
+        try:
+            return await statement
+        finally:
+            UOW_LOCK_WAIT_SECONDS.observe(
+                time.perf_counter() - started, operation=self._operation
+            )
+
+    def _fail(self, outcome: OperationOutcome) -> None:
+        """Запоминает причину отказа для метрик"""
+        self._outcome = outcome
+        return None
+
+    def _invalidate(self, model, *obj_ids: uuid.UUID) -> None:
+        self._stale.update(model.cache_key(obj_id) for obj_id in obj_ids)
 
     @LOGER.catch
     async def get_all_transactions_with_page(
@@ -27,18 +199,141 @@ class UoW:
             .limit(limit)
             .offset((offset - 1) * limit)
         )
+        async with short_transaction(self._session):
+            query_result = await self._session.execute(
+                query.order_by(Transaction.created_at.desc(), Transaction.id.desc())
+            )
+            counter_result = await self.count_transactions(user_id)
+        result = query_result.scalars()
+        return (result, counter_result)
+
+    @LOGER.catch
+    async def get_transactions_after(
+        self,
+        limit: int,
+        user_id: uuid.UUID,
+        after: tuple[datetime.datetime, uuid.UUID] | None = None,
+    ) -> list[Transaction]:
+        """Получает страницу транзакций пользователя после курсора (created_at, id)"""
+        query = select(Transaction).where(Transaction.user_id == user_id)
+        if after is not None:
+            query = query.where(
+                tuple_(Transaction.created_at, Transaction.id) < tuple_(*after)
+            )
+        query = query.order_by(Transaction.created_at.desc(), Transaction.id.desc())
+        async with short_transaction(self._session):
+            query_result = await self._session.execute(query.limit(limit))
+        return list(query_result.scalars())
+
+    @LOGER.catch
+    async def count_transactions(self, user_id: uuid.UUID) -> int:
+        """Количество транзакций пользователя"""
         total_query = (
             select(func.count())
             .select_from(Transaction)
             .where(Transaction.user_id == user_id)
         )
-        query_result = await self._session.execute(
-            query.order_by(Transaction.created_at.desc())
+        async with short_transaction(self._session):
+            counter = await self._session.execute(total_query)
+        return counter.scalar()
+
+    async def stream_transactions(
+        self,
+        user_id: uuid.UUID,
+        since: datetime.datetime | None = None,
+        until: datetime.datetime | None = None,
+        status: TransactionStatus | None = None,
+        chunk_size: int = EXPORT_CHUNK_SIZE,
+    ) -> AsyncIterator[list[dict]]:
+        """Транзакции пользователя за период [since, until) пачками по chunk_size.
+
+        Строки читаются серверным курсором в хронологическом порядке, память
+        не зависит от объема выгрузки; соединение занято до конца итерации.
+        """
+        self._operation = "export_transactions"
+        query = select(*Transaction.__table__.columns).where(
+            Transaction.user_id == user_id
         )
-        result = query_result.scalars()
-        counter = await self._session.execute(total_query)
-        counter_result = counter.scalar()
-        return (result, counter_result)
+        if since is not None:
+            query = query.where(Transaction.created_at >= since)
+        if until is not None:
+            query = query.where(Transaction.created_at < until)
+        if status is not None:
+            query = query.where(Transaction.status == status)
+        query = query.order_by(Transaction.created_at, Transaction.id)
+        async with self._transaction():
+            result = await self._session.stream(
+                query, execution_options={"yield_per": chunk_size}
+            )
+            # словари проверяются схемой втрое быстрее, чем Row по атрибутам
+            async for rows in result.mappings().partitions():
+                yield [dict(row) for row in rows]
+
+    @LOGER.catch
+    async def get_balance_at(
+        self, user_id: uuid.UUID, at: datetime.datetime | None = None
+    ) -> BalanceLedger | None:
+        """Запись журнала, действовавшая на момент at (последняя, если at не задан)"""
+        query = select(BalanceLedger).where(BalanceLedger.user_id == user_id)
+        if at is not None:
+            query = query.where(BalanceLedger.created_at <= at)
+        query = query.order_by(
+            BalanceLedger.created_at.desc(), BalanceLedger.id.desc()
+        ).limit(1)
+        async with short_transaction(self._session):
+            query_result = await self._session.execute(query)
+        return query_result.scalar_one_or_none()
+
+    @LOGER.catch
+    async def get_balance_history(
+        self,
+        limit: int,
+        user_id: uuid.UUID,
+        since: datetime.datetime | None = None,
+        until: datetime.datetime | None = None,
+        after: int | None = None,
+    ) -> list[BalanceLedger]:
+        """Записи журнала за период в хронологическом порядке, после записи after"""
+        query = select(BalanceLedger).where(BalanceLedger.user_id == user_id)
+        if since is not None:
+            query = query.where(BalanceLedger.created_at >= since)
+        if until is not None:
+            query = query.where(BalanceLedger.created_at < until)
+        if after is not None:
+            query = query.where(BalanceLedger.id > after)
+        query = query.order_by(BalanceLedger.created_at, BalanceLedger.id)
+        async with short_transaction(self._session):
+            query_result = await self._session.execute(query.limit(limit))
+        return list(query_result.scalars())
+
+    @LOGER.catch(exclude=ValueError)
+    @observe_operation("create_users_copy")
+    async def create_users_copy(
+        self,
+        batches: AsyncIterable[list[dict]],
+        new_id: Callable[[], uuid.UUID] = uuid.uuid4,
+    ) -> list[uuid.UUID] | None:
+        """Создает пользователей через COPY, одной командой на пачку.
+
+        Все пачки загружаются в одной транзакции: любая ошибка откатывает
+        загрузку целиком. ValueError из batches (некорректная запись)
+        передается вызывающему, остальные ошибки дают None. id выдает
+        new_id, см. ShardMap.bulk_target.
+        """
+        ids = []
+        async with self._transaction():
+            connection = await self._session.connection()
+            raw = await connection.get_raw_connection()
+            async for batch in batches:
+                records = [
+                    (new_id(), item["current_balance"], item["max_balance"])
+                    for item in batch
+                ]
+                await raw.driver_connection.copy_records_to_table(
+                    User.__tablename__, records=records, columns=USER_COPY_COLUMNS
+                )
+                ids.extend(record[0] for record in records)
+        return ids
 
     @LOGER.catch
     async def get_user_with_lock(self, user_id: int) -> User:
@@ -49,105 +344,96 @@ class UoW:
         result = result.scalar_one_or_none()
         return result
 
-    @LOGER.catch
+    @LOGER.catch(exclude=RetryBudgetExceeded)
+    @observe_operation("create_transaction")
+    @retry_on_conflict
     async def create_transaction(self, **kwargs) -> schemas.Transaction | None:
         """Создает новую транзакцию с проверкой баланса и блокировками"""
-        async with self._session.begin():
-            user = await self._session.get(
-                User, kwargs.get("user_id"), with_for_update=True
+        if not self._is_new(kwargs):
+            LOGER.error(f"Transaction can't be created as {kwargs.get('status')}")
+            return self._fail(OperationOutcome.INVALID_STATUS)
+        if CONCURRENCY_MODE == "optimistic":
+            done, result = await self._optimistic(self._create_transaction_cas, kwargs)
+            if done:
+                return result
+        user_id = kwargs.get("user_id")
+        amount = kwargs.get("amount")
+        async with self._transaction():
+            user = await self._lock(
+                self._session.get(User, user_id, with_for_update=True)
             )
             if not user:
-                LOGER.error(f"User {kwargs.get("user_id")} not found")
-                return None
+                LOGER.error(f"User {user_id} not found")
+                return self._fail(OperationOutcome.NOT_FOUND)
 
             LOGER.info(f"User balance: {user.current_balance}, Max: {user.max_balance}")
-            if kwargs.get("amount") < 0:
-                reserved_balance = await self._get_reserved_balance(
-                    kwargs.get("user_id"), is_negative=True
-                )
-                available_balance = user.current_balance - reserved_balance
-                LOGER.info(
-                    f"Available balance: {available_balance},"
-                    f" Requested: {abs(kwargs.get("amount"))}"
-                )
-                if available_balance < abs(kwargs.get("amount")):
-                    LOGER.error(f"Insufficient funds for user {kwargs.get("user_id")}")
-                    return None
-            elif kwargs.get("amount") > 0:
-                reserved_balance = await self._get_reserved_balance(
-                    kwargs.get("user_id"), is_negative=False
-                )
-                LOGER.error(reserved_balance)
-                new_balance = (
-                    user.current_balance + kwargs.get("amount") + reserved_balance
-                )
-                LOGER.warning(new_balance)
-                if new_balance > user.max_balance:
-                    LOGER.error(
-                        f"Balance would exceed max limit for user {kwargs.get("amount")}"
-                    )
-                    return None
-            db_transaction = Transaction(**kwargs)
+            overdue = await self._get_overdue_reserved([user_id])
+            outcome = self._check_hold(user, amount, overdue.get(user_id))
+            if outcome is not None:
+                return self._fail(outcome)
+            self._reserve(user, amount)
+            self._invalidate(User, user.id)
+            db_transaction = Transaction(id=uuid7(user_id), **kwargs)
             self._session.add(db_transaction)
+            self._outcome = OperationOutcome.CREATED
             LOGER.info(
                 f"Transaction created. "
-                f"User: {kwargs.get("user_id")},"
-                f" Amount: {kwargs.get("amount")},"
-                f" Type: {'DEBIT' if kwargs.get("amount") < 0 else 'CREDIT'}"
+                f"User: {user_id},"
+                f" Amount: {amount},"
+                f" Type: {'DEBIT' if amount < 0 else 'CREDIT'}"
             )
         return schemas.Transaction.model_validate(db_transaction)
 
-    @LOGER.catch
+    @LOGER.catch(exclude=RetryBudgetExceeded)
+    @observe_operation("confirm_transaction")
+    @retry_on_conflict
     async def confirm_transaction(
         self, transaction_id: uuid.UUID
     ) -> schemas.Transaction | None:
         """Подтверждает транзакцию и применяет изменение баланса"""
-        async with self._session.begin():
-            transaction = await self._session.get(
-                Transaction, transaction_id, with_for_update=True
+        if CONCURRENCY_MODE == "optimistic":
+            done, result = await self._optimistic(
+                self._settle_transaction_cas, transaction_id, True
+            )
+            if done:
+                return result
+        async with self._transaction():
+            transaction = await self._lock(
+                self._session.scalar(
+                    select(Transaction)
+                    .where(Transaction.id_clause(transaction_id))
+                    .with_for_update()
+                )
             )
             if not transaction:
                 LOGER.error(f"Transaction {transaction_id} not found")
-                return None
+                return self._fail(OperationOutcome.NOT_FOUND)
             if transaction.status != TransactionStatus.PENDING:
                 LOGER.warning(
                     f"Transaction {transaction_id} has invalid status: {transaction.status}"
                 )
-                return None
-            if transaction.created_at < (
-                datetime.datetime.now()
-                - datetime.timedelta(seconds=transaction.timeout_seconds)
-            ):
+                return self._fail(OperationOutcome.INVALID_STATUS)
+            user = await self._lock(
+                self._session.get(User, transaction.user_id, with_for_update=True)
+            )
+            self._invalidate(User, user.id)
+            self._invalidate(Transaction, transaction.id)
+            if self._is_expired(transaction):
+                self._release(user, transaction.amount)
                 transaction.status = TransactionStatus.EXPIRED
                 LOGER.warning(f"Transaction {transaction_id} expired")
-                return None
-            user = await self._session.get(
-                User, transaction.user_id, with_for_update=True
-            )
-            if transaction.amount < 0:
-                reserved_balance = await self._get_reserved_balance(user.id)
-                available_balance = user.current_balance - reserved_balance
-                if available_balance < abs(transaction.amount):
-                    LOGER.error(
-                        f"Insufficient funds for user {user.id}."
-                        f" Available: {available_balance},"
-                        f" required: {abs(transaction.amount)}"
-                    )
-                    return None
-
-            elif transaction.amount > 0:
-                new_balance = user.current_balance + transaction.amount
-                if new_balance > user.max_balance:
-                    LOGER.error(f"Balance would exceed max limit for user {user.id}")
-                    return None
+                return self._fail(OperationOutcome.EXPIRED)
+            overdue = await self._get_overdue_reserved([user.id])
+            outcome = self._check_confirm(
+                user, transaction.amount, overdue.get(user.id)
+            )
+            if outcome is not None:
+                return self._fail(outcome)
+            self._release(user, transaction.amount)
             user.current_balance += transaction.amount
-            if user.current_balance < 0:
-                LOGER.critical(
-                    f"Critical error: Balance went negative for user {user.id}"
-                )
-                return None
             transaction.status = TransactionStatus.CONFIRMED
             transaction.updated_at = datetime.datetime.now()
+            self._outcome = OperationOutcome.CONFIRMED
             LOGER.info(
                 f"Transaction {transaction_id} confirmed."
                 f" Amount: {transaction.amount},"
@@ -155,38 +441,637 @@ class UoW:
             )
         return schemas.Transaction.model_validate(transaction)
 
-    @LOGER.catch
-    async def _get_reserved_balance(self, user_id: int, is_negative: bool) -> int:
-        """Вычисляет сумму заблокированных средств для списаний"""
-        if is_negative:
-            amount_condition = Transaction.amount < 0
-        else:
-            amount_condition = Transaction.amount > 0
-        stmt = select(func.coalesce(func.sum(Transaction.amount), 0)).where(
-            (Transaction.user_id == user_id)
-            & (Transaction.status == TransactionStatus.PENDING)
-            & amount_condition
+    @LOGER.catch(exclude=RetryBudgetExceeded)
+    @observe_operation("cancel_transaction")
+    @retry_on_conflict
+    async def cancel_transaction(
+        self, transaction_id: uuid.UUID
+    ) -> schemas.Transaction | None:
+        """Отменяет транзакцию и снимает резерв средств"""
+        if CONCURRENCY_MODE == "optimistic":
+            done, result = await self._optimistic(
+                self._settle_transaction_cas, transaction_id, False
+            )
+            if done:
+                return result
+        async with self._transaction():
+            transaction = await self._lock(
+                self._session.scalar(
+                    select(Transaction)
+                    .where(Transaction.id_clause(transaction_id))
+                    .with_for_update()
+                )
+            )
+            if not transaction:
+                LOGER.error(f"Transaction {transaction_id} not found")
+                return self._fail(OperationOutcome.NOT_FOUND)
+            if transaction.status != TransactionStatus.PENDING:
+                LOGER.warning(
+                    f"Transaction {transaction_id} has invalid status: {transaction.status}"
+                )
+                return self._fail(OperationOutcome.INVALID_STATUS)
+            user = await self._lock(
+                self._session.get(User, transaction.user_id, with_for_update=True)
+            )
+            self._release(user, transaction.amount)
+            self._invalidate(User, user.id)
+            self._invalidate(Transaction, transaction.id)
+            transaction.status = TransactionStatus.CANCELED
+            transaction.updated_at = datetime.datetime.now()
+            self._outcome = OperationOutcome.CANCELED
+            LOGER.info(f"Transaction {transaction_id} canceled")
+        return schemas.Transaction.model_validate(transaction)
+
+    @LOGER.catch(exclude=RetryBudgetExceeded)
+    @observe_operation("create_transactions_batch")
+    @retry_on_conflict
+    async def create_transactions_batch(
+        self, items: list[dict]
+    ) -> list[tuple[OperationOutcome, Transaction | None]]:
+        """Создает пачку транзакций, блокируя каждого пользователя один раз"""
+        async with self._transaction():
+            user_ids = sorted({item.get("user_id") for item in items})
+            users = await self._lock(
+                self._session.execute(
+                    select(User)
+                    .where(User.id.in_(user_ids))
+                    .order_by(User.id)
+                    .with_for_update()
+                )
+            )
+            users = {user.id: user for user in users.scalars()}
+            overdue = await self._get_overdue_reserved(list(users))
+            rows, outcomes = [], []
+            for item in items:
+                if not self._is_new(item):
+                    outcomes.append(OperationOutcome.INVALID_STATUS)
+                    continue
+                user = users.get(item.get("user_id"))
+                if user is None:
+                    outcomes.append(OperationOutcome.NOT_FOUND)
+                    continue
+                outcome = self._check_hold(
+                    user, item.get("amount"), overdue.get(user.id)
+                )
+                if outcome is not None:
+                    outcomes.append(outcome)
+                    continue
+                self._reserve(user, item.get("amount"))
+                rows.append({**item, "id": uuid7(user.id)})
+                outcomes.append(OperationOutcome.CREATED)
+            self._invalidate(User, *{row["user_id"] for row in rows})
+            created = {}
+            if rows:
+                result = await self._session.scalars(
+                    insert(Transaction).returning(Transaction), rows
+                )
+                created = {transaction.id: transaction for transaction in result}
+        LOGER.info(f"Batch of {len(items)} transactions, created: {len(created)}")
+        inserted = iter([created[row["id"]] for row in rows])
+        return [
+            (outcome, next(inserted) if outcome == OperationOutcome.CREATED else None)
+            for outcome in outcomes
+        ]
+
+    @LOGER.catch(exclude=RetryBudgetExceeded)
+    @observe_operation("settle_transactions_batch")
+    @retry_on_conflict
+    async def settle_transactions_batch(
+        self, transaction_ids: list[uuid.UUID], confirm: bool
+    ) -> list[tuple[OperationOutcome, Transaction | None]]:
+        """Подтверждает или отменяет пачку PENDING транзакций.
+
+        Транзакции и пользователи блокируются по возрастанию id, изменения
+        балансов применяются одним UPDATE ... FROM (VALUES ...).
+        """
+        async with self._transaction():
+            transactions = await self._lock(
+                self._session.execute(
+                    select(
+                        Transaction.id,
+                        Transaction.user_id,
+                        Transaction.amount,
+                        Transaction.status,
+                        Transaction.expires_at,
+                    )
+                    .where(Transaction.ids_clause(sorted(set(transaction_ids))))
+                    .order_by(Transaction.id)
+                    .with_for_update()
+                )
+            )
+            transactions = {row.id: row for row in transactions}
+            user_ids = sorted(
+                {
+                    row.user_id
+                    for row in transactions.values()
+                    if row.status == TransactionStatus.PENDING
+                }
+            )
+            users = await self._lock(
+                self._session.execute(
+                    select(
+                        User.id,
+                        User.current_balance,
+                        User.max_balance,
+                        User.reserved_debit,
+                        User.reserved_credit,
+                    )
+                    .where(User.id.in_(user_ids))
+                    .order_by(User.id)
+                    .with_for_update()
+                )
+            )
+            users = {row.id: SimpleNamespace(**row._mapping) for row in users}
+            overdue = await self._get_overdue_reserved(list(users))
+            touched = {user_id: dict(users[user_id].__dict__) for user_id in users}
+
+            outcomes, settled = [], {status: [] for status in TransactionStatus}
+            processed = set()
+            for transaction_id in transaction_ids:
+                transaction = transactions.get(transaction_id)
+                if transaction is None:
+                    outcomes.append(OperationOutcome.NOT_FOUND)
+                    continue
+                if (
+                    transaction.status != TransactionStatus.PENDING
+                    or transaction_id in processed
+                ):
+                    outcomes.append(OperationOutcome.INVALID_STATUS)
+                    continue
+                user = users[transaction.user_id]
+                if self._is_expired(transaction):
+                    status = TransactionStatus.EXPIRED
+                    outcome = OperationOutcome.EXPIRED
+                elif not confirm:
+                    status = TransactionStatus.CANCELED
+                    outcome = OperationOutcome.CANCELED
+                else:
+                    outcome = self._check_confirm(
+                        user, transaction.amount, overdue.get(user.id)
+                    )
+                    if outcome is not None:
+                        outcomes.append(outcome)
+                        continue
+                    user.current_balance += transaction.amount
+                    status = TransactionStatus.CONFIRMED
+                    outcome = OperationOutcome.CONFIRMED
+                self._release(user, transaction.amount)
+                processed.add(transaction_id)
+                settled[status].append(transaction_id)
+                outcomes.append(outcome)
+
+            deltas = [
+                (
+                    user_id,
+                    user.current_balance - touched[user_id]["current_balance"],
+                    user.reserved_debit - touched[user_id]["reserved_debit"],
+                    user.reserved_credit - touched[user_id]["reserved_credit"],
+                )
+                for user_id, user in users.items()
+            ]
+            deltas = [delta for delta in deltas if any(delta[1:])]
+            self._invalidate(User, *(delta[0] for delta in deltas))
+            for ids in settled.values():
+                self._invalidate(Transaction, *ids)
+            if deltas:
+                await self._session.execute(self._apply_deltas(deltas))
+            result = {}
+            now = datetime.datetime.now()
+            for status, ids in settled.items():
+                if not ids:
+                    continue
+                updated = await self._session.scalars(
+                    update(Transaction)
+                    .where(Transaction.ids_clause(ids))
+                    .values(status=status, updated_at=now)
+                    .returning(Transaction)
+                    .execution_options(populate_existing=True)
+                )
+                result.update({transaction.id: transaction for transaction in updated})
+        LOGER.info(
+            f"Batch {'confirm' if confirm else 'cancel'} of {len(transaction_ids)}"
+            f" transactions, settled: {len(result)}"
+        )
+        return [
+            (
+                outcome,
+                result.get(transaction_id) if outcome in SETTLED_OUTCOMES else None,
+            )
+            for transaction_id, outcome in zip(transaction_ids, outcomes)
+        ]
+
+    async def _optimistic(self, attempt, *args) -> tuple[bool, object]:
+        """Выполняет CAS-попытку, повторяя ее при конфликте.
+
+        Возвращает (False, None), если все CAS_MAX_RETRIES попыток
+        проиграли гонку; тогда вызывающий метод берет блокировку строки.
+        """
+        for _ in range(CAS_MAX_RETRIES):
+            try:
+                return True, await attempt(*args)
+            except VersionConflict:
+                UOW_CAS_CONFLICTS.inc(operation=self._operation)
+        UOW_CAS_FALLBACKS.inc(operation=self._operation)
+        LOGER.warning(f"{self._operation}: CAS retries exhausted, taking row lock")
+        return False, None
+
+    @staticmethod
+    def _guarded(user, guard):
+        """Условие CAS-обновления строки пользователя.
+
+        Лимиты проверяются на актуальной версии строки, поэтому параллельные
+        резервы не конфликтуют. Версия сверяется, только если в проверке
+        участвуют резервы истекших транзакций: их снимает sweep, и снимок
+        мог устареть.
+        """
+        if user.overdue_debit or user.overdue_credit:
+            return and_(guard, User.version == user.version)
+        return guard
+
+    @staticmethod
+    def _hold_guard(user, amount: int):
+        """_check_hold в виде SQL-условия на строку users"""
+        if amount < 0:
+            return (
+                User.current_balance - User.reserved_debit + user.overdue_debit
+                >= -amount
+            )
+        if amount > 0:
+            return (
+                User.current_balance
+                + amount
+                + User.reserved_credit
+                - user.overdue_credit
+                <= User.max_balance
+            )
+        return true()
+
+    @staticmethod
+    def _confirm_guard(user, amount: int):
+        """_check_confirm в виде SQL-условия на строку users"""
+        if amount < 0:
+            return and_(
+                User.current_balance - User.reserved_debit + user.overdue_debit >= 0,
+                User.current_balance + amount >= 0,
+            )
+        if amount > 0:
+            return User.current_balance + amount <= User.max_balance
+        return true()
+
+    async def _create_transaction_cas(self, kwargs: dict) -> schemas.Transaction | None:
+        """Создание транзакции без SELECT ... FOR UPDATE.
+
+        Снимок пользователя читается без блокировки и нужен только для
+        причины отказа; резерв под условием лимитов и вставка транзакции
+        выполняются одним выражением. Строка пользователя блокируется
+        лишь от этого выражения до COMMIT.
+        """
+        user_id = kwargs.get("user_id")
+        amount = kwargs.get("amount")
+        async with self._transaction():
+            user = await self._session.execute(
+                select(*USER_SNAPSHOT).where(User.id == user_id)
+            )
+            user = user.one_or_none()
+            if user is None:
+                LOGER.error(f"User {user_id} not found")
+                return self._fail(OperationOutcome.NOT_FOUND)
+            outcome = self._check_hold(
+                user, amount, (user.overdue_debit, user.overdue_credit)
+            )
+            if outcome is not None:
+                return self._fail(outcome)
+            claimed = (
+                update(User)
+                .where(
+                    User.id == user_id,
+                    self._guarded(user, self._hold_guard(user, amount)),
+                )
+                .values(
+                    reserved_debit=User.reserved_debit + max(-amount, 0),
+                    reserved_credit=User.reserved_credit + max(amount, 0),
+                    version=User.version + 1,
+                )
+                .returning(User.id)
+                .cte("claimed")
+            )
+            row = {"id": uuid7(user_id), **kwargs}
+            result = await self._session.scalars(
+                insert(Transaction)
+                .from_select(
+                    list(row),
+                    select(
+                        *(
+                            (
+                                claimed.c.id
+                                if key == "user_id"
+                                else literal(value, Transaction.__table__.c[key].type)
+                            )
+                            for key, value in row.items()
+                        )
+                    ),
+                )
+                .returning(Transaction)
+            )
+            db_transaction = result.one_or_none()
+            if db_transaction is None:
+                raise VersionConflict
+            self._invalidate(User, user_id)
+            self._outcome = OperationOutcome.CREATED
+            LOGER.info(f"Transaction created. User: {user_id}, Amount: {amount}")
+        return schemas.Transaction.model_validate(db_transaction)
+
+    async def _settle_transaction_cas(
+        self, transaction_id: uuid.UUID, confirm: bool
+    ) -> schemas.Transaction | None:
+        """Подтверждение или отмена транзакции без SELECT ... FOR UPDATE.
+
+        Статус транзакции и баланс пользователя меняются одним выражением;
+        как и в блокирующем варианте, сначала блокируется транзакция,
+        затем пользователь.
+        """
+        async with self._transaction():
+            row = await self._session.execute(
+                select(
+                    Transaction.amount,
+                    Transaction.status,
+                    Transaction.expires_at,
+                    *USER_SNAPSHOT,
+                )
+                .join(User, User.id == Transaction.user_id)
+                .where(Transaction.id_clause(transaction_id))
+            )
+            row = row.one_or_none()
+            if row is None:
+                LOGER.error(f"Transaction {transaction_id} not found")
+                return self._fail(OperationOutcome.NOT_FOUND)
+            if row.status != TransactionStatus.PENDING:
+                LOGER.warning(
+                    f"Transaction {transaction_id} has invalid status: {row.status}"
+                )
+                return self._fail(OperationOutcome.INVALID_STATUS)
+            balance, guard = 0, true()
+            if self._is_expired(row):
+                status, outcome = TransactionStatus.EXPIRED, OperationOutcome.EXPIRED
+            elif not confirm:
+                status, outcome = TransactionStatus.CANCELED, OperationOutcome.CANCELED
+            else:
+                failed = self._check_confirm(
+                    row, row.amount, (row.overdue_debit, row.overdue_credit)
+                )
+                if failed is not None:
+                    return self._fail(failed)
+                status, outcome = (
+                    TransactionStatus.CONFIRMED,
+                    OperationOutcome.CONFIRMED,
+                )
+                balance, guard = row.amount, self._confirm_guard(row, row.amount)
+            settled = (
+                update(Transaction)
+                .where(Transaction.id_clause(transaction_id), Transaction.is_pending())
+                .values(status=status, updated_at=datetime.datetime.now())
+                .returning(*Transaction.__table__.c)
+                .cte("settled")
+            )
+            result = await self._session.execute(
+                update(User)
+                .where(User.id == settled.c.user_id, self._guarded(row, guard))
+                .values(
+                    current_balance=User.current_balance + balance,
+                    reserved_debit=User.reserved_debit - max(-row.amount, 0),
+                    reserved_credit=User.reserved_credit - max(row.amount, 0),
+                    version=User.version + 1,
+                )
+                .returning(*settled.c)
+                .execution_options(synchronize_session=False)
+            )
+            transaction = result.mappings().one_or_none()
+            if transaction is None:
+                # откатывает смену статуса, если условие на пользователя не выполнено
+                raise VersionConflict
+            self._invalidate(User, row.id)
+            self._invalidate(Transaction, transaction_id)
+            self._outcome = outcome
+            LOGER.info(f"Transaction {transaction_id} {status.value}")
+        if outcome == OperationOutcome.EXPIRED:
+            return self._fail(outcome)
+        return schemas.Transaction.model_validate(dict(transaction))
+
+    @staticmethod
+    def _apply_deltas(deltas: list[tuple]):
+        """UPDATE users по таблице приращений (id, balance, debit, credit)"""
+        rows = values(
+            column("id", UUID(as_uuid=True)),
+            column("balance", Integer),
+            column("debit", Integer),
+            column("credit", Integer),
+            name="deltas",
+        ).data(deltas)
+        return (
+            update(User)
+            .where(User.id == rows.c.id)
+            .values(
+                current_balance=User.current_balance + rows.c.balance,
+                reserved_debit=User.reserved_debit + rows.c.debit,
+                reserved_credit=User.reserved_credit + rows.c.credit,
+                version=User.version + 1,
+            )
+        )
+
+    @staticmethod
+    def _is_new(kwargs: dict) -> bool:
+        """Создается только PENDING транзакция: резерв снимают лишь с них"""
+        status = kwargs.get("status", TransactionStatus.PENDING)
+        return status == TransactionStatus.PENDING
+
+    @staticmethod
+    def _is_expired(transaction) -> bool:
+        """Истек ли срок ожидания транзакции"""
+        return transaction.expires_at < datetime.datetime.now()
+
+    async def _get_overdue_reserved(
+        self, user_ids: list[uuid.UUID]
+    ) -> dict[uuid.UUID, tuple[int, int]]:
+        """Резервы истекших, но еще не обработанных sweep транзакций"""
+        if not user_ids:
+            return {}
+        result = await self._session.execute(
+            self._pending_sums().where(
+                Transaction.user_id.in_(user_ids),
+                Transaction.expires_at <= func.localtimestamp(),
+            )
+        )
+        return {row.user_id: (row.debit, row.credit) for row in result}
+
+    @staticmethod
+    def _check_confirm(
+        user: User, amount: int, overdue: tuple[int, int] | None = None
+    ) -> OperationOutcome | None:
+        """Проверяет, можно ли провести зарезервированную сумму"""
+        overdue_debit, _ = overdue or (0, 0)
+        if amount < 0:
+            # резерв уже включает текущую транзакцию
+            available_balance = (
+                user.current_balance - user.reserved_debit + overdue_debit
+            )
+            if available_balance < 0:
+                LOGER.error(
+                    f"Insufficient funds for user {user.id}."
+                    f" Available: {available_balance + abs(amount)},"
+                    f" required: {abs(amount)}"
+                )
+                return OperationOutcome.INSUFFICIENT_FUNDS
+        elif amount > 0:
+            new_balance = user.current_balance + amount
+            if new_balance > user.max_balance:
+                LOGER.error(f"Balance would exceed max limit for user {user.id}")
+                return OperationOutcome.MAX_BALANCE_EXCEEDED
+        if user.current_balance + amount < 0:
+            LOGER.critical(f"Critical error: Balance went negative for user {user.id}")
+            return OperationOutcome.INSUFFICIENT_FUNDS
+        return None
+
+    @staticmethod
+    def _check_hold(
+        user: User, amount: int, overdue: tuple[int, int] | None = None
+    ) -> OperationOutcome | None:
+        """Проверяет, можно ли зарезервировать сумму с учетом других резервов.
+
+        Резервы истекших транзакций (overdue) не учитываются, даже если
+        sweep еще не перевел их в EXPIRED.
+        """
+        overdue_debit, overdue_credit = overdue or (0, 0)
+        if amount < 0:
+            available_balance = (
+                user.current_balance - user.reserved_debit + overdue_debit
+            )
+            LOGER.info(
+                f"Available balance: {available_balance}, Requested: {abs(amount)}"
+            )
+            if available_balance < abs(amount):
+                LOGER.error(f"Insufficient funds for user {user.id}")
+                return OperationOutcome.INSUFFICIENT_FUNDS
+        elif amount > 0:
+            new_balance = (
+                user.current_balance + amount + user.reserved_credit - overdue_credit
+            )
+            if new_balance > user.max_balance:
+                LOGER.error(f"Balance would exceed max limit for user {user.id}")
+                return OperationOutcome.MAX_BALANCE_EXCEEDED
+        return None
+
+    @staticmethod
+    def _reserve(user: User, amount: int) -> None:
+        """Увеличивает счетчики зарезервированных средств"""
+        if amount < 0:
+            user.reserved_debit += abs(amount)
+        elif amount > 0:
+            user.reserved_credit += amount
+
+    @staticmethod
+    def _release(user: User, amount: int) -> None:
+        """Уменьшает счетчики зарезервированных средств"""
+        if amount < 0:
+            user.reserved_debit -= abs(amount)
+        elif amount > 0:
+            user.reserved_credit -= amount
+
+    def _pending_sums(self):
+        """Запрос сумм PENDING транзакций в разрезе пользователей"""
+        return (
+            select(
+                Transaction.user_id,
+                func.sum(
+                    case((Transaction.amount < 0, -Transaction.amount), else_=0)
+                ).label("debit"),
+                func.sum(
+                    case((Transaction.amount > 0, Transaction.amount), else_=0)
+                ).label("credit"),
+            )
+            .where(Transaction.is_pending())
+            .group_by(Transaction.user_id)
         )
-        result = await self._session.execute(stmt)
-        reserved_sum = result.scalar()
-        if is_negative:
-            return abs(reserved_sum) if reserved_sum < 0 else 0
-        else:
-            return reserved_sum if reserved_sum > 0 else 0
 
     @LOGER.catch
-    def upd_transaction_expired(self):
-        """метод для обновления статусов у транзакции"""
-        with Session(self._sync_engine) as session:
-            sql = text(
-                """
-            UPDATE transactions 
-            SET status = 'EXPIRED' 
-            WHERE status = 'PENDING' 
-            AND created_at < NOW() - INTERVAL '1 second' * timeout_seconds
-            """
-            )
-            res = session.execute(sql)
-            session.commit()
-            session.close()
-            return res
+    async def check_reserved_balance(self, fix: bool = False) -> list[dict]:
+        """Сверяет счетчики резервов с суммой PENDING транзакций"""
+        pending = self._pending_sums().subquery()
+        expected_debit = func.coalesce(pending.c.debit, 0)
+        expected_credit = func.coalesce(pending.c.credit, 0)
+        stmt = (
+            select(
+                User.id,
+                User.reserved_debit,
+                User.reserved_credit,
+                expected_debit.label("expected_debit"),
+                expected_credit.label("expected_credit"),
+            )
+            .outerjoin(pending, pending.c.user_id == User.id)
+            .where(
+                (User.reserved_debit != expected_debit)
+                | (User.reserved_credit != expected_credit)
+            )
+        )
+        async with self._transaction():
+            rows = (await self._session.execute(stmt)).mappings().all()
+            mismatches = [dict(row) for row in rows]
+            for row in mismatches:
+                LOGER.error(f"Reserved balance mismatch: {row}")
+                if not fix:
+                    continue
+                user = await self._session.get(User, row["id"], with_for_update=True)
+                self._invalidate(User, user.id)
+                sums = await self._session.execute(
+                    self._pending_sums().where(Transaction.user_id == user.id)
+                )
+                sums = sums.one_or_none()
+                user.reserved_debit = sums.debit if sums else 0
+                user.reserved_credit = sums.credit if sums else 0
+        return mismatches
+
+    @LOGER.catch(exclude=RetryBudgetExceeded)
+    @observe_operation("expire_transactions")
+    @retry_on_conflict
+    async def expire_transactions(self, chunk_size: int) -> int | None:
+        """Переводит в EXPIRED одну порцию просроченных транзакций.
+
+        Возвращает число обработанных строк или None, если порцию уже
+        обрабатывает другой воркер.
+        """
+        async with self._transaction():
+            locked = await self._session.execute(
+                select(func.pg_try_advisory_xact_lock(EXPIRE_LOCK_KEY))
+            )
+            if not locked.scalar():
+                return None
+            result = await self._session.execute(
+                EXPIRE_CHUNK_SQL, {"chunk_size": chunk_size}
+            )
+            expired = result.all()
+            self._invalidate(Transaction, *(row.id for row in expired))
+            self._invalidate(User, *{row.user_id for row in expired})
+        return len(expired)
+
+    async def warm_up(self, user_id: uuid.UUID) -> None:
+        """Выполняет выражения горячего пути для пользователя user_id.
+
+        Блокировка пользователя, сумма резервов, вставка и подтверждение
+        транзакции обоих знаков и страницы истории компилируются в кэш
+        движка и готовятся на соединении сессии. Вызывается в транзакции,
+        которая затем откатывается; методы вызываются без декораторов,
+        чтобы прогрев не попадал в метрики операций и не повторялся.
+        """
+        self._operation = "warm_up"
+        create = inspect.unwrap(self.create_transaction)
+        confirm = inspect.unwrap(self.confirm_transaction)
+        for amount in (-1, 1):
+            created = await create(
+                self,
+                user_id=user_id,
+                amount=amount,
+                status=TransactionStatus.PENDING,
+                timeout_seconds=60,
+            )
+            await confirm(self, created.id)
+        page = await self.get_transactions_after(1, user_id)
+        await self.get_transactions_after(1, user_id, (page[0].created_at, page[0].id))
@@ -0,0 +1,115 @@
+"""Прогрев соединений перед приемом трафика.
+
+После запуска воркера первые запросы платят за установку соединений,
+компиляцию выражений SQLAlchemy и подготовку их в asyncpg. Прогрев
+заранее открывает DB_WARMUP_CONNECTIONS соединений пула каждого шарда
+и реплики и выполняет на каждом выражения горячего пути (UoW.warm_up)
+в транзакции, которая откатывается: подготовленные выражения asyncpg
+живут в соединении, поэтому готовятся на каждом. На репликах
+выполняется только чтение истории. Пока прогрев не завершен, /ready
+отвечает 503.
+"""
+
+import asyncio
+import datetime
+import time
+import uuid
+from contextlib import AsyncExitStack
+
+from sqlalchemy import insert
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, AsyncSession
+
+from database.db import REPLICAS, SHARDS
+from database.models import User
+from database.uow import UoW
+from src.config import LOGER
+from src.metrics import Gauge
+from src.settings import (
+    DB_POOL_SIZE,
+    DB_WARMUP_CONNECTIONS,
+    DB_WARMUP_RETRY_SECONDS,
+)
+
+
+class WarmUp:
+    """Состояние прогрева воркера"""
+
+    def __init__(self):
+        self.ready = False
+        self.seconds: float | None = None
+
+    async def run(self) -> None:
+        """Прогревает пулы, повторяя попытку до успеха; затем ready"""
+        while True:
+            started = time.perf_counter()
+            try:
+                await asyncio.gather(
+                    *(self._prefill(shard.engine, self._prepare) for shard in SHARDS),
+                    *(
+                        self._prefill(replica.engine, self._prepare_reads)
+                        for replica in REPLICAS
+                    ),
+                )
+            except (OSError, DBAPIError):
+                LOGER.exception("DB warm-up failed")
+                await asyncio.sleep(DB_WARMUP_RETRY_SECONDS)
+                continue
+            self.seconds = time.perf_counter() - started
+            self.ready = True
+            LOGER.info(f"DB warm-up done in {self.seconds:.3f}s")
+            return
+
+    @staticmethod
+    async def _prefill(engine: AsyncEngine, prepare) -> None:
+        """Открывает соединения одновременно, чтобы пул создал их все"""
+        # соединения сверх pool_size пул закрыл бы при возврате
+        size = min(DB_WARMUP_CONNECTIONS, DB_POOL_SIZE)
+        async with AsyncExitStack() as stack:
+            connections = [
+                await stack.enter_async_context(engine.connect()) for _ in range(size)
+            ]
+            await asyncio.gather(*(prepare(connection) for connection in connections))
+
+    @staticmethod
+    async def _prepare(connection: AsyncConnection) -> None:
+        user_id = uuid.uuid4()
+        async with connection.begin() as transaction:
+            await connection.execute(
+                insert(User).values(id=user_id, current_balance=1, max_balance=1)
+            )
+            session = AsyncSession(
+                bind=connection,
+                expire_on_commit=False,
+                join_transaction_mode="create_savepoint",
+            )
+            try:
+                await UoW(session).warm_up(user_id)
+            finally:
+                await session.close()
+            await transaction.rollback()
+
+    @staticmethod
+    async def _prepare_reads(connection: AsyncConnection) -> None:
+        session = AsyncSession(bind=connection)
+        try:
+            uow = UoW(session)
+            await uow.get_transactions_after(1, uuid.uuid4())
+            await uow.get_transactions_after(
+                1, uuid.uuid4(), (datetime.datetime.now(), uuid.uuid4())
+            )
+        finally:
+            await session.close()
+
+
+WARM_UP = WarmUp()
+APP_READY = Gauge(
+    "app_ready",
+    "1 once DB warm-up is done and the worker reports ready",
+    callback=lambda: {(): int(WARM_UP.ready)},
+)
+DB_WARMUP_SECONDS = Gauge(
+    "db_warmup_seconds",
+    "Duration of the last completed DB warm-up",
+    callback=lambda: {(): WARM_UP.seconds or 0},
+)
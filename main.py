@@ -1,31 +1,86 @@
 """Файл для запуска api"""
 
+import asyncio
 from contextlib import asynccontextmanager
 
 import uvicorn
-from apscheduler.schedulers.background import BackgroundScheduler
-from fastapi import FastAPI, Response
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 
-import database as db
 from api import app as app_router
+from api.middleware import MetricsMiddleware
+from api.responses import ORJSONResponse
+from database.db import REPLICAS, SHARDS, dispose_engines, monitor_replicas
+from database.events import EVENTS
+from database.leader import run_as_leader
+from database.retry import RetryBudgetExceeded
+from database.shards import SHARD_MAP, ShardUnavailable
+from database.warmup import WARM_UP
+from src import jobs
 from src.config import LOGER
-from src.settings import APP_HOST, APP_PORT, APP_RELOAD
-
-
-def upd_transaction_status():
-    """задача по обновлению данных в БД"""
-    db.UoW().upd_transaction_expired()
+from src.metrics import REGISTRY
+from src.settings import (
+    APP_HOST,
+    APP_PORT,
+    APP_RELOAD,
+    APP_WORKERS,
+    APP_LOOP,
+    APP_HTTP,
+    APP_BACKLOG,
+    APP_KEEPALIVE_SECONDS,
+    APP_GRACEFUL_SHUTDOWN_SECONDS,
+    APP_ACCESS_LOG,
+    EVENTS_ENABLED,
+    EXPIRE_INTERVAL_SECONDS,
+    IDEMPOTENCY_PURGE_INTERVAL_SECONDS,
+    PARTITION_MAINTENANCE_INTERVAL_SECONDS,
+    JOBS_LEADER_ELECTION,
+)
 
 
-scheduler = BackgroundScheduler()
-scheduler.add_job(upd_transaction_status, "cron", minute="*/1")
+def start_jobs() -> list[asyncio.Task]:
+    """Фоновые задачи, которым достаточно одной копии на развертывание"""
+    return [
+        asyncio.create_task(
+            jobs.run_periodic(EXPIRE_INTERVAL_SECONDS, jobs.expire_transactions)
+        ),
+        asyncio.create_task(
+            jobs.run_periodic(
+                IDEMPOTENCY_PURGE_INTERVAL_SECONDS, jobs.purge_idempotency_keys
+            )
+        ),
+        asyncio.create_task(
+            jobs.run_periodic(
+                PARTITION_MAINTENANCE_INTERVAL_SECONDS,
+                jobs.maintain_transaction_partitions,
+            )
+        ),
+    ]
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    scheduler.start()
+    # без карты бакетов запросы не на что маршрутизировать
+    if SHARD_MAP.sharded:
+        await SHARD_MAP.refresh()
+    if JOBS_LEADER_ELECTION:
+        tasks = [asyncio.create_task(run_as_leader(start_jobs))]
+    else:
+        tasks = start_jobs()
+    # LISTEN нужен каждому воркеру: подписчики SSE у каждого свои
+    if EVENTS_ENABLED:
+        tasks.extend(asyncio.create_task(EVENTS.listen(shard)) for shard in SHARDS)
+    if SHARD_MAP.sharded:
+        tasks.append(asyncio.create_task(SHARD_MAP.monitor()))
+    if REPLICAS:
+        tasks.append(asyncio.create_task(monitor_replicas()))
+    # трафик принимается сразу, но /ready ждет окончания прогрева
+    tasks.append(asyncio.create_task(WARM_UP.run()))
     yield
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await dispose_engines()
 
 
 origins = ["*"]
@@ -38,10 +93,12 @@ app = FastAPI(
         "email": "williamcano97@gmail.com",
     },
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 app.include_router(router=app_router)
 
+app.add_middleware(MetricsMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -64,10 +121,66 @@ async def curl():
     return Response(content="OK", status_code=200)
 
 
+@app.get("/ready")
+async def ready():
+    """эндпоинт готовности: 503, пока соединения с БД не прогреты"""
+    if not WARM_UP.ready:
+        return Response(content="warming up", status_code=503)
+    return Response(content="OK", status_code=200)
+
+
+@app.exception_handler(RetryBudgetExceeded)
+async def retry_budget_exceeded(request: Request, exc: RetryBudgetExceeded):
+    """409 при конфликте транзакций, 503 при таймауте блокировки"""
+    return ORJSONResponse(
+        status_code=exc.status_code,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.exception_handler(ShardUnavailable)
+async def shard_unavailable(request: Request, exc: ShardUnavailable):
+    """503, пока бакет пользователя переносится на другой шард"""
+    return ORJSONResponse(
+        status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"}
+    )
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """эндпоинт метрик в формате Prometheus.
+
+    Реестр метрик у каждого процесса свой: при APP_WORKERS > 1 ответ
+    содержит метрики только ответившего воркера. Для полной картины
+    запускайте по одному воркеру на контейнер и масштабируйте контейнеры.
+    """
+    return Response(content=REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
 @LOGER.catch
 def main(host: str, port: int, reload: bool) -> uvicorn:
-    """Функция для запуска api"""
-    return uvicorn.run("main:app", host=f"{host}", port=port, reload=reload)
+    """Функция для запуска api.
+
+    С reload (APP_RELOAD=True, как в .env.example) - один процесс для
+    разработки; иначе APP_WORKERS процессов с настройками для эксплуатации.
+    Пул соединений с БД и метрики у каждого воркера свои: на сервер
+    приходится до APP_WORKERS * (DB_POOL_SIZE + DB_MAX_OVERFLOW) соединений.
+    """
+    if reload:
+        return uvicorn.run("main:app", host=f"{host}", port=port, reload=True)
+    return uvicorn.run(
+        "main:app",
+        host=f"{host}",
+        port=port,
+        workers=APP_WORKERS,
+        loop=APP_LOOP,
+        http=APP_HTTP,
+        backlog=APP_BACKLOG,
+        timeout_keep_alive=APP_KEEPALIVE_SECONDS,
+        timeout_graceful_shutdown=APP_GRACEFUL_SHUTDOWN_SECONDS,
+        access_log=APP_ACCESS_LOG,
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,130 @@
+"""Замер массового создания пользователей против POST /users/ по одному.
+
+python -m scripts.bench_bulk_users [--url http://127.0.0.1:8000]
+    [--records 100000] [--single 2000] [--concurrency 16]
+
+Нужен запущенный сервер (make up_local или python main.py) с тем же
+X_API_KEY. Входные NDJSON и CSV генерируются во временный каталог.
+Отдельно замеряется разбор и проверка записей api.bulk.read_batches в
+процессе, без сервера и БД.
+"""
+
+import argparse
+import asyncio
+import pathlib
+import tempfile
+import time
+
+import httpx
+
+from api import schemas
+from api.bulk import read_batches
+from src.settings import USER_BULK_BATCH_SIZE, USER_BULK_LIMIT, X_API_KEY
+
+HEADERS = {"x-api-key": X_API_KEY}
+RECORD = {"current_balance": 1, "max_balance": 10}
+
+
+def _write_inputs(directory: pathlib.Path, records: int) -> dict:
+    """Файлы NDJSON и CSV по records записей"""
+    paths = {
+        schemas.FileFormat.NDJSON: directory / "users.ndjson",
+        schemas.FileFormat.CSV: directory / "users.csv",
+    }
+    paths[schemas.FileFormat.NDJSON].write_text(
+        '{"current_balance": 1, "max_balance": 10}\n' * records
+    )
+    paths[schemas.FileFormat.CSV].write_text(
+        "current_balance,max_balance\n" + "1,10\n" * records
+    )
+    return paths
+
+
+async def _parse(path: pathlib.Path) -> int:
+    async def lines():
+        with open(path, "rb") as file:
+            for line in file:
+                yield line
+
+    count = 0
+    async for batch in read_batches(
+        schemas.CreateUser,
+        lines(),
+        schemas.FileFormat.NDJSON,
+        USER_BULK_BATCH_SIZE,
+        USER_BULK_LIMIT,
+    ):
+        count += len(batch)
+    return count
+
+
+def _bulk(url: str, path: pathlib.Path, file_format: schemas.FileFormat) -> None:
+    with open(path, "rb") as file, httpx.Client(base_url=url, timeout=600) as client:
+        started = time.perf_counter()
+        response = client.post(
+            "/api/v1/users/bulk",
+            params={"format": file_format.value},
+            content=file,
+            headers=HEADERS,
+        )
+        elapsed = time.perf_counter() - started
+    response.raise_for_status()
+    created = len(response.json())
+    print(
+        f"bulk {file_format.value:6s} {created:8d} users {elapsed:7.2f} s"
+        f" {created / elapsed:8.0f} users/s"
+    )
+
+
+async def _single(url: str, records: int, concurrency: int) -> None:
+    limits = httpx.Limits(max_connections=concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=60, limits=limits) as client:
+
+        async def create():
+            async with semaphore:
+                response = await client.post(
+                    "/api/v1/users/", json=RECORD, headers=HEADERS
+                )
+                response.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(create() for _ in range(records)))
+        elapsed = time.perf_counter() - started
+    print(
+        f"per-row x{concurrency:<3d} {records:8d} users {elapsed:7.2f} s"
+        f" {records / elapsed:8.0f} users/s"
+    )
+
+
+def main() -> int:
+    """Точка входа замера"""
+    parser = argparse.ArgumentParser(prog="python -m scripts.bench_bulk_users")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="адрес API")
+    parser.add_argument(
+        "--records", type=int, default=100_000, help="записей в массовой загрузке"
+    )
+    parser.add_argument(
+        "--single", type=int, default=2000, help="пользователей по одному"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=16, help="параллельных POST /users/"
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = _write_inputs(pathlib.Path(directory), args.records)
+        started = time.perf_counter()
+        count = asyncio.run(_parse(paths[schemas.FileFormat.NDJSON]))
+        print(
+            f"parse+validate {count:8d} records {time.perf_counter() - started:7.2f} s"
+        )
+        for file_format, path in paths.items():
+            _bulk(args.url, path, file_format)
+    asyncio.run(_single(args.url, args.single, 1))
+    asyncio.run(_single(args.url, args.single, args.concurrency))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,123 @@
+"""Замер пар create+confirm в режимах CONCURRENCY_MODE.
+
+CONCURRENCY_MODE=optimistic python -m scripts.bench_concurrency
+    [--workers 32] [--seconds 5]
+
+Воркеры в одном процессе создают холд -1 и проводят его, каждая операция
+в своей сессии, как в запросах API. Первый прогон - все воркеры на одном
+пользователе, второй - у каждого воркера свой. После прогона балансы
+сверяются с числом проведенных холдов. В конце воркеры одновременно
+ставят холды -10 на баланс 100: создано должно быть ровно 10.
+"""
+
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import select
+
+from database import TransactionStatus, User
+from database.db import async_engine, async_session_factory
+from database.metrics import UOW_CAS_CONFLICTS, UOW_CAS_FALLBACKS
+from database.uow import UoW
+from src.config import LOGER
+from src.settings import CONCURRENCY_MODE
+
+BALANCE = 10**9
+
+
+def _total(counter) -> float:
+    return sum(counter._values.values())
+
+
+async def _worker(user_id, stop: float, confirmed: list[int]) -> None:
+    while time.perf_counter() < stop:
+        async with async_session_factory() as session:
+            transaction = await UoW(session).create_transaction(
+                user_id=user_id,
+                amount=-1,
+                status=TransactionStatus.PENDING,
+                timeout_seconds=300,
+            )
+        async with async_session_factory() as session:
+            if await UoW(session).confirm_transaction(transaction.id) is not None:
+                confirmed[0] += 1
+
+
+async def _run(users: int, workers: int, seconds: float) -> None:
+    async with async_session_factory() as session:
+        rows = [
+            User(current_balance=BALANCE, max_balance=2 * BALANCE) for _ in range(users)
+        ]
+        session.add_all(rows)
+        await session.commit()
+        ids = [row.id for row in rows]
+    conflicts, fallbacks = _total(UOW_CAS_CONFLICTS), _total(UOW_CAS_FALLBACKS)
+    confirmed = [0]
+    stop = time.perf_counter() + seconds
+    await asyncio.gather(
+        *(_worker(ids[number % users], stop, confirmed) for number in range(workers))
+    )
+    async with async_session_factory() as session:
+        balances = await session.execute(
+            select(User.current_balance, User.reserved_debit).where(User.id.in_(ids))
+        )
+        balances = balances.all()
+    spent = sum(BALANCE - balance for balance, _ in balances)
+    reserved = sum(reserved for _, reserved in balances)
+    print(
+        f"{CONCURRENCY_MODE:12s} W={workers:<3d} users={users:<3d}"
+        f" {confirmed[0] / seconds:7.0f} pairs/s"
+        f"  conflicts {_total(UOW_CAS_CONFLICTS) - conflicts:.0f}"
+        f"  fallbacks {_total(UOW_CAS_FALLBACKS) - fallbacks:.0f}"
+        f"  balances {'ok' if (spent, reserved) == (confirmed[0], 0) else 'MISMATCH'}"
+    )
+
+
+async def _race(workers: int) -> None:
+    """workers параллельных холдов -10 на балансе 100: пройти должны 10"""
+    async with async_session_factory() as session:
+        user = User(current_balance=100, max_balance=1000)
+        session.add(user)
+        await session.commit()
+        user_id = user.id
+
+    async def hold():
+        async with async_session_factory() as session:
+            return await UoW(session).create_transaction(
+                user_id=user_id,
+                amount=-10,
+                status=TransactionStatus.PENDING,
+                timeout_seconds=300,
+            )
+
+    results = await asyncio.gather(*(hold() for _ in range(workers)))
+    created = sum(result is not None for result in results)
+    print(
+        f"{CONCURRENCY_MODE:12s} race of {workers} holds -10 on 100: {created} created"
+    )
+
+
+async def _main(workers: int, seconds: float) -> None:
+    try:
+        await _run(1, workers, seconds)
+        await _run(workers, workers, seconds)
+        await _race(workers)
+    finally:
+        await async_engine.dispose()
+
+
+def main() -> int:
+    """Точка входа замера"""
+    parser = argparse.ArgumentParser(prog="python -m scripts.bench_concurrency")
+    parser.add_argument("--workers", type=int, default=32, help="число воркеров")
+    parser.add_argument("--seconds", type=float, default=5, help="длительность")
+    args = parser.parse_args()
+    # журнал каждой операции заметно замедляет и без того CPU-bound замер
+    LOGER.remove()
+    asyncio.run(_main(args.workers, args.seconds))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,77 @@
+"""Нагрузка keep-alive GET-запросами на запущенный сервер.
+
+python -m scripts.bench_http PATH [--host 127.0.0.1] [--port 8000]
+    [--connections 32] [--seconds 10]
+
+Каждое соединение шлет следующий запрос сразу после ответа на
+предыдущий. Клиент минимальный, на сырых сокетах, чтобы сам он не
+ограничивал замер, как это делал бы HTTP-клиент общего назначения.
+Сравнение воркеров и APP_LOOP/APP_HTTP - перезапуском сервера с другими
+настройками.
+"""
+
+import argparse
+import asyncio
+import time
+
+from src.settings import X_API_KEY
+
+try:
+    import uvloop
+except ImportError:  # на Windows uvloop нет
+    uvloop = None
+
+
+async def _connection(host: str, port: int, request: bytes, stop: float) -> int:
+    """Число ответов, полученных одним соединением до stop"""
+    reader, writer = await asyncio.open_connection(host, port)
+    responses = 0
+    try:
+        while time.perf_counter() < stop:
+            writer.write(request)
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = 0
+            for line in head.split(b"\r\n"):
+                name, _, value = line.partition(b":")
+                if name.strip().lower() == b"content-length":
+                    length = int(value)
+            await reader.readexactly(length)
+            responses += 1
+    finally:
+        writer.close()
+    return responses
+
+
+async def _load(host: str, port: int, path: str, connections: int, seconds: float):
+    request = (
+        f"GET {path} HTTP/1.1\r\nHost: {host}\r\nx-api-key: {X_API_KEY}\r\n\r\n"
+    ).encode()
+    stop = time.perf_counter() + seconds
+    return sum(
+        await asyncio.gather(
+            *(_connection(host, port, request, stop) for _ in range(connections))
+        )
+    )
+
+
+def main() -> int:
+    """Точка входа замера"""
+    parser = argparse.ArgumentParser(prog="python -m scripts.bench_http")
+    parser.add_argument("path", help="путь запроса, например /api/v1/users/<id>")
+    parser.add_argument("--host", default="127.0.0.1", help="адрес сервера")
+    parser.add_argument("--port", type=int, default=8000, help="порт сервера")
+    parser.add_argument("--connections", type=int, default=32, help="соединений")
+    parser.add_argument("--seconds", type=float, default=10, help="длительность")
+    args = parser.parse_args()
+
+    load = _load(args.host, args.port, args.path, args.connections, args.seconds)
+    responses = uvloop.run(load) if uvloop else asyncio.run(load)
+    print(
+        f"GET {args.path} connections={args.connections}:"
+        f" {responses / args.seconds:.0f} req/s"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,118 @@
+"""Замер сериализации ответов: прежний путь FastAPI против respond().
+
+python -m scripts.bench_serialization [--rows 1000] [--repeat 5]
+
+Пользователь и страница транзакций читаются из REAL_DATABASE_URL, чтобы
+в значениях были типы asyncpg. Прежний путь - model_validate в роуте,
+повторная проверка по response_model, jsonable_encoder и json.dumps,
+как в fastapi.routing. Печатается лучшее время из repeat прогонов.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from sqlalchemy import select
+
+from api import schemas
+from api.responses import respond
+from database import Transaction, User
+from database.db import async_engine, async_session_factory
+
+
+async def _load(rows: int) -> tuple[User, list[Transaction]]:
+    async with async_session_factory() as session:
+        user = await session.scalar(select(User).limit(1))
+        transactions = (await session.scalars(select(Transaction).limit(rows))).all()
+    await async_engine.dispose()
+    return user, list(transactions)
+
+
+def _fastapi(schema, content_of):
+    """Ответ, как его собирал FastAPI до respond()"""
+    field = create_model_field(name="response", type_=schema, mode="serialization")
+
+    async def serialize():
+        content = await serialize_response(
+            field=field, response_content=content_of(), is_coroutine=True
+        )
+        return json.dumps(
+            content,
+            ensure_ascii=False,
+            allow_nan=False,
+            indent=None,
+            separators=(",", ":"),
+        ).encode("utf-8")
+
+    return serialize
+
+
+def _best(serialize, number: int, repeat: int) -> float:
+    """Лучшее среднее время вызова, секунд"""
+
+    async def loop():
+        for _ in range(number):
+            result = serialize()
+            if asyncio.iscoroutine(result):
+                await result
+
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        asyncio.run(loop())
+        best = min(best, (time.perf_counter() - started) / number)
+    return best
+
+
+def main() -> int:
+    """Точка входа замера"""
+    parser = argparse.ArgumentParser(prog="python -m scripts.bench_serialization")
+    parser.add_argument("--rows", type=int, default=1000, help="строк на странице")
+    parser.add_argument("--repeat", type=int, default=5, help="число прогонов")
+    args = parser.parse_args()
+
+    user, transactions = asyncio.run(_load(args.rows))
+    if user is None or not transactions:
+        print("no users or transactions in the database")
+        return 1
+
+    def page():
+        return {"transactions": transactions, "total": None, "next_cursor": None}
+
+    def page_dto():
+        return {
+            "transactions": [
+                schemas.Transaction.model_validate(row) for row in transactions
+            ],
+            "total": None,
+            "next_cursor": None,
+        }
+
+    cases = (
+        (
+            "single user",
+            3000,
+            _fastapi(schemas.User, lambda: schemas.User.model_validate(user)),
+            lambda: respond(schemas.User, user).body,
+        ),
+        (
+            f"{len(transactions)}-row page",
+            10,
+            _fastapi(schemas.TransactionPage, page_dto),
+            lambda: respond(schemas.TransactionPage, page()).body,
+        ),
+    )
+    for name, number, before, after in cases:
+        print(
+            f"{name:16s}"
+            f" fastapi {_best(before, number, args.repeat) * 1e6:10.1f} us"
+            f"  respond {_best(after, number, args.repeat) * 1e6:10.1f} us"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,60 @@
+"""Замер POST /transaction/batch против холдов по одному.
+
+python -m scripts.bench_transaction_batch [--items 300]
+
+Приложение поднимается в процессе через TestClient, БД - REAL_DATABASE_URL.
+Все холды ставятся на одного пользователя: пачка проходит одним запросом
+и одной блокировкой строки, по одному - запросом на холд.
+"""
+
+import argparse
+import time
+
+from fastapi.testclient import TestClient
+
+from main import app
+from src.settings import X_API_KEY
+
+HEADERS = {"x-api-key": X_API_KEY}
+HOLD = {"amount": 1, "status": "pending", "timeout_seconds": 60}
+
+
+def main() -> int:
+    """Точка входа замера"""
+    parser = argparse.ArgumentParser(prog="python -m scripts.bench_transaction_batch")
+    parser.add_argument("--items", type=int, default=300, help="холдов в замере")
+    args = parser.parse_args()
+
+    with TestClient(app) as client:
+        response = client.post(
+            "/api/v1/users/",
+            json={"current_balance": 0, "max_balance": 2 * args.items + 2},
+            headers=HEADERS,
+        )
+        response.raise_for_status()
+        hold = {"user_id": response.json()["id"], **HOLD}
+        # прогрев: соединения пула и подготовленные выражения обоих путей
+        client.post("/api/v1/transaction/batch", json=[hold], headers=HEADERS)
+        client.post("/api/v1/transaction/", json=hold, headers=HEADERS)
+
+        started = time.perf_counter()
+        response = client.post(
+            "/api/v1/transaction/batch", json=[hold] * args.items, headers=HEADERS
+        )
+        response.raise_for_status()
+        batched = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for _ in range(args.items):
+            client.post(
+                "/api/v1/transaction/", json=hold, headers=HEADERS
+            ).raise_for_status()
+        single = time.perf_counter() - started
+
+    print(f"batch       {args.items / batched:8.0f} items/s")
+    print(f"one-by-one  {args.items / single:8.0f} items/s")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,87 @@
+"""Фоновые задачи приложения, выполняемые в его event loop"""
+
+import asyncio
+import time
+from typing import Awaitable, Callable
+
+import database as db
+from database.db import SHARDS, Shard
+from database.idempotency import IDEMPOTENCY
+from database.partitions import maintain_partitions
+from src.config import LOGER
+from src.metrics import Counter, Histogram
+from src.settings import EXPIRE_CHUNK_SIZE
+
+EXPIRED_TRANSACTIONS = Counter(
+    "expired_transactions_total", "Transactions moved to EXPIRED by the sweep"
+)
+EXPIRE_SWEEP_SECONDS = Histogram(
+    "expire_sweep_duration_seconds", "Duration of one expiry sweep"
+)
+
+
+async def expire_transactions() -> int:
+    """Порционно переводит просроченные транзакции в EXPIRED на всех шардах.
+
+    Шарды обрабатываются параллельно; ошибка на одном не останавливает
+    остальные.
+    """
+    started = time.perf_counter()
+    results = await asyncio.gather(
+        *(_expire_shard(shard) for shard in SHARDS), return_exceptions=True
+    )
+    EXPIRE_SWEEP_SECONDS.observe(time.perf_counter() - started)
+    total = 0
+    for shard, result in zip(SHARDS, results):
+        if isinstance(result, Exception):
+            LOGER.error(f"Expiry sweep on shard {shard.name} failed: {result!r}")
+            continue
+        total += result
+    if total:
+        LOGER.info(f"Expired transactions: {total}")
+    return total
+
+
+async def _expire_shard(shard: Shard) -> int:
+    total = 0
+    while True:
+        async with shard.session_factory() as session:
+            expired = await db.UoW(session).expire_transactions(EXPIRE_CHUNK_SIZE)
+        if not expired:
+            return total
+        total += expired
+        EXPIRED_TRANSACTIONS.inc(expired)
+        if expired < EXPIRE_CHUNK_SIZE:
+            return total
+
+
+async def purge_idempotency_keys() -> int:
+    """Удаляет устаревшие ключи идемпотентности"""
+    purged = await IDEMPOTENCY.purge()
+    if purged:
+        LOGER.info(f"Purged idempotency keys: {purged}")
+    return purged
+
+
+async def maintain_transaction_partitions() -> dict[str, list[str]]:
+    """Создает будущие секции transactions и архивирует устаревшие на всех шардах"""
+    changes = {"created": [], "archived": []}
+    for shard in SHARDS:
+        shard_changes = await maintain_partitions(engine=shard.engine)
+        if any(shard_changes.values()):
+            LOGER.info(f"Transaction partitions on shard {shard.name}: {shard_changes}")
+        for action, names in shard_changes.items():
+            changes[action].extend(names)
+    return changes
+
+
+async def run_periodic(interval: float, job: Callable[[], Awaitable[object]]) -> None:
+    """Запускает задачу с заданным интервалом до отмены"""
+    while True:
+        try:
+            await job()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            LOGER.exception(f"Background job {job.__name__} failed")
+        await asyncio.sleep(interval)
@@ -0,0 +1,152 @@
+"""Сервисные команды: python -m src.service <command>"""
+
+import argparse
+import asyncio
+import sys
+
+from sqlalchemy import func, select
+
+import database as db
+from api import schemas
+from api.bulk import RecordError, read_batches
+from database import rebalance
+from database.db import SHARDS
+from database.shards import SHARD_MAP
+from src.config import LOGER
+from src.settings import (
+    USER_BULK_BATCH_SIZE,
+    USER_BULK_LIMIT,
+    SHARD_MOVE_GRACE_SECONDS,
+)
+
+
+async def check_reserved(fix: bool) -> int:
+    """Сверка счетчиков резервов пользователей с PENDING транзакциями"""
+    code = 0
+    for shard in SHARDS:
+        async with shard.session_factory() as session:
+            mismatches = await db.UoW(session).check_reserved_balance(fix=fix)
+        if mismatches is None:
+            code = 1
+            continue
+        LOGER.info(
+            f"Reserved balance mismatches on shard {shard.name}:"
+            f" {len(mismatches)}, fixed: {fix}"
+        )
+        if mismatches and not fix:
+            code = 1
+    return code
+
+
+async def load_users(path: str, file_format: schemas.FileFormat) -> int:
+    """Массовое создание пользователей из файла; id печатаются построчно"""
+
+    async def lines():
+        with open(path, "rb") as file:
+            for line in file:
+                yield line
+
+    batches = read_batches(
+        schemas.CreateUser,
+        lines(),
+        file_format,
+        USER_BULK_BATCH_SIZE,
+        USER_BULK_LIMIT,
+    )
+    if SHARD_MAP.sharded:
+        await SHARD_MAP.refresh()
+    shard, new_id = SHARD_MAP.bulk_target()
+    async with shard.session_factory() as session:
+        try:
+            ids = await db.UoW(session).create_users_copy(batches, new_id)
+        except RecordError as error:
+            LOGER.error(f"Invalid record, nothing loaded. {error}")
+            return 1
+    if ids is None:
+        return 1
+    sys.stdout.writelines(f"{user_id}\n" for user_id in ids)
+    LOGER.info(f"Users created via COPY: {len(ids)}")
+    return 0
+
+
+async def show_shards() -> int:
+    """Бакеты и число пользователей на каждом шарде"""
+    await SHARD_MAP.refresh()
+    owners, moving = SHARD_MAP.owners(), SHARD_MAP.moving()
+    for shard in SHARDS:
+        async with shard.session_factory() as session:
+            users = await session.scalar(select(func.count()).select_from(db.User))
+        buckets = owners.count(shard.number)
+        sys.stdout.write(f"{shard.number}\t{shard.name}\t{buckets}\t{users}\n")
+    if moving:
+        sys.stdout.write(f"moving\t{sorted(moving)}\n")
+    return 0
+
+
+async def move_buckets(buckets: list[int], target: int, grace: float) -> int:
+    """Перенос бакетов на шард target"""
+    copied = await rebalance.move_buckets(buckets, target, grace)
+    LOGER.info(f"{len(set(buckets))} buckets moved to shard {target}: {copied}")
+    return 0
+
+
+async def rebalance_shards(grace: float) -> int:
+    """Выравнивание числа бакетов на шардах"""
+    copied = await rebalance.rebalance(grace)
+    LOGER.info(f"Shards rebalanced: {copied}")
+    return 0
+
+
+def main() -> int:
+    """Точка входа сервисных команд"""
+    parser = argparse.ArgumentParser(prog="python -m src.service")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    check = commands.add_parser(
+        "check-reserved", help="сверить reserved_debit/reserved_credit"
+    )
+    check.add_argument("--fix", action="store_true", help="исправить расхождения")
+
+    load = commands.add_parser(
+        "load-users", help="создать пользователей из NDJSON/CSV записей CreateUser"
+    )
+    load.add_argument("path", help="файл с записями, по одной на строку")
+    load.add_argument(
+        "--format",
+        type=schemas.FileFormat,
+        default=schemas.FileFormat.NDJSON,
+        choices=list(schemas.FileFormat),
+        help="формат файла",
+    )
+
+    commands.add_parser(
+        "shards", help="бакеты и пользователи шардов: номер, БД, бакеты, пользователи"
+    )
+    move = commands.add_parser("move-buckets", help="перенести бакеты на шард")
+    move.add_argument("buckets", type=int, nargs="+", help="номера бакетов")
+    move.add_argument("--to", type=int, required=True, help="номер целевого шарда")
+    balance = commands.add_parser("rebalance", help="выровнять число бакетов на шардах")
+    for command in (move, balance):
+        command.add_argument(
+            "--grace",
+            type=float,
+            default=SHARD_MOVE_GRACE_SECONDS,
+            help="ожидание воркеров до копирования и до удаления, секунд",
+        )
+
+    args = parser.parse_args()
+    if args.command == "check-reserved":
+        return asyncio.run(check_reserved(args.fix))
+    if args.command == "load-users":
+        return asyncio.run(load_users(args.path, args.format))
+    if args.command == "shards":
+        return asyncio.run(show_shards())
+    if args.command == "move-buckets":
+        return asyncio.run(move_buckets(args.buckets, args.to, args.grace))
+    if args.command == "rebalance":
+        return asyncio.run(rebalance_shards(args.grace))
+    return 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -16,5 +16,73 @@ REAL_DATABASE_URL = env.str(
 )
 APP_PORT = env.int("APP_PORT", default=8000)
 APP_HOST = env.str("APP_HOST", default="0.0.0.0")
-APP_RELOAD = env.bool("APP_RELOAD", default=True)
+APP_RELOAD = env.bool("APP_RELOAD", default=False)
+APP_WORKERS = env.int("APP_WORKERS", default=1)
+APP_LOOP = env.str("APP_LOOP", default="auto")
+APP_HTTP = env.str("APP_HTTP", default="auto")
+APP_BACKLOG = env.int("APP_BACKLOG", default=2048)
+APP_KEEPALIVE_SECONDS = env.int("APP_KEEPALIVE_SECONDS", default=5)
+APP_GRACEFUL_SHUTDOWN_SECONDS = env.int("APP_GRACEFUL_SHUTDOWN_SECONDS", default=30)
+APP_ACCESS_LOG = env.bool("APP_ACCESS_LOG", default=True)
 X_API_KEY = env.str("X_API_KEY")
+TRANSACTION_BATCH_LIMIT = env.int("TRANSACTION_BATCH_LIMIT", default=1000)
+EXPIRE_INTERVAL_SECONDS = env.float("EXPIRE_INTERVAL_SECONDS", default=60)
+EXPIRE_CHUNK_SIZE = env.int("EXPIRE_CHUNK_SIZE", default=1000)
+CACHE_BACKEND = env.str("CACHE_BACKEND", default="memory")
+CACHE_TTL = env.float("CACHE_TTL", default=2)
+CACHE_MAX_SIZE = env.int("CACHE_MAX_SIZE", default=10000)
+REDIS_URL = env.str("REDIS_URL", default="redis://localhost:6379/0")
+DB_POOL_SIZE = env.int("DB_POOL_SIZE", default=5)
+DB_MAX_OVERFLOW = env.int("DB_MAX_OVERFLOW", default=10)
+DB_POOL_TIMEOUT = env.float("DB_POOL_TIMEOUT", default=30)
+DB_POOL_RECYCLE = env.int("DB_POOL_RECYCLE", default=-1)
+DB_POOL_PRE_PING = env.bool("DB_POOL_PRE_PING", default=False)
+DB_STATEMENT_CACHE_SIZE = env.int("DB_STATEMENT_CACHE_SIZE", default=100)
+CONCURRENCY_MODE = env.str("CONCURRENCY_MODE", default="pessimistic")
+CAS_MAX_RETRIES = env.int("CAS_MAX_RETRIES", default=3)
+ADMISSION_ENABLED = env.bool("ADMISSION_ENABLED", default=False)
+ADMISSION_QUEUE_DEPTH = env.int("ADMISSION_QUEUE_DEPTH", default=100)
+ADMISSION_TIMEOUT = env.float("ADMISSION_TIMEOUT", default=5)
+ADMISSION_COALESCE = env.bool("ADMISSION_COALESCE", default=False)
+ADMISSION_BATCH_SIZE = env.int("ADMISSION_BATCH_SIZE", default=50)
+DB_LOCK_TIMEOUT_MS = env.int("DB_LOCK_TIMEOUT_MS", default=5000)
+DB_STATEMENT_TIMEOUT_MS = env.int("DB_STATEMENT_TIMEOUT_MS", default=30000)
+DB_LOCK_TIMEOUTS = env.dict("DB_LOCK_TIMEOUTS", subcast=int, default={})
+DB_STATEMENT_TIMEOUTS = env.dict("DB_STATEMENT_TIMEOUTS", subcast=int, default={})
+REPLICA_DATABASE_URLS = env.list("REPLICA_DATABASE_URLS", default=[])
+REPLICA_MAX_LAG_SECONDS = env.float("REPLICA_MAX_LAG_SECONDS", default=5)
+REPLICA_LAG_CHECK_SECONDS = env.float("REPLICA_LAG_CHECK_SECONDS", default=1)
+RETRY_MAX_ATTEMPTS = env.int("RETRY_MAX_ATTEMPTS", default=3)
+RETRY_BUDGET_SECONDS = env.float("RETRY_BUDGET_SECONDS", default=2)
+RETRY_BASE_DELAY = env.float("RETRY_BASE_DELAY", default=0.02)
+RETRY_MAX_DELAY = env.float("RETRY_MAX_DELAY", default=0.5)
+IDEMPOTENCY_TTL_SECONDS = env.int("IDEMPOTENCY_TTL_SECONDS", default=86400)
+IDEMPOTENCY_CACHE_SIZE = env.int("IDEMPOTENCY_CACHE_SIZE", default=10000)
+IDEMPOTENCY_LEASE_SECONDS = env.int("IDEMPOTENCY_LEASE_SECONDS", default=60)
+IDEMPOTENCY_PURGE_INTERVAL_SECONDS = env.float(
+    "IDEMPOTENCY_PURGE_INTERVAL_SECONDS", default=3600
+)
+EVENTS_ENABLED = env.bool("EVENTS_ENABLED", default=True)
+EVENTS_BUFFER_SIZE = env.int("EVENTS_BUFFER_SIZE", default=10000)
+EVENTS_QUEUE_SIZE = env.int("EVENTS_QUEUE_SIZE", default=100)
+EVENTS_HEARTBEAT_SECONDS = env.float("EVENTS_HEARTBEAT_SECONDS", default=15)
+EVENTS_RECONNECT_DELAY = env.float("EVENTS_RECONNECT_DELAY", default=1)
+TRANSACTION_ID_CLOCK_SKEW_SECONDS = env.float(
+    "TRANSACTION_ID_CLOCK_SKEW_SECONDS", default=86400
+)
+TRANSACTION_PARTITIONS_AHEAD = env.int("TRANSACTION_PARTITIONS_AHEAD", default=3)
+TRANSACTION_RETENTION_MONTHS = env.int("TRANSACTION_RETENTION_MONTHS", default=0)
+PARTITION_MAINTENANCE_INTERVAL_SECONDS = env.float(
+    "PARTITION_MAINTENANCE_INTERVAL_SECONDS", default=3600
+)
+EXPORT_CHUNK_SIZE = env.int("EXPORT_CHUNK_SIZE", default=1000)
+USER_BULK_BATCH_SIZE = env.int("USER_BULK_BATCH_SIZE", default=5000)
+USER_BULK_LIMIT = env.int("USER_BULK_LIMIT", default=1000000)
+JOBS_LEADER_ELECTION = env.bool("JOBS_LEADER_ELECTION", default=True)
+JOBS_LEADER_RETRY_SECONDS = env.float("JOBS_LEADER_RETRY_SECONDS", default=5)
+SHARD_DATABASE_URLS = env.list("SHARD_DATABASE_URLS", default=[])
+SHARD_BUCKETS = env.int("SHARD_BUCKETS", default=1024)
+SHARD_MAP_REFRESH_SECONDS = env.float("SHARD_MAP_REFRESH_SECONDS", default=5)
+SHARD_MOVE_GRACE_SECONDS = env.float("SHARD_MOVE_GRACE_SECONDS", default=15)
+DB_WARMUP_CONNECTIONS = env.int("DB_WARMUP_CONNECTIONS", default=DB_POOL_SIZE)
+DB_WARMUP_RETRY_SECONDS = env.float("DB_WARMUP_RETRY_SECONDS", default=5)
@@ -0,0 +1,49 @@
+"""Общие фикстуры тестов.
+
+Тесты UoW работают с настоящей БД REAL_DATABASE_URL с примененными
+миграциями (make migrations) и пропускаются, если она недоступна.
+"""
+
+import os
+import uuid
+
+os.environ.setdefault("X_API_KEY", "test")
+os.environ.setdefault("DB_ECHO", "False")
+
+import pytest  # noqa: E402
+from sqlalchemy import delete, text  # noqa: E402
+from sqlalchemy.exc import DBAPIError  # noqa: E402
+
+from database.db import async_engine, async_session_factory  # noqa: E402
+from database.models import BalanceLedger, Transaction, User  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+async def db():
+    """Фабрика сессий основной БД; тест пропускается без БД"""
+    try:
+        async with async_engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+    except (OSError, DBAPIError) as error:
+        pytest.skip(f"Database is not available: {error}")
+    yield async_session_factory
+    await async_engine.dispose()
+
+
+@pytest.fixture
+async def user(db):
+    """Пользователь с балансом 1000 из 10000; удаляется после теста"""
+    user_id = uuid.uuid4()
+    async with db() as session:
+        await User.create(session, id=user_id, current_balance=1000, max_balance=10000)
+    yield user_id
+    # журнал защищен от удаления; тестовые строки убираются с отключенными
+    # триггерами, как копии перенесенных бакетов (database/rebalance.py)
+    async with db() as session, session.begin():
+        await session.execute(text("SET LOCAL session_replication_role = replica"))
+        for model, column in (
+            (BalanceLedger, BalanceLedger.user_id),
+            (Transaction, Transaction.user_id),
+            (User, User.id),
+        ):
+            await session.execute(delete(model).where(column == user_id))
@@ -0,0 +1,76 @@
+import asyncio
+
+import asyncpg
+import pytest
+
+from database import events, leader
+from database.db import SHARDS
+
+
+class FakeConnection:
+    """Соединение asyncpg, сервер которого перестал отвечать"""
+
+    def __init__(self, fail_listen: bool = False):
+        self.fail_listen = fail_listen
+        self.terminated = False
+
+    def add_termination_listener(self, callback):
+        pass
+
+    async def fetchval(self, query, *args, timeout=None):
+        if "pg_try_advisory_lock" in query:
+            return True
+        raise asyncio.TimeoutError
+
+    async def add_listener(self, channel, callback):
+        if self.fail_listen:
+            raise asyncpg.InterfaceError("connection is closed")
+        await asyncio.Event().wait()
+
+    async def close(self, timeout=None):
+        raise asyncio.TimeoutError
+
+    def terminate(self):
+        self.terminated = True
+
+
+async def _run_until_reconnects(monkeypatch, module, coroutine, **connection):
+    """Запускает цикл, пока он не переподключится дважды"""
+    connections = []
+    reconnected = asyncio.Event()
+
+    async def connect(dsn):
+        if len(connections) == 2:
+            reconnected.set()
+            await asyncio.Event().wait()
+        connections.append(FakeConnection(**connection))
+        return connections[-1]
+
+    monkeypatch.setattr(module.asyncpg, "connect", connect)
+    task = asyncio.create_task(coroutine)
+    try:
+        await asyncio.wait_for(reconnected.wait(), 5)
+    finally:
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+    return connections
+
+
+async def test_leader_survives_close_timeout(monkeypatch):
+    monkeypatch.setattr(leader, "JOBS_LEADER_RETRY_SECONDS", 0.01)
+    connections = await _run_until_reconnects(
+        monkeypatch, leader, leader.run_as_leader(list)
+    )
+    assert all(connection.terminated for connection in connections)
+
+
+async def test_events_listener_survives_listen_failure(monkeypatch):
+    monkeypatch.setattr(events, "EVENTS_RECONNECT_DELAY", 0.01)
+    connections = await _run_until_reconnects(
+        monkeypatch,
+        events,
+        events.EventBroker(10, 10).listen(SHARDS[0]),
+        fail_listen=True,
+    )
+    assert all(connection.terminated for connection in connections)
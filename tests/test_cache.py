@@ -0,0 +1,64 @@
+import datetime
+import uuid
+
+import httpx
+import orjson
+
+from database.cache import CACHE, LocalRedis, RedisCache
+from database.models import Transaction, TransactionStatus, User
+from main import app
+from src.settings import X_API_KEY
+
+
+async def test_redis_cache_round_trip():
+    cache = RedisCache(LocalRedis())
+    values = {
+        "id": uuid.uuid4(),
+        "user_id": uuid.uuid4(),
+        "amount": -100,
+        "status": TransactionStatus.PENDING,
+        "created_at": datetime.datetime(2026, 1, 2, 3, 4, 5, 6),
+        "updated_at": datetime.datetime(2026, 1, 2, 3, 4, 5, 6),
+        "timeout_seconds": 60,
+        "expires_at": None,
+    }
+    await cache.set("key", values, ttl=None)
+    raw = await cache._client.get("key")
+    assert orjson.loads(raw)["status"] == "pending"
+    transaction = Transaction.from_cached(await cache.get("key"))
+    assert {key: getattr(transaction, key) for key in values} == values
+
+
+async def test_redis_cache_stores_rows(db, user):
+    cache = RedisCache(LocalRedis())
+    async with db() as session:
+        row = await session.get(User, user)
+        values = {key: getattr(row, key) for key in User.__table__.columns.keys()}
+    # asyncpg возвращает собственный подкласс uuid.UUID
+    await cache.set("key", values, ttl=None)
+    assert User.from_cached(await cache.get("key")).id == user
+
+
+async def test_balance_limits_ignore_stale_cache(db, user):
+    # кэш другого воркера помнит старый баланс
+    await CACHE.set(
+        User.cache_key(user),
+        {"id": user, "current_balance": 0, "max_balance": 10000},
+        ttl=None,
+    )
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.patch(
+            f"/api/v1/users/{user}/max-balance",
+            params={"max_balance": 500},
+            headers={"x-api-key": X_API_KEY},
+        )
+        assert response.status_code == 400
+        response = await client.patch(
+            f"/api/v1/users/{user}/max-balance",
+            params={"max_balance": 5000},
+            headers={"x-api-key": X_API_KEY},
+        )
+    assert response.status_code == 200
+    assert response.json()["max_balance"] == 5000
+    assert response.json()["current_balance"] == 1000
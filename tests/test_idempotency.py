@@ -0,0 +1,67 @@
+import datetime
+import uuid
+
+import pytest
+from sqlalchemy import delete, update
+
+from database.idempotency import IDEMPOTENCY, IdempotencyStore
+from database.models import IdempotencyKey
+
+
+@pytest.fixture
+async def key(db):
+    """Ключ идемпотентности; строка удаляется после теста"""
+    key = f"test-{uuid.uuid4()}"
+    yield key
+    async with db() as session, session.begin():
+        await session.execute(delete(IdempotencyKey).where(IdempotencyKey.key == key))
+
+
+async def _abandon(db, key: str) -> None:
+    """Захват, который процесс бросил дольше аренды назад"""
+    async with db() as session, session.begin():
+        await session.execute(
+            update(IdempotencyKey)
+            .where(IdempotencyKey.key == key)
+            .values(
+                claimed_at=IdempotencyKey.claimed_at
+                - datetime.timedelta(seconds=IDEMPOTENCY._lease + 1)
+            )
+        )
+
+
+async def test_live_claim_blocks_retry(key):
+    record, claimed_at = await IDEMPOTENCY.claim(key, "create", "a")
+    assert record is None and claimed_at is not None
+    record, claimed_at = await IDEMPOTENCY.claim(key, "create", "a")
+    assert claimed_at is None
+    assert record["status_code"] is None
+
+
+async def test_abandoned_claim_is_taken_over(db, key):
+    _, crashed = await IDEMPOTENCY.claim(key, "create", "a")
+    await _abandon(db, key)
+    # другой запрос под тем же ключом не перехватывает
+    record, _ = await IDEMPOTENCY.claim(key, "create", "b")
+    assert record["fingerprint"] == "a"
+    record, retried = await IDEMPOTENCY.claim(key, "create", "a")
+    assert record is None and retried != crashed
+    # запрос, у которого ключ перехватили, не пишет ответ и не снимает захват
+    await IDEMPOTENCY.release(key, crashed)
+    await IDEMPOTENCY.complete(key, crashed, "create", "a", 500, {})
+    store = IdempotencyStore(10, IDEMPOTENCY._ttl, IDEMPOTENCY._lease)
+    record, _ = await store.claim(key, "create", "a")
+    assert record["status_code"] is None
+    await IDEMPOTENCY.complete(key, retried, "create", "a", 200, {"ok": True})
+    record, _ = await store.claim(key, "create", "a")
+    assert (record["status_code"], record["response"]) == (200, {"ok": True})
+
+
+async def test_completed_key_is_never_taken_over(db, key):
+    _, claimed_at = await IDEMPOTENCY.claim(key, "create", "a")
+    await IDEMPOTENCY.complete(key, claimed_at, "create", "a", 201, {"id": 1})
+    await _abandon(db, key)
+    store = IdempotencyStore(10, IDEMPOTENCY._ttl, IDEMPOTENCY._lease)
+    record, claimed_at = await store.claim(key, "create", "a")
+    assert claimed_at is None
+    assert record["status_code"] == 201
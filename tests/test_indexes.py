@@ -0,0 +1,137 @@
+"""Запросы UoW используют индексы transactions.
+
+План строится по данным, засеянным в транзакции теста (ANALYZE внутри
+нее тоже откатывается): большинство транзакций проведено, PENDING - каждая
+десятая, половина из них истекла. Без данных у планировщика нет
+статистики, и выбор между индексами на пустых секциях случаен.
+
+План проверяется обобщенным, как у подготовленных выражений asyncpg: так
+частичный индекс, предикат которого не совпал с запросом, выбран не будет.
+"""
+
+import uuid
+
+import pytest
+from sqlalchemy import event, select, text
+
+from database.db import async_engine
+from database.models import User
+from database.uow import EXPIRE_CHUNK_SQL, USER_SNAPSHOT, UoW
+
+SEED_USERS = 1000
+SEED_TRANSACTIONS = 50_000
+SEED_SQL = (
+    f"""
+    INSERT INTO users (id, current_balance, max_balance)
+    SELECT md5('index-check' || i)::uuid, 0, 1000000
+    FROM generate_series(1, {SEED_USERS}) i
+    """,
+    f"""
+    INSERT INTO transactions (id, user_id, amount, status, timeout_seconds)
+    SELECT
+        gen_random_uuid(),
+        md5('index-check' || (i % {SEED_USERS} + 1))::uuid,
+        CASE WHEN i % 2 = 0 THEN 10 ELSE -10 END,
+        CASE WHEN i % 10 = 0 THEN 'PENDING' ELSE 'CONFIRMED' END::transactionstatus,
+        CASE WHEN i % 20 = 0 THEN 0 ELSE 600 END
+    FROM generate_series(1, {SEED_TRANSACTIONS}) i
+    """,
+    "ANALYZE users, transactions",
+)
+
+
+async def _plan(session, statement: str, parameters=()) -> str:
+    """Обобщенный план на засеянных данных.
+
+    PREPARE + EXPLAIN EXECUTE: EXPLAIN (GENERIC_PLAN) есть лишь с PG16.
+    """
+    arguments = ", ".join(f"'{value}'" for value in parameters)
+    execute = (
+        f"EXECUTE index_check({arguments})" if arguments else "EXECUTE index_check"
+    )
+    connection = await session.connection()
+    try:
+        for seed in SEED_SQL:
+            await connection.exec_driver_sql(seed)
+        await connection.exec_driver_sql(
+            "SET LOCAL plan_cache_mode = force_generic_plan"
+        )
+        await connection.exec_driver_sql(f"PREPARE index_check AS {statement}")
+        rows = await connection.exec_driver_sql(f"EXPLAIN {execute}")
+        plan = "\n".join(row[0] for row in rows)
+        await connection.exec_driver_sql("DEALLOCATE index_check")
+    finally:
+        # засеянные строки и их статистика не остаются в БД
+        await session.rollback()
+    return plan
+
+
+async def _uow_statement(session, call) -> tuple[str, tuple]:
+    """SQL, который UoW отправляет в БД при вызове call"""
+    statements = []
+
+    def capture(connection, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", capture)
+    try:
+        await call(UoW(session))
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", capture)
+        await session.rollback()
+    return statements[-1]
+
+
+async def _index_names(session, index: str) -> set[str]:
+    """Индекс и его копии в секциях"""
+    rows = await session.execute(
+        text(
+            "SELECT inhrelid::regclass::text FROM pg_inherits"
+            " WHERE inhparent = CAST(:index AS regclass)"
+        ),
+        {"index": index},
+    )
+    await session.rollback()
+    return {index, *rows.scalars()}
+
+
+def _uses(plan: str, names: set[str]) -> bool:
+    return any(
+        f"using {name} " in f"{line} " for line in plan.splitlines() for name in names
+    )
+
+
+@pytest.mark.parametrize(
+    "index, call",
+    [
+        (
+            "ix_transactions_user_created",
+            lambda uow: uow.get_transactions_after(20, uuid.uuid4()),
+        ),
+        (
+            "ix_transactions_pending_user",
+            lambda uow: uow._get_overdue_reserved([uuid.uuid4()]),
+        ),
+        (
+            "ix_transactions_pending_user",
+            lambda uow: uow._session.execute(
+                select(*USER_SNAPSHOT).where(User.id == uuid.uuid4())
+            ),
+        ),
+    ],
+    ids=["history_page", "overdue_reserved", "cas_snapshot"],
+)
+async def test_uow_query_uses_index(db, index, call):
+    async with db() as session:
+        names = await _index_names(session, index)
+        statement, parameters = await _uow_statement(session, call)
+        plan = await _plan(session, statement, parameters)
+    assert _uses(plan, names), plan
+
+
+async def test_expiry_sweep_uses_deadline_index(db):
+    async with db() as session:
+        names = await _index_names(session, "ix_transactions_pending_expires")
+        statement = EXPIRE_CHUNK_SQL.text.replace(":chunk_size", "$1::integer")
+        plan = await _plan(session, statement, (1000,))
+    assert _uses(plan, names), plan
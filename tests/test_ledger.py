@@ -0,0 +1,29 @@
+import pytest
+from sqlalchemy import delete, text, update
+from sqlalchemy.exc import DBAPIError
+
+from database.models import BalanceLedger, User
+
+
+@pytest.mark.parametrize(
+    "statement",
+    [
+        lambda user: update(BalanceLedger)
+        .where(BalanceLedger.user_id == user)
+        .values(delta=0),
+        lambda user: delete(BalanceLedger).where(BalanceLedger.user_id == user),
+        lambda user: delete(User).where(User.id == user),
+        lambda user: text("TRUNCATE balance_ledger"),
+    ],
+    ids=["update", "delete", "delete_user", "truncate"],
+)
+async def test_ledger_is_append_only(db, user, statement):
+    async with db() as session:
+        with pytest.raises(DBAPIError):
+            async with session.begin():
+                await session.execute(statement(user))
+        rows = await session.execute(
+            text("SELECT count(*) FROM balance_ledger WHERE user_id = :user"),
+            {"user": user},
+        )
+        assert rows.scalar() == 1
@@ -0,0 +1,198 @@
+"""Выбор шарда и план переноса бакетов.
+
+Шарды, кроме первого, указывают на несуществующие хосты: движки
+SQLAlchemy подключаются лениво, а маршрутизация в БД не ходит.
+"""
+
+import collections
+import random
+import time
+import uuid
+
+import pytest
+from sqlalchemy import select, text
+
+from database.db import SHARDS, Shard, async_session_factory
+from database.models import ShardBucket
+from database.models.settings import uuid7
+from database.rebalance import plan_rebalance
+from database.shards import ShardMap, ShardUnavailable, bucket_of, bucket_sql
+from src.settings import SHARD_BUCKETS
+
+
+def _shard_map(owners: list[int], moving=()) -> ShardMap:
+    """Карта на max(owners) + 1 шардов, как после refresh()"""
+    shards = [
+        SHARDS[0],
+        *(
+            Shard.from_url(number, f"postgresql+asyncpg://shard{number}.invalid/app")
+            for number in range(1, max(owners) + 1)
+        ),
+    ]
+    shard_map = ShardMap(shards, len(owners))
+    shard_map._owners, shard_map._moving = list(owners), set(moving)
+    shard_map._refreshed_at = time.monotonic()
+    return shard_map
+
+
+def _striped(shards: int) -> list[int]:
+    return [bucket % shards for bucket in range(SHARD_BUCKETS)]
+
+
+def _moved(owners: list[int], plan: dict[int, list[int]]) -> list[int]:
+    owners = list(owners)
+    for target, buckets in plan.items():
+        for bucket in buckets:
+            owners[bucket] = target
+    return owners
+
+
+def test_shard_for_is_deterministic():
+    shard_map = _shard_map(_striped(3))
+    for _ in range(100):
+        user_id = uuid.uuid4()
+        shard = shard_map.shard_for(user_id)
+        assert shard_map.shard_for(uuid.UUID(str(user_id))) is shard
+        assert shard.number == bucket_of(user_id) % 3
+
+
+def test_shard_for_spreads_users():
+    shard_map = _shard_map(_striped(3))
+    counts = collections.Counter(
+        shard_map.shard_for(uuid.uuid4()).number for _ in range(30_000)
+    )
+    assert sorted(counts) == [0, 1, 2]
+    assert all(9_000 < count < 11_000 for count in counts.values()), counts
+
+
+def test_transactions_follow_their_user():
+    shard_map = _shard_map(_striped(3))
+    for _ in range(100):
+        user_id = uuid.uuid4()
+        transaction_id = uuid7(user_id)
+        assert bucket_of(transaction_id) == bucket_of(user_id)
+        assert shard_map.shard_for(transaction_id) is shard_map.shard_for(user_id)
+
+
+def test_sessions_route_to_owner():
+    shard_map = _shard_map(_striped(2))
+    user_id = next(user for user in iter(uuid.uuid4, None) if bucket_of(user) % 2)
+    shard = shard_map.shard_for(user_id)
+    assert shard is shard_map.shards[1]
+    assert shard.session_factory.kw["bind"] is shard.engine
+    assert shard.engine.url.host == "shard1.invalid"
+    # у шардов, кроме первого, реплик нет
+    assert shard_map.read_session_factory(shard) is shard.session_factory
+    assert (
+        shard_map.read_session_factory(shard_map.shards[0], read_your_writes=True)
+        is async_session_factory
+    )
+
+
+def test_single_shard_needs_no_map():
+    shard_map = ShardMap(SHARDS[:1], SHARD_BUCKETS)
+    assert shard_map.shard_for(uuid.uuid4()) is SHARDS[0]
+
+
+def test_stale_map_rejects_writes():
+    shard_map = _shard_map(_striped(2))
+    shard_map._refreshed_at = float("-inf")
+    user_id = uuid.uuid4()
+    with pytest.raises(ShardUnavailable):
+        shard_map.shard_for(user_id)
+    assert shard_map.shard_for(user_id, write=False).number == bucket_of(user_id) % 2
+
+
+def test_moving_bucket_rejects_writes():
+    user_id = uuid.uuid4()
+    shard_map = _shard_map(_striped(2), moving={bucket_of(user_id)})
+    with pytest.raises(ShardUnavailable):
+        shard_map.shard_for(user_id)
+    assert shard_map.shard_for(user_id, write=False).number == bucket_of(user_id) % 2
+    assert all(
+        bucket_of(shard_map.new_user_id()) != bucket_of(user_id) for _ in range(1000)
+    )
+
+
+def test_bulk_target_ids_stay_on_shard():
+    owners = _striped(3)
+    moving = {bucket for bucket in range(SHARD_BUCKETS) if bucket % 7 == 0}
+    shard_map = _shard_map(owners, moving)
+    targets = set()
+    for _ in range(3):
+        shard, new_id = shard_map.bulk_target()
+        targets.add(shard.number)
+        for _ in range(1000):
+            bucket = bucket_of(new_id())
+            assert owners[bucket] == shard.number
+            assert bucket not in moving
+    assert targets == {0, 1, 2}
+
+
+async def test_bucket_sql_matches_bucket_of(db):
+    ids = [uuid.uuid4() for _ in range(100)] + [uuid.UUID(int=0xFFFF_FFFF)]
+    async with db() as session:
+        rows = await session.execute(
+            text(f"SELECT {bucket_sql('id')} FROM unnest(CAST(:ids AS uuid[])) id"),
+            {"ids": ids},
+        )
+    assert list(rows.scalars()) == [bucket_of(obj_id) for obj_id in ids]
+
+
+async def test_refresh_reads_bucket_owners(db):
+    async with db() as session:
+        rows = (await session.execute(select(ShardBucket))).scalars().all()
+    shards = max((row.shard for row in rows), default=0) + 1
+    shard_map = _shard_map(_striped(shards))
+    shard_map._refreshed_at = float("-inf")
+    await shard_map.refresh()
+    owners = [0] * SHARD_BUCKETS
+    for row in rows:
+        owners[row.bucket] = row.shard
+    assert shard_map.owners() == owners
+    assert shard_map.moving() == {row.bucket for row in rows if row.moving}
+    # после refresh() запись снова разрешена
+    shard_map.shard_for(shard_map.new_user_id())
+
+
+@pytest.mark.parametrize(
+    "owners, shards",
+    [
+        ([0] * 16, 3),
+        ([0] * 10 + [1] * 6, 2),
+        ([0, 1] * 8, 2),
+        ([1] * 7 + [2] * 2, 4),
+    ],
+)
+def test_plan_rebalance_evens_out_buckets(owners, shards):
+    plan = plan_rebalance(owners, shards)
+    counts = collections.Counter(_moved(owners, plan))
+    assert max(counts.values()) - min(counts.values()) <= 1
+    assert len(counts) == min(shards, len(owners))
+    # бакеты забираются только с перегруженных шардов и только лишние
+    before = collections.Counter(owners)
+    moved = [bucket for buckets in plan.values() for bucket in buckets]
+    assert len(moved) == len(set(moved))
+    assert len(moved) == sum(
+        max(0, before[number] - counts[number]) for number in range(shards)
+    )
+    assert not set(plan) & {owners[bucket] for bucket in moved}
+
+
+def test_plan_rebalance_takes_buckets_from_the_end():
+    assert plan_rebalance([0] * 6, 2) == {1: [3, 4, 5]}
+    assert plan_rebalance([0, 1] * 4, 2) == {}
+
+
+def test_plan_rebalance_random_maps():
+    generator = random.Random(0)
+    for _ in range(200):
+        shards = generator.randint(2, 6)
+        owners = [generator.randrange(shards) for _ in range(generator.randint(1, 64))]
+        plan = plan_rebalance(owners, shards)
+        counts = collections.Counter(_moved(owners, plan))
+        sizes = [counts[number] for number in range(shards)]
+        assert max(sizes) - min(sizes) <= 1, (owners, plan)
+        moved = sum(len(buckets) for buckets in plan.values())
+        before = collections.Counter(owners)
+        assert moved == sum(max(0, before[n] - counts[n]) for n in range(shards))
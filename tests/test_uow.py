@@ -0,0 +1,74 @@
+import pytest
+from sqlalchemy import func, select
+
+from database.models import OperationOutcome, Transaction, TransactionStatus, User
+from database.uow import UoW
+
+
+async def _reserved(db, user_id):
+    async with db() as session:
+        user = await session.get(User, user_id)
+        return user.reserved_debit, user.reserved_credit
+
+
+async def _transactions(db, user_id):
+    async with db() as session:
+        return await session.scalar(
+            select(func.count()).where(Transaction.user_id == user_id)
+        )
+
+
+@pytest.mark.parametrize(
+    "status",
+    [
+        TransactionStatus.CONFIRMED,
+        TransactionStatus.CANCELED,
+        TransactionStatus.EXPIRED,
+    ],
+)
+@pytest.mark.parametrize("amount", [-100, 100])
+async def test_create_rejects_settled_status(db, user, status, amount):
+    async with db() as session:
+        result = await UoW(session).create_transaction(
+            user_id=user, amount=amount, status=status, timeout_seconds=60
+        )
+    assert result is None
+    assert await _reserved(db, user) == (0, 0)
+    assert await _transactions(db, user) == 0
+
+
+async def test_batch_rejects_settled_status(db, user):
+    items = [
+        {
+            "user_id": user,
+            "amount": -100,
+            "status": TransactionStatus.CONFIRMED,
+            "timeout_seconds": 60,
+        },
+        {
+            "user_id": user,
+            "amount": 100,
+            "status": TransactionStatus.PENDING,
+            "timeout_seconds": 60,
+        },
+    ]
+    async with db() as session:
+        result = await UoW(session).create_transactions_batch(items)
+    assert [outcome for outcome, _ in result] == [
+        OperationOutcome.INVALID_STATUS,
+        OperationOutcome.CREATED,
+    ]
+    assert await _reserved(db, user) == (0, 100)
+    assert await _transactions(db, user) == 1
+
+
+async def test_create_pending_reserves(db, user):
+    async with db() as session:
+        result = await UoW(session).create_transaction(
+            user_id=user,
+            amount=-100,
+            status=TransactionStatus.PENDING,
+            timeout_seconds=60,
+        )
+    assert result.status == TransactionStatus.PENDING
+    assert await _reserved(db, user) == (100, 0)